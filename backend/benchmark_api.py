@@ -1,72 +1,336 @@
 """
-API Performance Benchmarking Script
-Measures response times for resume metrics
+API Load Benchmark
+Drives the real HTTP stack (uvicorn, in this process) with an asyncio load
+generator and the offline fake LLM (LLM_PROVIDER=fake), so results measure
+our own overhead under concurrency rather than OpenAI.
+
+Scenarios:
+    fetch   GET /stories/{id}/complete on pre-generated stories
+    create  POST /stories/create (enqueue only)
+    poll    GET /jobs/{job_id} on existing jobs
+    flow    create → wait for the job (polling or /wait long-poll) → fetch complete
+
+Load is closed-loop (--concurrency clients back to back) or, with --rate,
+open-loop Poisson arrivals capped at --concurrency requests in flight.
+
+Admission control (core/admission.py) is off unless --admission is given:
+its per-session limit is a few stories a minute, and every benchmark client
+shares one session. With --admission, requests it sheds (HTTP 429) are
+counted as "<operation>_shed". Fixtures are always created without it.
+
+Usage:
+    uv run python benchmark_api.py --scenario flow --concurrency 50 --duration 30
+    uv run python benchmark_api.py --scenario fetch --rate 500 --output results/fetch.json
+    uv run python benchmark_api.py --scenario fetch --compare results/fetch.json
+    uv run python benchmark_api.py --scenario create --rate 50 --admission
 """
+import os
+import sys
+import json
 import time
-import requests
-import statistics
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from collections import defaultdict
+
+SCENARIOS = ["fetch", "create", "poll", "flow"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent load benchmark of the story API")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="flow")
+    parser.add_argument("--concurrency", type=int, default=20, help="Clients (closed loop) or max in-flight requests (--rate)")
+    parser.add_argument("--rate", type=float, help="Open loop: mean arrivals per second")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load, after warmup")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of load excluded from results")
+    parser.add_argument("--stories", type=int, default=20, help="Stories generated up front for fetch/poll")
+    parser.add_argument("--wait-mode", choices=["poll", "wait"], default="poll", help="flow: GET /jobs polling or /wait long-poll")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Fake LLM seconds before the first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0, help="Fake LLM output speed, 0 = instant")
+    parser.add_argument("--admission", action="store_true", help="Enable admission control (load shedding with HTTP 429)")
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file in a temporary directory")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Print the change against a previous --output file")
+    return parser.parse_args()
+
+
+def configure_environment(args, directory: str):
+    # Settings are read at import time, so this runs before the app is imported
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{directory}/benchmark.db"
+    os.environ.setdefault("ALLOWED_ORIGINS", "")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["LLM_FAKE_LATENCY_SECONDS"] = str(args.llm_latency)
+    os.environ["LLM_FAKE_TOKENS_PER_SECOND"] = str(args.llm_tokens_per_second)
+    os.environ["JOB_EXECUTION_MODE"] = "inline"
+    os.environ["ADMISSION_ENABLED"] = "true" if args.admission else "false"
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latencies (ms) and errors per operation, and event counters, only while recording is on"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.recording = False
+        self.started_at = None
+        self.stopped_at = None
+
+    def start(self):
+        self.recording = True
+        self.started_at = time.perf_counter()
+
+    def stop(self):
+        self.recording = False
+        self.stopped_at = time.perf_counter()
+
+    def add(self, operation: str, started: float, ok: bool = True):
+        if not self.recording:
+            return
+        if ok:
+            self.latencies[operation].append((time.perf_counter() - started) * 1000)
+        else:
+            self.errors[operation] += 1
+
+    # Events that are not requests, reported apart from the operations
+    def count(self, counter: str):
+        if self.recording:
+            self.counters[counter] += 1
+
+    def summary(self) -> dict:
+        elapsed = (self.stopped_at or time.perf_counter()) - self.started_at
+        operations = {}
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[operation])
+            operations[operation] = {
+                "requests": len(values),
+                "errors": self.errors[operation],
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 0.50), 2),
+                "p95_ms": round(percentile(values, 0.95), 2),
+                "p99_ms": round(percentile(values, 0.99), 2),
+                "max_ms": round(values[-1], 2) if values else 0.0,
+            }
+        return {"elapsed_seconds": round(elapsed, 2), "operations": operations, "counters": dict(sorted(self.counters.items()))}
+
+
+async def timed(recorder: Recorder, operation: str, request):
+    started = time.perf_counter()
+    try:
+        response = await request
+    except Exception:
+        recorder.add(operation, started, ok=False)
+        raise
+    if response.status_code == 429:  # Shed by admission control, not an error of the server
+        recorder.count(f"{operation}_shed")
+        raise RuntimeError(f"{operation}: shed (HTTP 429)")
+    ok = response.status_code < 400
+    recorder.add(operation, started, ok=ok)
+    if not ok:
+        raise RuntimeError(f"{operation}: HTTP {response.status_code}")
+    return response
+
+
+async def create_story(client, recorder: Recorder, theme: str) -> str:
+    response = await timed(recorder, "create", client.post("/api/stories/create", json={"theme": theme, "allow_similar": False}))
+    return response.json()["job_id"]
+
+
+async def wait_for_job(client, recorder: Recorder, args, job_id: str) -> dict:
+    job = {"status": "pending", "nodes_generated": 0}
+    while job["status"] not in ("completed", "failed"):
+        if args.wait_mode == "wait":
+            params = {"status": job["status"], "nodes_generated": job["nodes_generated"]}
+            job = (await timed(recorder, "wait", client.get(f"/api/jobs/{job_id}/wait", params=params))).json()
+        else:
+            job = (await timed(recorder, "poll", client.get(f"/api/jobs/{job_id}"))).json()
+            if job["status"] not in ("completed", "failed"):
+                await asyncio.sleep(args.poll_interval)
+    return job
+
+
+# One unit of work per scenario
+def make_operation(args, client, recorder: Recorder, fixtures: dict):
+    async def fetch():
+        story_id = random.choice(fixtures["story_ids"])
+        await timed(recorder, "fetch", client.get(f"/api/stories/{story_id}/complete"))
+
+    async def create():
+        await create_story(client, recorder, f"benchmark theme {random.getrandbits(48)}")
 
-BASE_URL = "http://localhost:8000/api"
+    async def poll():
+        job_id = random.choice(fixtures["job_ids"])
+        await timed(recorder, "poll", client.get(f"/api/jobs/{job_id}"))
 
-def benchmark_endpoint(url, method="GET", json_data=None, iterations=5):
-    """Benchmark an endpoint multiple times and return stats"""
-    times = []
-    
-    for i in range(iterations):
-        start = time.time()
+    async def flow():
+        started = time.perf_counter()
+        job_id = await create_story(client, recorder, f"benchmark theme {random.getrandbits(48)}")
+        job = await wait_for_job(client, recorder, args, job_id)
+        if job["status"] != "completed":
+            recorder.add("flow", started, ok=False)
+            return
+        await timed(recorder, "fetch", client.get(f"/api/stories/{job['story_id']}/complete"))
+        recorder.add("flow", started)
+
+    return {"fetch": fetch, "create": create, "poll": poll, "flow": flow}[args.scenario]
+
+
+async def run_load(args, operation, recorder: Recorder):
+    deadline = time.perf_counter() + args.warmup + args.duration
+    loop = asyncio.get_running_loop()
+    loop.call_later(args.warmup, recorder.start)
+
+    async def guarded():
         try:
-            if method == "GET":
-                response = requests.get(url, timeout=10)
-            else:
-                response = requests.post(url, json=json_data, timeout=10)
-            
-            elapsed = (time.time() - start) * 1000  # Convert to milliseconds
-            
-            if response.status_code in [200, 201]:
-                times.append(elapsed)
-            else:
-                print(f"   ⚠️  Request {i+1} failed with status {response.status_code}")
-        except Exception as e:
-            print(f"   ❌ Request {i+1} error: {e}")
-    
-    if not times:
-        return None
-    
-    return {
-        "avg": statistics.mean(times),
-        "min": min(times),
-        "max": max(times),
-        "median": statistics.median(times)
-    }
-
-print("=" * 60)
-print("⚡ API Performance Benchmarking")
-print("=" * 60)
-print("\nℹ️  Make sure the backend is running on http://localhost:8000")
-print("   Start it with: cd backend && uv run python main.py\n")
-
-# Test if server is running
-try:
-    response = requests.get(f"{BASE_URL}/../docs", timeout=2)
-    if response.status_code != 200:
-        print("❌ Backend server not responding. Please start it first.")
-        exit(1)
-except:
-    print("❌ Backend server not running. Please start it with:")
-    print("   cd backend && uv run python main.py")
-    exit(1)
-
-print("✅ Server is running. Starting benchmark...\n")
-
-# Benchmark story retrieval
-print("📊 Benchmarking GET /api/stories/{id}/complete")
-stats = benchmark_endpoint(f"{BASE_URL}/stories/1/complete", iterations=10)
-if stats:
-    print(f"   Average: {stats['avg']:.2f}ms")
-    print(f"   Median:  {stats['median']:.2f}ms")
-    print(f"   Min:     {stats['min']:.2f}ms")
-    print(f"   Max:     {stats['max']:.2f}ms")
-
-print("\n" + "=" * 60)
-print("✅ Benchmark complete!")
-print("=" * 60)
+            await operation()
+        except Exception:
+            pass  # Already counted as an error by timed()
+
+    if args.rate:
+        # Open loop: arrivals don't wait for earlier requests to finish
+        in_flight = asyncio.Semaphore(args.concurrency)
+        tasks = set()
+
+        async def arrival():
+            async with in_flight:
+                await guarded()
+
+        while time.perf_counter() < deadline:
+            if in_flight.locked():  # Server is behind: this arrival waits for a slot
+                recorder.count("arrivals_queued")  # It still runs once a slot frees up
+            task = asyncio.create_task(arrival())
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            await asyncio.sleep(random.expovariate(args.rate))
+        recorder.stop()
+        await asyncio.gather(*tasks)
+    else:
+        async def client_loop():
+            while time.perf_counter() < deadline:
+                await guarded()
+
+        await asyncio.gather(*(client_loop() for _ in range(args.concurrency)))
+        recorder.stop()
+
+
+async def prepare_fixtures(args, client) -> dict:
+    if args.scenario not in ("fetch", "poll"):
+        return {}
+    scratch = Recorder()
+    job_ids = await asyncio.gather(*(create_story(client, scratch, f"fixture theme {index}") for index in range(args.stories)))
+    jobs = await asyncio.gather(*(wait_for_job(client, scratch, args, job_id) for job_id in job_ids))
+    story_ids = [job["story_id"] for job in jobs if job["status"] == "completed"]
+    if not story_ids:
+        raise SystemExit("❌ Could not generate fixture stories")
+    return {"job_ids": list(job_ids), "story_ids": story_ids}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def print_summary(summary: dict, previous: dict = None):
+    print(f"\n   {'operation':<18} | {'requests':>8} | {'errors':>6} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for operation, stats in summary["operations"].items():
+        print(f"   {operation:<18} | {stats['requests']:>8} | {stats['errors']:>6} | {stats['throughput_rps']:>8.1f} | "
+              f"{stats['p50_ms']:>8.2f} | {stats['p95_ms']:>8.2f} | {stats['p99_ms']:>8.2f}")
+    if summary["counters"]:
+        print(f"\n   {'counter':<18} | {'count':>8}")
+    for counter, value in summary["counters"].items():
+        print(f"   {counter:<18} | {value:>8}")
+
+    if previous:
+        print(f"\n📊 Change vs {previous.get('commit', '?')} ({previous.get('timestamp', '?')})")
+        for operation, stats in summary["operations"].items():
+            before = previous["results"]["operations"].get(operation)
+            if not before:
+                continue
+            changes = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if before[key]:
+                    changes.append(f"{key} {100 * (stats[key] - before[key]) / before[key]:+.1f}%")
+            print(f"   {operation:<18} | " + " | ".join(changes))
+        previous_counters = previous["results"].get("counters", {})  # Absent from older result files
+        for counter, value in summary["counters"].items():
+            if counter in previous_counters:
+                print(f"   {counter:<18} | {previous_counters[counter]} → {value} ({value - previous_counters[counter]:+d})")
+
+
+async def main(args):
+    import httpx
+    import uvicorn
+
+    import main as api
+    from core.admission import admission_controller
+
+    config = uvicorn.Config(api.app, host="127.0.0.1", port=0, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    limits = httpx.Limits(max_connections=args.concurrency + 10, max_keepalive_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        print("⏳ Preparing fixtures...")
+        # Fixtures are setup, not load: --admission only applies to the measured run
+        admission_controller.enabled = False
+        fixtures = await prepare_fixtures(args, client)
+        admission_controller.enabled = args.admission
+
+        load = f"{args.rate}/s arrivals, max {args.concurrency} in flight" if args.rate else f"{args.concurrency} concurrent clients"
+        print(f"🚀 {args.scenario}: {load}, {args.warmup}s warmup + {args.duration}s")
+        recorder = Recorder()
+        await run_load(args, make_operation(args, client, recorder, fixtures), recorder)
+
+    server.should_exit = True
+    await server_task
+    return recorder.summary()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        configure_environment(args, directory)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+        print("=" * 60)
+        print("⚡ API Load Benchmark (fake LLM, in-process server)")
+        print("=" * 60)
+        summary = asyncio.run(main(args))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as compare_file:
+            previous = json.load(compare_file)
+    print_summary(summary, previous)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output_file:
+            json.dump({
+                "commit": git_commit(),
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+                "results": summary,
+            }, output_file, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    print("\n" + "=" * 60)
+    print("✅ Benchmark complete!")
+    print("=" * 60)
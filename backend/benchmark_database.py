@@ -0,0 +1,198 @@
+"""
+Mixed Read/Write Database Benchmark
+Writer processes persist stories (the background generation path, e.g.
+worker.py) while reader processes fetch node subtrees and complete-story
+payloads (the API path), all through the async engine of db/database.py and
+the same SQLite file.
+
+Runs the same workload twice, each on a fresh database:
+    baseline  SQLITE_PRAGMAS_ENABLED=false
+              (rollback journal: readers wait for writers, writers fail with
+              "database is locked" once the driver's timeout expires)
+    tuned     the current settings (WAL, synchronous=NORMAL, busy_timeout)
+
+Usage:
+    uv run python benchmark_database.py
+    uv run python benchmark_database.py --writer-processes 4 --reader-processes 4 --concurrency 8 --duration 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+CONFIGURATIONS = {
+    "baseline": {"SQLITE_PRAGMAS_ENABLED": "false"},
+    "tuned": {},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mixed read/write throughput of the database layer")
+    parser.add_argument("--writer-processes", type=int, default=2, help="Processes persisting stories (like worker.py)")
+    parser.add_argument("--reader-processes", type=int, default=2, help="Processes reading stories (like API replicas)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent tasks per process")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per configuration")
+    parser.add_argument("--nodes", type=int, default=40, help="Nodes per written story")
+    parser.add_argument("--seed-stories", type=int, default=50, help="Stories written before the timed run")
+    parser.add_argument("--role", choices=["seed", "writer", "reader"], help=argparse.SUPPRESS)  # Child process mode
+    return parser.parse_args()
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+# Child process: one role, prints {"latencies": {operation: [ms]}, "errors": {operation: n}}
+async def run_role(args) -> dict:
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+
+    from benchmark_persistence import build_tree
+    from core.story_generator import StoryGenerator
+    from db.database import AsyncSessionLocal, create_tables
+    from db.story_repository import select_subtree
+    from models.story import StoryNode, StoryPayload
+    import models.job, models.progress  # Register all tables on Base.metadata
+
+    structure = build_tree(args.nodes)
+    if args.role == "seed":
+        create_tables()
+        async with AsyncSessionLocal() as db:
+            for _ in range(args.seed_stories):
+                await StoryGenerator._persist_story(db, "benchmark", structure)
+        return {}
+
+    async with AsyncSessionLocal() as db:
+        roots = list((await db.execute(select(StoryNode.story_id, StoryNode.id).where(StoryNode.is_root))).all())
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = time.perf_counter() + args.duration
+
+    async def timed(operation: str, work):
+        started = time.perf_counter()
+        try:
+            await work()
+        except OperationalError:  # "database is locked"
+            errors[operation] += 1
+            return
+        latencies[operation].append((time.perf_counter() - started) * 1000)
+
+    async def write_story():
+        async with AsyncSessionLocal() as db:
+            await StoryGenerator._persist_story(db, "benchmark", structure)
+
+    async def read_subtree():
+        _, root_id = random.choice(roots)
+        async with AsyncSessionLocal() as db:
+            (await db.scalars(select_subtree(root_id, 2))).unique().all()
+
+    async def read_payload():
+        story_id, _ = random.choice(roots)
+        async with AsyncSessionLocal() as db:
+            await db.get(StoryPayload, story_id)
+
+    async def task():
+        while time.perf_counter() < deadline:
+            if args.role == "writer":
+                await timed("write_story", write_story)
+            else:
+                await timed("read_subtree", read_subtree)
+                await timed("read_payload", read_payload)
+
+    await asyncio.gather(*(task() for _ in range(args.concurrency)))
+    return {"latencies": latencies, "errors": errors}
+
+
+def run_configuration(args, name: str) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{directory}/benchmark.db",
+            "ALLOWED_ORIGINS": "",
+            "OPENAI_API_KEY": "benchmark",
+            **CONFIGURATIONS[name],
+        }
+
+        def spawn(role: str):
+            command = [sys.executable, os.path.abspath(__file__), "--role", role,
+                       "--concurrency", str(args.concurrency), "--duration", str(args.duration),
+                       "--nodes", str(args.nodes), "--seed-stories", str(args.seed_stories)]
+            return subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True)
+
+        if spawn("seed").wait() != 0:
+            raise SystemExit("❌ Seeding the database failed")
+
+        # Writers and readers run at the same time, each in its own process
+        processes = [spawn("writer") for _ in range(args.writer_processes)] + [spawn("reader") for _ in range(args.reader_processes)]
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        for process in processes:
+            output, _ = process.communicate()
+            if process.returncode != 0:
+                raise SystemExit("❌ A benchmark process failed")
+            result = json.loads(output.strip().splitlines()[-1])
+            for operation, values in result["latencies"].items():
+                latencies[operation].extend(values)
+            for operation, count in result["errors"].items():
+                errors[operation] += count
+
+    operations = {}
+    for operation in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies[operation])
+        operations[operation] = {
+            "ops": len(values),
+            "errors": errors[operation],
+            "ops_per_second": round(len(values) / args.duration, 1),
+            "p50_ms": round(percentile(values, 0.50), 2),
+            "p95_ms": round(percentile(values, 0.95), 2),
+            "p99_ms": round(percentile(values, 0.99), 2),
+        }
+    return operations
+
+
+def print_results(name: str, operations: dict):
+    print(f"\n🗄️  {name}")
+    print(f"   {'operation':<14} | {'ops/s':>8} | {'errors':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    for operation, stats in operations.items():
+        print(f"   {operation:<14} | {stats['ops_per_second']:>8.1f} | {stats['errors']:>6} | "
+              f"{stats['p50_ms']:>8.2f} | {stats['p95_ms']:>8.2f} | {stats['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.role:
+        print(json.dumps(asyncio.run(run_role(args))))
+        sys.exit(0)
+
+    print("=" * 60)
+    print(f"⚡ Mixed Read/Write Benchmark ({args.writer_processes} writer + {args.reader_processes} reader processes, "
+          f"{args.concurrency} tasks each, {args.duration}s)")
+    print("=" * 60)
+
+    results = {}
+    for name in CONFIGURATIONS:
+        print(f"⏳ Running {name}...")
+        results[name] = run_configuration(args, name)
+        print_results(name, results[name])
+
+    print("\n📊 Tuned vs baseline (throughput)")
+    for operation, stats in results["tuned"].items():
+        before = results["baseline"].get(operation)
+        if before and before["ops_per_second"]:
+            change = 100 * (stats["ops_per_second"] - before["ops_per_second"]) / before["ops_per_second"]
+            print(f"   {operation:<14} | {change:+.1f}% (errors {before['errors']} → {stats['errors']})")
+
+    print("\n" + "=" * 60)
+    print("✅ Benchmark complete!")
+    print("=" * 60)
@@ -0,0 +1,87 @@
+"""
+Prompt Token Benchmark
+Counts the input tokens of every prompt StoryGenerator sends, with the JSON
+Schema format instructions of PydanticOutputParser (as before) and with the
+compact schema of core/prompt_builder.py, and shows the story shape and
+completion tokens each token budget allows. Runs offline: no LLM requests.
+
+Token counts come from tiktoken when its encoding file is available (cached
+in TIKTOKEN_CACHE_DIR), otherwise from the ~4 characters per token estimate.
+
+Usage:
+    uv run python benchmark_prompts.py
+"""
+import os
+import asyncio
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./database.db")
+os.environ.setdefault("ALLOWED_ORIGINS", "")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from core.config import settings
+from core import prompt_builder
+from core.prompt_builder import STORY_SHAPES, TOKENS_PER_NODE, DEFAULT_STORY_SHAPE, compile_prompt, prompt_tokens, shape_for_budget
+from core.prompts import STORY_PROMPT, OUTLINE_PROMPT, EXPAND_PROMPT, BRANCH_PROMPT, REPAIR_PROMPT
+from core.models import StoryLLMResponse, StoryOutlineLLM, StoryStepLLM, StoryNodeLLM
+from core.story_generator import STORY_TEMPLATE, OUTLINE_TEMPLATE, STEP_TEMPLATE, BRANCH_TEMPLATE, REPAIR_TEMPLATE
+
+STORY_SO_FAR = "Scene 1: You wake aboard a drifting starship.\nThe player chose: Search the bridge"
+
+# (name, compiled template, system prompt, schema, example request values)
+PROMPTS = [
+    ("story", STORY_TEMPLATE, STORY_PROMPT, StoryLLMResponse,
+     {"theme": "space pirates", **DEFAULT_STORY_SHAPE.prompt_values()}),
+    ("outline", OUTLINE_TEMPLATE, OUTLINE_PROMPT, StoryOutlineLLM, {"theme": "space pirates"}),
+    ("step", STEP_TEMPLATE, EXPAND_PROMPT, StoryStepLLM,
+     {"title": "The Silent Signal", "story_so_far": STORY_SO_FAR, "ending_guidance": "The story has only just begun."}),
+    ("branch", BRANCH_TEMPLATE, BRANCH_PROMPT, StoryNodeLLM,
+     {"title": "The Silent Signal", "opening": "You wake aboard a drifting starship.", "choice": "Search the bridge"}),
+    ("repair", REPAIR_TEMPLATE, REPAIR_PROMPT, StoryNodeLLM,
+     {"title": "The Silent Signal", "story_so_far": STORY_SO_FAR, "depth_guidance": "At most 3 levels deep."}),
+]
+
+
+# The prompt as it was built before: indented system prompt, JSON Schema
+# format instructions
+def verbose_template(template, system: str, schema):
+    human = template.template.messages[1].prompt.template
+    compact_setting = settings.PROMPT_COMPACT_SCHEMA
+    settings.PROMPT_COMPACT_SCHEMA = False
+    try:
+        compiled = compile_prompt(system, human, schema)
+    finally:
+        settings.PROMPT_COMPACT_SCHEMA = compact_setting
+    system_message = compiled.template.messages[0]
+    system_message.prompt.template = system  # Undo the dedent
+    return compiled
+
+
+async def main():
+    print("=" * 60)
+    tokenizer = "tiktoken" if prompt_builder._get_encoding() is not None else "~4 chars/token estimate"
+    print(f"⚡ Prompt Token Benchmark ({tokenizer})")
+    print("=" * 60)
+
+    print(f"\n📝 Input tokens per request")
+    print(f"   {'prompt':<8} | {'before':>7} | {'compact':>7} | {'saved':>6}")
+    for name, template, system, schema, values in PROMPTS:
+        before = prompt_tokens(await verbose_template(template, system, schema).render(**values))
+        after = prompt_tokens(await template.render(**values))
+        print(f"   {name:<8} | {before:>7} | {after:>7} | {100 * (before - after) / before:>5.1f}%")
+
+    print(f"\n🌳 Story shape per token budget (~{TOKENS_PER_NODE} completion tokens per scene)")
+    print(f"   {'budget':>7} | {'levels':>6} | {'options':>7} | {'max scenes':>10} | {'max tokens':>10}")
+    for budget in [None, 4000, 1500, 1200, 700, 400, 300]:
+        shape = shape_for_budget(budget)
+        values = shape.prompt_values()
+        print(f"   {str(budget or '-'):>7} | {values['levels']:>6} | {values['options_per_node']:>7} | "
+              f"{shape.max_nodes:>10} | {shape.max_nodes * TOKENS_PER_NODE:>10}")
+    print(f"   ({len(STORY_SHAPES)} shapes, largest that fits the budget wins)")
+
+    print("\n" + "=" * 60)
+    print("✅ Benchmark complete!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
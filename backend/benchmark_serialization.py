@@ -0,0 +1,84 @@
+"""
+Complete-Story Serialization Benchmark
+Compares building GET /stories/{id}/complete bodies the old way (a Pydantic
+model per node, re-validated through response_model) with the trusted-row
+orjson path and the compact format, for 10 to 5,000-node stories.
+
+Usage:
+    uv run python benchmark_serialization.py
+"""
+import os
+import json
+import time
+import statistics
+from datetime import datetime
+from types import SimpleNamespace
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./database.db")
+os.environ.setdefault("ALLOWED_ORIGINS", "")
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from fastapi.encoders import jsonable_encoder
+
+from core.story_payload import serialize_complete_story, serialize_compact_story
+from schemas.story import CompleteStoryResponse, CompleteStoryNodeResponse
+
+STORY_SIZES = [10, 100, 1000, 5000]
+ITERATIONS = 5
+
+def build_nodes(node_count: int, branching: int = 3):
+    nodes = []
+    for node_id in range(1, node_count + 1):
+        first_child = (node_id - 1) * branching + 2
+        children = [child for child in range(first_child, first_child + branching) if child <= node_count]
+        nodes.append(SimpleNamespace(
+            id=node_id,
+            content=f"Node {node_id}: you stand at a crossroads in the haunted forest. " * 3,
+            is_root=node_id == 1,
+            is_ending=not children,
+            is_winning_ending=not children and node_id % 2 == 0,
+            options=[{"text": f"Take path {child}", "node_id": child} for child in children],
+            is_expanded=True,
+        ))
+    return nodes
+
+def serialize_pydantic(story, nodes) -> bytes:
+    """Previous implementation: build_complete_story_tree + response_model validation"""
+    node_dict = {}
+    for node in nodes:
+        node_dict[node.id] = CompleteStoryNodeResponse(
+            id=node.id, content=node.content, is_ending=node.is_ending,
+            is_winning_ending=node.is_winning_ending, is_root=node.is_root, options=node.options,
+        )
+    root_node = next(n for n in node_dict.values() if n.is_root)
+    response = CompleteStoryResponse(
+        id=story.id, title=story.title, session_id=story.session_id, created_at=story.created_at,
+        root_node=node_dict[root_node.id], all_nodes=node_dict,
+    )
+    # FastAPI validates the returned object against response_model again, then encodes it
+    validated = CompleteStoryResponse.model_validate(response.model_dump())
+    return encode_like_json_response(jsonable_encoder(validated))
+
+def encode_like_json_response(content) -> bytes:
+    """What fastapi.responses.JSONResponse.render does"""
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def measure(serialize, story, nodes):
+    times = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        body = serialize(story, nodes)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), len(body)
+
+if __name__ == "__main__":
+    story = SimpleNamespace(id=1, title="Benchmark Story", session_id="benchmark", created_at=datetime.now())
+
+    print("=" * 78)
+    print("⚡ Complete-Story Serialization Benchmark (median ms / response bytes)")
+    print("=" * 78)
+    print(f"   {'nodes':>6} | {'pydantic':>18} | {'orjson full':>18} | {'orjson compact':>18}")
+    for size in STORY_SIZES:
+        nodes = build_nodes(size)
+        results = [measure(serialize, story, nodes) for serialize in (serialize_pydantic, serialize_complete_story, serialize_compact_story)]
+        print(f"   {size:>6} | " + " | ".join(f"{ms:>7.2f}ms {size_bytes:>8}B" for ms, size_bytes in results))
@@ -0,0 +1,135 @@
+# Admission control in front of POST /stories/create.
+# Every admitted request becomes an LLM generation, so load is shed before the
+# job row is written rather than after the backlog has built up:
+#   - per-session token bucket: one session can't monopolize generation
+#   - global token bucket: caps the total creation rate, which also bounds a
+#     client that rotates session cookies (each new session starts full)
+#   - queue depth: no new jobs while MAX_OUTSTANDING_JOBS are pending or
+#     processing, counted in story_jobs so it covers every process
+#
+# Request flow:
+# create_story → queue full?  → 429 (Retry-After: ADMISSION_QUEUE_RETRY_AFTER_SECONDS)
+#                   ↓ no
+#                session bucket empty? → 429 (Retry-After: time until its next token)
+#                   ↓ no
+#                global bucket empty?  → 429 (Retry-After: time until its next token)
+#                   ↓ no
+#                take a token from both → job created
+#
+# Buckets live in this process, so with several API replicas the global rate
+# is per replica.
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.metrics import ADMISSION_TOTAL, OUTSTANDING_JOBS
+from models.job import StoryJob, ACTIVE_STATUSES, status_in
+
+
+class TokenBucket:
+    """Holds up to `capacity` tokens, refilled continuously at `rate` per second."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    # Seconds until a token is available, 0 if one is available now
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Rejection(NamedTuple):
+    reason: str       # Metric label: session_rate, global_rate or queue_full
+    detail: str
+    retry_after: int  # Whole seconds, for the Retry-After header
+
+
+class AdmissionController:
+
+    def __init__(self, enabled: bool, session_rate: float, session_burst: int,
+                 global_rate: float, global_burst: int, max_outstanding_jobs: int, max_sessions: int):
+        self.enabled = enabled
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_outstanding_jobs = max_outstanding_jobs
+        self.max_sessions = max_sessions
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._sessions: "OrderedDict[str, TokenBucket]" = OrderedDict()  # LRU order
+
+    def _session_bucket(self, session_id: str, now: float) -> TokenBucket:
+        bucket = self._sessions.get(session_id)
+        if bucket is None:
+            bucket = self._sessions[session_id] = TokenBucket(self.session_rate, self.session_burst, now)
+        self._sessions.move_to_end(session_id)
+        # Cookie rotation must not grow memory without bound. Evicting the
+        # least recently used session resets its bucket, which errs on the
+        # side of admitting; the global bucket still applies.
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return bucket
+
+    # Pending + processing jobs of all processes; a read of the partial index
+    # ix_story_jobs_active, however many finished jobs the table holds
+    async def _outstanding_jobs(self, db: AsyncSession) -> int:
+        count = await db.scalar(select(func.count()).select_from(StoryJob).where(status_in(*ACTIVE_STATUSES)))
+        OUTSTANDING_JOBS.set(count)
+        return count
+
+    # None if the request may create a job (its tokens are taken), otherwise
+    # why not and when to retry
+    async def admit(self, db: AsyncSession, session_id: str) -> Optional[Rejection]:
+        if not self.enabled:
+            return None
+
+        if self.max_outstanding_jobs > 0 and await self._outstanding_jobs(db) >= self.max_outstanding_jobs:
+            return self._reject("queue_full", "Too many stories are being generated, try again shortly",
+                                settings.ADMISSION_QUEUE_RETRY_AFTER_SECONDS)
+
+        # No await from here on: checking and taking tokens is atomic on the event loop
+        now = time.monotonic()
+        session_bucket = self._session_bucket(session_id, now)
+        wait = session_bucket.wait_time(now)
+        if wait > 0:
+            return self._reject("session_rate", "Too many stories requested, try again later", wait)
+        wait = self._global.wait_time(now)
+        if wait > 0:
+            return self._reject("global_rate", "Too many stories are being requested, try again shortly", wait)
+
+        session_bucket.take()
+        self._global.take()
+        ADMISSION_TOTAL.labels(result="admitted").inc()
+        return None
+
+    @staticmethod
+    def _reject(reason: str, detail: str, retry_after: float) -> Rejection:
+        ADMISSION_TOTAL.labels(result=reason).inc()
+        return Rejection(reason, detail, max(1, math.ceil(retry_after)))
+
+
+# Singleton for the API process
+admission_controller = AdmissionController(
+    enabled=settings.ADMISSION_ENABLED,
+    session_rate=settings.ADMISSION_SESSION_RATE_PER_MINUTE / 60,
+    session_burst=settings.ADMISSION_SESSION_BURST,
+    global_rate=settings.ADMISSION_GLOBAL_RATE_PER_SECOND,
+    global_burst=settings.ADMISSION_GLOBAL_BURST,
+    max_outstanding_jobs=settings.MAX_OUTSTANDING_JOBS,
+    max_sessions=settings.ADMISSION_MAX_SESSIONS,
+)
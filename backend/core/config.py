@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Literal, Optional
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
 
@@ -9,6 +9,121 @@ class Settings(BaseSettings):
     ALLOWED_ORIGINS: str
     OPENAI_API_KEY: str
 
+    # Connection pools of the sync and async engines (db/database.py), per engine.
+    # Size them so that processes × (pool size + overflow) stays under the
+    # server's connection limit.
+    DB_POOL_SIZE: int = 10                  # Connections kept open
+    DB_MAX_OVERFLOW: int = 20               # Extra connections opened under load, closed when returned
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0   # Wait for a free connection before failing the request
+    DB_POOL_RECYCLE_SECONDS: int = 1800     # Reconnect older connections (server/proxy idle timeouts)
+    DB_POOL_PRE_PING: bool = True           # Check a connection before use; survives database restarts (not SQLite)
+    # SQLite only: WAL journal (readers don't block the writer), synchronous=NORMAL
+    # and a busy timeout, so concurrent writers wait instead of failing
+    SQLITE_PRAGMAS_ENABLED: bool = True
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # Upper bound on story generations running at once in this process.
+    # Each generation is a coroutine awaiting the LLM, so this caps OpenAI
+    # concurrency rather than threadpool usage.
+    MAX_CONCURRENT_GENERATIONS: int = 8
+
+    # LLM backend (core/llm_provider.py)
+    # "openai" | "fake" (offline, deterministic) | "record" | "replay"
+    LLM_PROVIDER: Literal["openai", "fake", "record", "replay"] = "openai"
+    LLM_MODEL: str = "gpt-4o-mini"
+    LLM_TEMPERATURE: float = 0.7
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_MAX_CONNECTIONS: int = 20            # Pooled keep-alive connections to the API
+    LLM_JSON_MODE: bool = True               # openai: native JSON output (response_format json_object)
+    LLM_FAKE_LATENCY_SECONDS: float = 0.0    # fake/replay: delay before the first token
+    LLM_FAKE_TOKENS_PER_SECOND: float = 0.0  # fake/replay: output speed, 0 = instant
+    LLM_FAKE_CORRUPTION_RATE: float = 0.0    # fake: share of whole-story responses damaged (exercises story repair)
+    LLM_RECORDING_PATH: str = "llm_recording.jsonl"
+
+    # How StoryGenerator talks to the LLM
+    # "single": one request, story persisted once the whole response is parsed.
+    # "streaming": nodes are persisted while the response streams in, root first.
+    # "incremental": only the opening scene is generated up front; later scenes
+    #                are written when a player reaches them (core/story_expander.py).
+    # "fanout": the opening scene is generated first, then each choice's subtree
+    #           by its own concurrent request, and the results are stitched together.
+    GENERATION_MODE: Literal["single", "streaming", "incremental", "fanout"] = "single"
+
+    # Fan-out generation
+    FANOUT_PARALLELISM: int = 3              # Branch requests of one story running at once
+    FANOUT_BRANCH_ATTEMPTS: int = 2          # Tries per branch before it is dropped
+
+    # Prompts (core/prompt_builder.py)
+    PROMPT_COMPACT_SCHEMA: bool = True        # Compact typed schema instead of the full JSON Schema in prompts
+    STORY_TOKEN_BUDGET: Optional[int] = None  # Default completion token budget of a story, None = the default shape
+    MIN_STORY_TOKEN_BUDGET: int = 300
+    MAX_STORY_TOKEN_BUDGET: int = 16000
+
+    # Repair of malformed whole-story responses (core/story_repair.py)
+    STORY_REPAIR_ENABLED: bool = True
+    STORY_REPAIR_MAX_HOLES: int = 4          # More invalid subtrees than this: regenerate the whole story
+    STORY_REPAIR_ATTEMPTS: int = 2           # Tries per invalid subtree
+
+    # Incremental generation
+    INCREMENTAL_TARGET_DEPTH: int = 5        # From this depth on, scenes are steered toward an ending
+    INCREMENTAL_MAX_DEPTH: int = 12          # Scenes at this depth are always endings
+    MAX_SPECULATIVE_EXPANSIONS: int = 8      # Background expansions of the next choices running at once
+
+    # Job queue (core/job_queue.py)
+    # "inline": the API process runs jobs it accepts and sweeps for stale ones.
+    # "worker": the API only enqueues; `python worker.py` processes run jobs.
+    JOB_EXECUTION_MODE: Literal["inline", "worker"] = "inline"
+    JOB_LEASE_SECONDS: int = 120
+    JOB_HEARTBEAT_SECONDS: int = 30
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 10.0
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+
+    # Push-based job status (GET /jobs/{job_id}/events and /wait, core/job_events.py)
+    JOB_EVENTS_KEEPALIVE_SECONDS: float = 15.0  # SSE comment sent on an idle stream
+    JOB_EVENTS_MAX_WAIT_SECONDS: float = 30.0   # Upper bound of a long-poll request
+    JOB_EVENTS_RELAY_SECONDS: float = 2.0       # Batched DB check for jobs run by other processes
+    JOB_EVENTS_MAX_JOBS: int = 4096             # Latest snapshots kept in memory
+
+    # Admission control on POST /stories/create (core/admission.py)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_SESSION_RATE_PER_MINUTE: float = 2.0   # Sustained stories per session
+    ADMISSION_SESSION_BURST: int = 5                 # Stories a session can request back to back
+    ADMISSION_GLOBAL_RATE_PER_SECOND: float = 2.0    # Sustained stories for the whole process
+    ADMISSION_GLOBAL_BURST: int = 20
+    MAX_OUTSTANDING_JOBS: int = 200                  # Pending + processing jobs before shedding, 0 disables
+    ADMISSION_QUEUE_RETRY_AFTER_SECONDS: int = 10
+    ADMISSION_MAX_SESSIONS: int = 100000             # Session buckets kept in memory (least recently used evicted)
+
+    # Retention of finished jobs (core/job_retention.py)
+    JOB_RETENTION_DAYS: int = 30                                # Finished jobs older than this are compacted, 0 keeps them forever
+    JOB_RETENTION_MODE: Literal["archive", "delete"] = "archive"  # archive copies them to story_jobs_archive first
+    JOB_RETENTION_BATCH_SIZE: int = 500                         # Jobs per transaction, so each one holds locks briefly
+    JOB_RETENTION_INTERVAL_SECONDS: float = 3600.0
+
+    # Player progress write buffer (core/progress_buffer.py)
+    PROGRESS_FLUSH_INTERVAL_SECONDS: float = 1.0  # Longest a recorded choice waits in memory
+    PROGRESS_FLUSH_BATCH_SIZE: int = 500          # Pending choices that trigger an early flush
+    PROGRESS_MAX_PENDING: int = 50000             # Oldest choices are dropped beyond this (database down)
+
+    # Theme cache in front of the LLM (core/story_cache.py)
+    STORY_CACHE_ENABLED: bool = True
+    STORY_CACHE_TTL_SECONDS: int = 3600
+    STORY_CACHE_MAX_ENTRIES: int = 256
+
+    # Near-duplicate theme reuse (core/similarity_index.py)
+    SIMILARITY_ENABLED: bool = True
+    SIMILARITY_THRESHOLD: float = 0.6  # Estimated Jaccard similarity of theme/title 3-grams
+    SIMILARITY_SYNC_LOOKBACK_IDS: int = 1000  # Story IDs below the newest synced one re-checked for late commits
+
+    # Per-node navigation (GET /stories/{story_id}/nodes/{node_id})
+    NODE_PREFETCH_DEPTH: int = 1       # Levels of children sent along with a node
+    MAX_NODE_PREFETCH_DEPTH: int = 3
+
+    # Session story library (GET /stories)
+    LIBRARY_PAGE_SIZE: int = 20
+    MAX_LIBRARY_PAGE_SIZE: int = 100
+
     @field_validator('ALLOWED_ORIGINS')
     def parse_allowed_origins(cls, v: str) -> List[str]:
         return v.split(",") if v else []
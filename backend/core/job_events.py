@@ -0,0 +1,149 @@
+# In-process notification hub for job status.
+# Instead of clients polling GET /jobs/{job_id} (one DB query per poll), the
+# queue publishes a snapshot on every state transition and the SSE / long-poll
+# endpoints in routers/job.py wake up on it, so waiting costs no DB reads.
+#
+# Flow:
+# job_queue (claim, progress, complete, retry, fail) → publish_job(job)
+#      ↓
+# JobEventHub: latest snapshot per job + futures of waiting requests
+#      ↓
+# watch_job() → SSE events / long-poll response
+#
+# Jobs run by another process (worker.py, another API replica) never publish
+# here, so relay_remote_jobs() checks every job someone is waiting on in one
+# batched query per JOB_EVENTS_RELAY_SECONDS and publishes what changed.
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from core.config import settings
+from db.database import AsyncSessionLocal
+from models.job import StoryJob, FINISHED_STATUSES
+from schemas.job import StoryJobResponse
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {status.value for status in FINISHED_STATUSES}
+
+Snapshot = dict
+
+
+def job_snapshot(job: StoryJob) -> Snapshot:
+    return StoryJobResponse.model_validate(job).model_dump(mode="json")
+
+
+class JobEventHub:
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._latest: "OrderedDict[str, Tuple[int, Snapshot]]" = OrderedDict()  # LRU order
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._sequence = 0  # Global, so versions keep increasing even after eviction
+        self.published = 0
+
+    # (version, snapshot) of the last event for a job; (0, None) if none seen
+    def latest(self, job_id: str) -> Tuple[int, Optional[Snapshot]]:
+        return self._latest.get(job_id, (0, None))
+
+    def watched_job_ids(self):
+        return list(self._waiters)
+
+    def publish(self, snapshot: Snapshot):
+        job_id = snapshot["job_id"]
+        if self.latest(job_id)[1] == snapshot:
+            return
+        self._sequence += 1
+        self.published += 1
+        self._latest[job_id] = (self._sequence, snapshot)
+        self._latest.move_to_end(job_id)
+        while len(self._latest) > self.max_jobs:
+            self._latest.popitem(last=False)
+
+        for future in self._waiters.pop(job_id, ()):
+            if not future.done():
+                future.set_result(None)
+
+    # Waits until the job has an event newer than `version` or timeout expires.
+    # Returns the latest (version, snapshot) either way.
+    async def wait(self, job_id: str, version: int, timeout: float) -> Tuple[int, Optional[Snapshot]]:
+        if self.latest(job_id)[0] > version:
+            return self.latest(job_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, set()).add(future)
+        try:
+            await asyncio.wait_for(future, timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[job_id]
+        return self.latest(job_id)
+
+job_events = JobEventHub(max_jobs=settings.JOB_EVENTS_MAX_JOBS)
+
+
+def publish_job(job: StoryJob):
+    job_events.publish(job_snapshot(job))
+
+
+async def load_job_snapshot(job_id: str) -> Optional[Snapshot]:
+    async with AsyncSessionLocal() as db:
+        job = await db.scalar(select(StoryJob).where(StoryJob.job_id == job_id))
+        return job_snapshot(job) if job else None
+
+
+# Yields the job's snapshot now and on every change, until it is completed or
+# failed. Yields None after idle_seconds without a change (SSE keepalive,
+# long-poll timeout). Ends immediately if the job does not exist.
+async def watch_job(job_id: str, idle_seconds: float) -> AsyncIterator[Optional[Snapshot]]:
+    # Version first: an event published during the DB read is not missed
+    version, snapshot = job_events.latest(job_id)
+    if snapshot is None:
+        snapshot = await load_job_snapshot(job_id)
+        if snapshot is None:
+            return
+    yield snapshot
+
+    idle_since = time.monotonic()
+    while snapshot["status"] not in TERMINAL_STATUSES:
+        remaining = idle_since + idle_seconds - time.monotonic()
+        version, latest = await job_events.wait(job_id, version, remaining)
+        if latest is not None and latest != snapshot:
+            snapshot = latest
+            idle_since = time.monotonic()
+            yield snapshot
+        elif time.monotonic() - idle_since >= idle_seconds:
+            idle_since = time.monotonic()
+            yield None
+
+
+# One query per interval for all watched jobs, and none while nobody waits
+async def relay_remote_jobs(stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.JOB_EVENTS_RELAY_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+        job_ids = job_events.watched_job_ids()
+        if not job_ids:
+            continue
+        # A local event published while the query ran is newer than its result
+        versions = {job_id: job_events.latest(job_id)[0] for job_id in job_ids}
+        try:
+            async with AsyncSessionLocal() as db:
+                for job in await db.scalars(select(StoryJob).where(StoryJob.job_id.in_(job_ids))):
+                    if job_events.latest(job.job_id)[0] == versions[job.job_id]:
+                        job_events.publish(job_snapshot(job))
+        except Exception:
+            logger.exception("Job event relay failed")
@@ -0,0 +1,293 @@
+# Durable job queue backed by the story_jobs table.
+# Any process (API or worker.py) can run any job: ownership is a lease stored
+# on the row, so a crashed process only delays its jobs until the lease expires.
+import os
+import time
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, update, or_, and_, event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.job_events import publish_job
+from core.metrics import STAGE_SECONDS, JOB_SECONDS, JOBS_TOTAL, JOBS_IN_FLIGHT, track_token_usage
+from core.story_generator import StoryGenerator
+from db.database import AsyncSessionLocal
+from models.job import StoryJob, JobStatus, ACTIVE_STATUSES, status_in
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle
+# "pending" → claimed → "processing" ──→ "completed"
+#    ↑                       │
+#    └── retry (backoff) ────┤ error, attempts left
+#                            └──→ "failed" (attempts exhausted)
+# A "processing" job whose lease expired (worker died), or that never had a
+# lease, is claimable again.
+# Every transition (and streaming progress) is published to core/job_events.py
+# after it is committed.
+
+# Bounds how many generations talk to OpenAI at once in this process.
+# It is acquired before claiming, so jobs waiting for a slot stay "pending"
+# and claimable by other processes instead of holding a lease.
+generation_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_GENERATIONS)
+
+
+def make_worker_id(role: str) -> str:
+    return f"{role}:{socket.gethostname()}:{os.getpid()}"
+
+
+# The leading status_in() term lets the database read only the partial index
+# of active jobs (ix_story_jobs_active) instead of the whole table
+def _claimable(now: datetime):
+    return and_(
+        status_in(*ACTIVE_STATUSES),
+        or_(
+            and_(
+                StoryJob.status == JobStatus.PENDING,
+                or_(StoryJob.available_at.is_(None), StoryJob.available_at <= now),
+            ),
+            and_(
+                StoryJob.status == JobStatus.PROCESSING,
+                # No lease: left "processing" by a process that predates leases
+                or_(StoryJob.lease_expires_at.is_(None), StoryJob.lease_expires_at < now),
+            ),
+        ),
+    )
+
+
+# Atomic claim: a compare-and-set UPDATE that only succeeds while the row is
+# still claimable, so concurrent claimers (threads, processes or nodes) can
+# never both win. Portable across SQLite and Postgres.
+async def _try_claim(db: AsyncSession, job_pk: int, worker_id: str) -> Optional[StoryJob]:
+    now = datetime.now()
+    result = await db.execute(
+        update(StoryJob)
+        .where(StoryJob.id == job_pk, _claimable(now))
+        .values(
+            status=JobStatus.PROCESSING,
+            locked_by=worker_id,
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+            attempts=StoryJob.attempts + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount != 1:
+        return None
+
+    job = await db.get(StoryJob, job_pk, populate_existing=True)
+    if job.attempts > job.max_attempts:
+        # Re-claimed after too many crashed attempts: give up instead of
+        # letting a poison job take down workers forever.
+        await _mark_failed(db, job, job.error or "Job exceeded its maximum number of attempts")
+        return None
+    publish_job(job)
+    return job
+
+
+async def claim_job(db: AsyncSession, job_id: str, worker_id: str) -> Optional[StoryJob]:
+    job_pk = await db.scalar(select(StoryJob.id).where(StoryJob.job_id == job_id))
+    if job_pk is None:
+        return None
+    return await _try_claim(db, job_pk, worker_id)
+
+
+async def claim_next_job(db: AsyncSession, worker_id: str) -> Optional[StoryJob]:
+    candidates = (await db.scalars(
+        select(StoryJob.id)
+        .where(_claimable(datetime.now()))
+        .order_by(StoryJob.id)
+        .limit(10)
+    )).all()
+
+    for job_pk in candidates:
+        job = await _try_claim(db, job_pk, worker_id)
+        if job:
+            return job
+    return None
+
+
+# Extends the lease while a generation is running. Uses its own session as the
+# job's session is busy with the generation itself.
+async def heartbeat_job(job_pk: int, worker_id: str) -> bool:
+    now = datetime.now()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(StoryJob)
+            .where(
+                StoryJob.id == job_pk,
+                StoryJob.status == JobStatus.PROCESSING,
+                StoryJob.locked_by == worker_id,
+            )
+            .values(
+                heartbeat_at=now,
+                lease_expires_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+
+async def _heartbeat_loop(job_pk: int, worker_id: str):
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+        try:
+            if not await heartbeat_job(job_pk, worker_id):
+                logger.warning("Lost lease on job %s (worker %s)", job_pk, worker_id)
+                return
+        except Exception:
+            logger.exception("Heartbeat failed for job %s", job_pk)
+
+
+async def complete_job(db: AsyncSession, job: StoryJob, story_id: int):
+    job.story_id = story_id             # Link generated story to job
+    job.status = JobStatus.COMPLETED    # Mark as successful
+    job.completed_at = datetime.now()   # Record completion time
+    job.error = None
+    job.locked_by = None
+    job.lease_expires_at = None
+    await db.commit()
+    publish_job(job)
+
+
+async def _mark_failed(db: AsyncSession, job: StoryJob, error: str):
+    job.status = JobStatus.FAILED
+    job.completed_at = datetime.now()
+    job.error = error
+    job.locked_by = None
+    job.lease_expires_at = None
+    await db.commit()
+    publish_job(job)
+
+
+# Retries with exponential backoff until max_attempts is reached
+async def fail_job(db: AsyncSession, job: StoryJob, error: str):
+    job.story_id = None  # A partially streamed story is removed on failure
+    job.nodes_generated = 0
+    if job.attempts >= job.max_attempts:
+        await _mark_failed(db, job, error)
+        return
+
+    backoff = settings.JOB_RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+    job.status = JobStatus.PENDING
+    job.error = error
+    job.available_at = datetime.now() + timedelta(seconds=backoff)
+    job.locked_by = None
+    job.lease_expires_at = None
+    await db.commit()
+    publish_job(job)
+
+
+# When the job became claimable: its retry time, or its creation.
+# available_at is written with local time; created_at is set by the database
+# (UTC, and naive on SQLite).
+def _queued_since(job: StoryJob) -> float:
+    if job.available_at is not None:
+        return (datetime.now() - job.available_at.replace(tzinfo=None)).total_seconds()
+    created_at = job.created_at
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - created_at).total_seconds()
+
+
+def _add_token_usage(job: StoryJob, usage):
+    job.prompt_tokens = (job.prompt_tokens or 0) + usage.prompt_tokens
+    job.completion_tokens = (job.completion_tokens or 0) + usage.completion_tokens
+    job.repair_attempts = (job.repair_attempts or 0) + usage.repair_attempts
+    job.tokens_saved = (job.tokens_saved or 0) + usage.tokens_saved
+
+
+async def _execute(db: AsyncSession, job: StoryJob, worker_id: str):
+    if job.created_at is not None:
+        STAGE_SECONDS.labels(stage="queue_wait").observe(max(_queued_since(job), 0.0))
+    started = time.perf_counter()
+    heartbeat = asyncio.create_task(_heartbeat_loop(job.id, worker_id))
+
+    # Committed together with the nodes, so pollers see the story (and how
+    # much of it exists) while it is still being written
+    progressed = False
+
+    def on_progress(story, nodes_generated: int):
+        nonlocal progressed
+        job.story_id = story.id
+        job.nodes_generated = nodes_generated
+        progressed = True
+
+    # Progress is published once the nodes it reports are visible to readers
+    def publish_progress(session):
+        nonlocal progressed
+        if progressed:
+            progressed = False
+            publish_job(job)
+
+    event.listen(db.sync_session, "after_commit", publish_progress)
+    # Tokens reported by every LLM call of this attempt, stored on the job
+    with JOBS_IN_FLIGHT.track_inprogress(), track_token_usage() as usage:
+        try:
+            story = await StoryGenerator.generate_story(db, job.session_id, job.theme, allow_similar=job.allow_similar, on_progress=on_progress, token_budget=job.token_budget)
+            _add_token_usage(job, usage)
+            await complete_job(db, job, story.id)
+            outcome = "completed"
+        except Exception as e:
+            logger.exception("Job %s failed on attempt %s", job.job_id, job.attempts)
+            await db.rollback()
+            await db.refresh(job)
+            _add_token_usage(job, usage)
+            await fail_job(db, job, str(e))
+            outcome = "failed" if job.status == JobStatus.FAILED else "retried"
+        finally:
+            event.remove(db.sync_session, "after_commit", publish_progress)
+            heartbeat.cancel()
+
+    JOBS_TOTAL.labels(outcome=outcome).inc()
+    JOB_SECONDS.labels(outcome=outcome).observe(time.perf_counter() - started)
+
+
+# Runs one specific job if it can still be claimed (API inline mode)
+async def run_job(job_id: str, worker_id: str) -> bool:
+    async with generation_semaphore:
+        async with AsyncSessionLocal() as db:
+            job = await claim_job(db, job_id, worker_id)
+            if not job:
+                return False
+            await _execute(db, job, worker_id)
+            return True
+
+
+# Runs the oldest claimable job, if any (workers and the inline sweeper)
+async def run_next_job(worker_id: str) -> bool:
+    async with generation_semaphore:
+        async with AsyncSessionLocal() as db:
+            job = await claim_next_job(db, worker_id)
+            if not job:
+                return False
+            await _execute(db, job, worker_id)
+            return True
+
+
+# Pull loop: `concurrency` slots each claim and run jobs until stop is set.
+# Slots sleep for JOB_POLL_INTERVAL_SECONDS only when the queue is empty.
+async def run_worker(worker_id: str, concurrency: int, stop: Optional[asyncio.Event] = None):
+    stop = stop or asyncio.Event()
+
+    async def slot(slot_id: str):
+        while not stop.is_set():
+            try:
+                ran = await run_next_job(slot_id)
+            except Exception:
+                logger.exception("Worker slot %s crashed while claiming", slot_id)
+                ran = False
+            if not ran:
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=settings.JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    await asyncio.gather(*(slot(f"{worker_id}:{i}") for i in range(concurrency)))
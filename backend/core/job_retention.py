@@ -0,0 +1,106 @@
+# Retention for story_jobs.
+# Every job row stays after it finishes, so without compaction the table (and
+# every index on it) grows with all-time traffic while the queue only ever
+# works on the few pending/processing rows. Once an interval, finished jobs
+# older than JOB_RETENTION_DAYS are copied to story_jobs_archive
+# (JOB_RETENTION_MODE=archive) and deleted, JOB_RETENTION_BATCH_SIZE at a
+# time, each batch in its own short transaction.
+#
+# Stories are not touched: a client holding an old job_id gets 404 from
+# /jobs/{job_id}, but the story it produced stays reachable by story ID.
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.metrics import JOBS_COMPACTED_TOTAL
+from db.database import AsyncSessionLocal
+from models.job import StoryJob, StoryJobArchive, FINISHED_STATUSES, status_in
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = [
+    "job_id", "session_id", "theme", "status", "story_id", "error",
+    "created_at", "completed_at", "attempts", "prompt_tokens", "completion_tokens",
+]
+
+# Oldest finished jobs past the cutoff. The status filter matches
+# ix_story_jobs_finished_completed_at, so this walks that index in order.
+def _select_expired_ids(cutoff: datetime, limit: int):
+    return (
+        select(StoryJob.id)
+        .where(status_in(*FINISHED_STATUSES), StoryJob.completed_at < cutoff)
+        .order_by(StoryJob.completed_at)
+        .limit(limit)
+    )
+
+# Moves one batch out of story_jobs. Returns the number of jobs removed.
+async def _compact_batch(db: AsyncSession, cutoff: datetime, batch_size: int, archive: bool) -> int:
+    ids = list((await db.scalars(_select_expired_ids(cutoff, batch_size))).all())
+    if not ids:
+        return 0
+
+    if archive:
+        await db.execute(
+            insert(StoryJobArchive).from_select(
+                ARCHIVE_COLUMNS,
+                select(*(getattr(StoryJob, column) for column in ARCHIVE_COLUMNS)).where(StoryJob.id.in_(ids)),
+            )
+        )
+    await db.execute(delete(StoryJob).where(StoryJob.id.in_(ids)))
+    await db.commit()
+    JOBS_COMPACTED_TOTAL.labels(action="archived" if archive else "deleted").inc(len(ids))
+    return len(ids)
+
+# One full pass: batches until fewer than a batch is left. Returns the number
+# of jobs removed.
+async def compact_jobs(
+    retention_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    archive: Optional[bool] = None,
+    now: Optional[datetime] = None,
+) -> int:
+    retention_days = settings.JOB_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.JOB_RETENTION_BATCH_SIZE
+    archive = settings.JOB_RETENTION_MODE == "archive" if archive is None else archive
+    if retention_days <= 0:
+        return 0
+
+    cutoff = (now or datetime.now()) - timedelta(days=retention_days)
+    total = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            try:
+                removed = await _compact_batch(db, cutoff, batch_size, archive)
+            except SQLAlchemyError:
+                # E.g. another API process archived the same jobs first; its
+                # commit wins and the next pass carries on from there
+                await db.rollback()
+                logger.exception("Job compaction batch failed")
+                break
+            total += removed
+            if removed < batch_size:
+                break
+            await asyncio.sleep(0)  # Let request handlers run between batches
+    if total:
+        logger.info("Compacted %d finished jobs older than %d days", total, retention_days)
+    return total
+
+# Runs compact_jobs() every JOB_RETENTION_INTERVAL_SECONDS until stop is set
+async def run_job_compactor(stop: asyncio.Event):
+    if settings.JOB_RETENTION_DAYS <= 0:
+        return
+    while not stop.is_set():
+        try:
+            await compact_jobs()
+        except Exception:
+            logger.exception("Job compaction failed")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=settings.JOB_RETENTION_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,262 @@
+# Pluggable LLM backend for StoryGenerator (LLM_PROVIDER setting).
+# "openai": one long-lived ChatOpenAI per process on a pooled HTTP client,
+#           instead of a new model and connection per job.
+# "fake":   deterministic offline stories with configurable latency, for
+#           throughput tests and development without network access.
+# "record": calls OpenAI and appends every response to LLM_RECORDING_PATH.
+# "replay": answers from LLM_RECORDING_PATH, keyed by the rendered prompt.
+#
+# Every provider returns an object with langchain's ainvoke()/astream()
+# interface (prompt value in, AIMessage / AIMessageChunk out), so generation
+# code is the same whichever one is configured.
+import re
+import json
+import random
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from core.config import settings
+
+
+def _prompt_text(prompt_value) -> str:
+    return prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _usage(prompt_text: str, response_text: str) -> dict:
+    input_tokens, output_tokens = _estimate_tokens(prompt_text), _estimate_tokens(response_text)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+# Plays a response back like a remote model would: LLM_FAKE_LATENCY_SECONDS
+# before the first token, then LLM_FAKE_TOKENS_PER_SECOND (0 = all at once)
+class _TimedResponder(ABC):
+
+    @abstractmethod
+    async def _respond(self, prompt_value) -> str:
+        ...
+
+    def _generation_seconds(self, text: str) -> float:
+        if settings.LLM_FAKE_TOKENS_PER_SECOND <= 0:
+            return 0.0
+        return _estimate_tokens(text) / settings.LLM_FAKE_TOKENS_PER_SECOND
+
+    async def ainvoke(self, prompt_value, **kwargs) -> AIMessage:
+        text = await self._respond(prompt_value)
+        await asyncio.sleep(settings.LLM_FAKE_LATENCY_SECONDS + self._generation_seconds(text))
+        return AIMessage(content=text, usage_metadata=_usage(_prompt_text(prompt_value), text))
+
+    async def astream(self, prompt_value, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        text = await self._respond(prompt_value)
+        await asyncio.sleep(settings.LLM_FAKE_LATENCY_SECONDS)
+        chunk_size = 16
+        delay = self._generation_seconds(text) * chunk_size / max(len(text), 1)
+        for start in range(0, len(text), chunk_size):
+            if delay:
+                await asyncio.sleep(delay)
+            yield AIMessageChunk(content=text[start:start + chunk_size])
+        yield AIMessageChunk(content="", usage_metadata=_usage(_prompt_text(prompt_value), text))
+
+
+# Writes plausible stories without a network. The response shape follows the
+# schema named in the prompt's format instructions, and its content is
+# seeded by the prompt, so the same prompt always gets the same story.
+class FakeChatModel(_TimedResponder):
+
+    SCENES = [
+        "The path splits beneath an old stone arch.",
+        "A stranger offers help, for a price.",
+        "Something glints at the bottom of the ravine.",
+        "Distant drums echo through the valley.",
+        "The map you carry no longer matches the land.",
+        "A storm rolls in faster than expected.",
+    ]
+    CHOICES = ["Press on", "Turn back", "Hide and wait", "Ask for help", "Take the risk", "Search the area"]
+
+    async def _respond(self, prompt_value) -> str:
+        prompt_text = _prompt_text(prompt_value)
+        rng = random.Random(hashlib.sha256(prompt_text.encode()).digest())
+
+        kind = self._prompt_kind(prompt_text)
+        if kind == "outline":
+            response = {"title": self._title(rng), "rootNode": self._step(rng, ending=False)}
+        elif kind == "step":
+            if "must be an ending" in prompt_text:
+                ending = True
+            else:
+                ending = rng.random() < (0.7 if "getting long" in prompt_text else 0.2)
+            response = self._step(rng, ending=ending)
+        elif kind == "branch":
+            response = self._tree(rng, depth=rng.randint(2, 3))
+        else:
+            response = {"title": self._title(rng), "rootNode": self._tree(rng, depth=rng.randint(3, 4))}
+            if rng.random() < settings.LLM_FAKE_CORRUPTION_RATE:
+                return self._corrupt(rng, response)
+        return json.dumps(response)
+
+    # Which schema the format instructions ask for: StoryLLMResponse ("story"),
+    # StoryOutlineLLM, StoryStepLLM or StoryNodeLLM ("branch"). Compact
+    # instructions name it (core/prompt_builder.py), JSON Schema ones
+    # (PROMPT_COMPACT_SCHEMA=false) are told apart by their definitions.
+    COMPACT_KINDS = {"Story": "story", "StoryOutline": "outline", "StoryStep": "step", "StoryNode": "branch"}
+
+    @classmethod
+    def _prompt_kind(cls, prompt_text: str) -> str:
+        compact = re.search(r"JSON object of type (\w+)", prompt_text)
+        if compact:
+            return cls.COMPACT_KINDS.get(compact.group(1), "branch")
+        if '"rootNode"' in prompt_text:
+            return "outline" if '#/$defs/StoryStepLLM"' in prompt_text else "story"
+        return "step" if '#/$defs/StoryStepOptionLLM"' in prompt_text else "branch"
+
+    # The malformed output real models produce now and then (see
+    # core/story_repair.py): a scene missing its fields, or a response cut off
+    def _corrupt(self, rng: random.Random, response: dict) -> str:
+        if rng.random() < 0.5:
+            text = json.dumps(response)
+            return text[:int(len(text) * rng.uniform(0.6, 0.95))]
+        nodes = []
+        pending = [response["rootNode"]]
+        while pending:
+            node = pending.pop()
+            children = [option["nextNode"] for option in node["options"] or []]
+            nodes.extend(children)
+            pending.extend(children)
+        node = rng.choice(nodes)
+        del node["isEnding"]
+        node["options"] = None
+        return json.dumps(response)
+
+    def _title(self, rng: random.Random) -> str:
+        return f"The {rng.choice(['Lost', 'Hidden', 'Broken', 'Silent'])} {rng.choice(['Crown', 'Harbor', 'Signal', 'Forest'])}"
+
+    def _content(self, rng: random.Random) -> str:
+        return " ".join(rng.sample(self.SCENES, 3))
+
+    def _step(self, rng: random.Random, ending: bool) -> dict:
+        return {
+            "content": self._content(rng),
+            "isEnding": ending,
+            "isWinningEnding": ending and rng.random() < 0.5,
+            "options": None if ending else [{"text": text} for text in rng.sample(self.CHOICES, rng.randint(2, 3))],
+        }
+
+    # Every path ends within `depth` levels; the first path is a winning one
+    def _tree(self, rng: random.Random, depth: int, winning_path: bool = True) -> dict:
+        if depth <= 1 or (not winning_path and rng.random() < 0.3):
+            return {"content": self._content(rng), "isEnding": True, "isWinningEnding": winning_path, "options": None}
+
+        choices = rng.sample(self.CHOICES, rng.randint(2, 3))
+        return {
+            "content": self._content(rng),
+            "isEnding": False,
+            "isWinningEnding": False,
+            "options": [
+                {"text": text, "nextNode": self._tree(rng, depth - 1, winning_path and index == 0)}
+                for index, text in enumerate(choices)
+            ],
+        }
+
+
+class RecordingChatModel:
+
+    def __init__(self, llm, path: str):
+        self.llm = llm
+        self.path = path
+
+    def _record(self, prompt_value, text: str):
+        with open(self.path, "a", encoding="utf-8") as recording:
+            recording.write(json.dumps({"key": recording_key(prompt_value), "response": text}) + "\n")
+
+    async def ainvoke(self, prompt_value, **kwargs):
+        response = await self.llm.ainvoke(prompt_value, **kwargs)
+        self._record(prompt_value, response.content)
+        return response
+
+    async def astream(self, prompt_value, **kwargs):
+        text = ""
+        async for chunk in self.llm.astream(prompt_value, **kwargs):
+            text += chunk.content
+            yield chunk
+        self._record(prompt_value, text)
+
+
+class ReplayChatModel(_TimedResponder):
+
+    def __init__(self, path: str):
+        self.responses: Dict[str, str] = {}
+        with open(path, encoding="utf-8") as recording:
+            for line in recording:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.responses[entry["key"]] = entry["response"]
+
+    async def _respond(self, prompt_value) -> str:
+        key = recording_key(prompt_value)
+        if key not in self.responses:
+            raise LookupError(f"No recorded response for prompt {key[:12]} in {settings.LLM_RECORDING_PATH}")
+        return self.responses[key]
+
+
+def recording_key(prompt_value) -> str:
+    return hashlib.sha256(_prompt_text(prompt_value).encode()).hexdigest()
+
+
+class LLMProvider:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._llm = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    # Created on first use and kept for the life of the process
+    def get_llm(self):
+        if self._llm is None:
+            if self.name == "fake":
+                self._llm = FakeChatModel()
+            elif self.name == "replay":
+                self._llm = ReplayChatModel(settings.LLM_RECORDING_PATH)
+            else:
+                self._llm = self._openai()
+                if self.name == "record":
+                    self._llm = RecordingChatModel(self._llm, settings.LLM_RECORDING_PATH)
+        return self._llm
+
+    def _openai(self):
+        from langchain_openai import ChatOpenAI
+
+        # Keep-alive connections are reused across jobs instead of a TLS
+        # handshake per story
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+            ),
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+        )
+        return ChatOpenAI(
+            model_name=settings.LLM_MODEL,
+            temperature=settings.LLM_TEMPERATURE,
+            http_async_client=self._http_client,
+            request_timeout=settings.LLM_TIMEOUT_SECONDS,
+            stream_usage=True,  # Token counts on streamed responses too
+            # JSON mode: the API only returns syntactically valid JSON, so the
+            # prompt needs no JSON examples and fewer responses need repair
+            model_kwargs={"response_format": {"type": "json_object"}} if settings.LLM_JSON_MODE else {},
+        )
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        self._llm = None
+
+llm_provider = LLMProvider(settings.LLM_PROVIDER)
@@ -0,0 +1,317 @@
+# In-process metrics, exported in the Prometheus text format at GET /metrics.
+# Counters, gauges and histograms with labels, kept per process (each API
+# replica and worker.py process is scraped on its own).
+#
+# Usage:
+#   with STAGE_SECONDS.labels(stage="llm").time():
+#       ...
+#   JOBS_TOTAL.labels(outcome="completed").inc()
+#
+# Token usage of the generation running in the current task is accumulated
+# in a context variable (track_token_usage / record_token_usage, and
+# record_story_repair for core/story_repair.py), so StoryGenerator can report
+# it without threading a counter through every call.
+import time
+import bisect
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+        if not self.labelnames:
+            self.labels()  # Exported as 0 before the first update
+        REGISTRY.append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        ...
+
+    # Metrics without labels are used directly
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+
+    def __init__(self):
+        self.value = 0.0
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class _CounterValue(_Value):
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeValue(_Value):
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramValue:
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # Non-cumulative; summed when rendered
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, f'le=\"{_format_value(bound)}\"')} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, 'le=\"+Inf\"')} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {self.count}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def track_inprogress(self):
+        return self._default().track_inprogress()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metrics of this application
+
+# Where generation time goes: queue_wait (created/retry due → claimed),
+# llm (request until the full response), parse, persist (DB writes)
+STAGE_SECONDS = Histogram("story_generation_stage_seconds", "Duration of each story generation stage", ["stage"])
+JOB_SECONDS = Histogram("story_job_seconds", "Duration of a job attempt from claim to outcome", ["outcome"])
+JOBS_TOTAL = Counter("story_jobs_total", "Job attempts by outcome (completed, retried, failed)", ["outcome"])
+JOBS_IN_FLIGHT = Gauge("story_jobs_in_flight", "Jobs being executed by this process")
+LLM_CALLS_TOTAL = Counter("llm_calls_total", "LLM requests by prompt kind", ["kind"])
+LLM_IN_FLIGHT = Gauge("llm_requests_in_flight", "LLM requests awaiting a response in this process")
+LLM_TOKENS_TOTAL = Counter("llm_tokens_total", "Tokens reported by the LLM provider", ["type"])
+STORY_REPAIRS_TOTAL = Counter("story_repairs_total", "Malformed story responses by repair result (repaired, failed, too_many_holes)", ["result"])
+STORY_REPAIR_TOKENS_SAVED = Counter("story_repair_tokens_saved_total", "Tokens a full regeneration would have cost beyond the repair requests")
+ADMISSION_TOTAL = Counter("story_admission_total", "Story creation requests by admission result (admitted, session_rate, global_rate, queue_full)", ["result"])
+OUTSTANDING_JOBS = Gauge("story_jobs_outstanding", "Pending and processing jobs seen by the last admission check")
+JOBS_COMPACTED_TOTAL = Counter("story_jobs_compacted_total", "Finished jobs removed from story_jobs by retention", ["action"])
+PROGRESS_EVENTS_TOTAL = Counter("progress_events_total", "Player choices by fate (recorded, flushed, dropped)", ["result"])
+PROGRESS_FLUSH_SECONDS = Histogram("progress_flush_seconds", "Duration of a progress buffer flush")
+PROGRESS_PENDING = Gauge("progress_pending_events", "Player choices waiting in the progress buffer")
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "API request duration until the response starts, per router and route",
+    ["router", "method", "route", "status"],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "API requests being handled by this process")
+
+
+# Pure ASGI middleware (no per-request task or body buffering, unlike
+# BaseHTTPMiddleware). Times each request until its response starts, so
+# long-lived SSE streams count their setup, not their lifetime. Routes are
+# labelled by path template and router tag, never by raw path.
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        responded = False
+
+        async def send_wrapper(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                self._observe(scope, message["status"], started)
+            await send(message)
+
+        with HTTP_REQUESTS_IN_FLIGHT.track_inprogress():
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if not responded:  # Unhandled exception
+                    self._observe(scope, 500, started)
+
+    @staticmethod
+    def _observe(scope, status_code: int, started: float):
+        route = scope.get("route")  # Set by the router once the request is matched
+        tags = getattr(route, "tags", None)
+        HTTP_REQUEST_SECONDS.labels(
+            router=tags[0] if tags else "none",
+            method=scope["method"],
+            route=getattr(route, "path", "unmatched"),
+            status=status_code,
+        ).observe(time.perf_counter() - started)
+
+
+# Token accounting for the generation running in the current task
+class TokenUsage:
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.repair_attempts = 0
+        self.tokens_saved = 0
+
+_token_usage: ContextVar[Optional[TokenUsage]] = ContextVar("token_usage", default=None)
+
+
+# Tasks spawned inside (e.g. fan-out branches) inherit the same accumulator
+@contextmanager
+def track_token_usage():
+    usage = TokenUsage()
+    token = _token_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _token_usage.reset(token)
+
+
+# `usage_metadata` of an AIMessage: {"input_tokens": ..., "output_tokens": ...}
+def record_token_usage(usage_metadata: Optional[dict]):
+    if not usage_metadata:
+        return
+    prompt_tokens = usage_metadata.get("input_tokens", 0)
+    completion_tokens = usage_metadata.get("output_tokens", 0)
+    LLM_TOKENS_TOTAL.labels(type="prompt").inc(prompt_tokens)
+    LLM_TOKENS_TOTAL.labels(type="completion").inc(completion_tokens)
+
+    usage = _token_usage.get()
+    if usage is not None:
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+
+
+# Repair requests made for a malformed story and the tokens they saved
+def record_story_repair(attempts: int, tokens_saved: int):
+    STORY_REPAIR_TOKENS_SAVED.inc(tokens_saved)
+    usage = _token_usage.get()
+    if usage is not None:
+        usage.repair_attempts += attempts
+        usage.tokens_saved += tokens_saved
@@ -13,4 +13,19 @@ class StoryNodeLLM(BaseModel):
 
 class StoryLLMResponse(BaseModel):
     title: str = Field(description="The title of the story")
-    rootNode: StoryNodeLLM = Field(description="The root node of the story")
\ No newline at end of file
+    rootNode: StoryNodeLLM = Field(description="The root node of the story")
+
+# Incremental generation: a single scene whose options only carry their text;
+# the scenes they lead to are generated later as separate steps.
+class StoryStepOptionLLM(BaseModel):
+    text: str = Field(description="The text of the option shown to the user")
+
+class StoryStepLLM(BaseModel):
+    content: str = Field(description="The main content of the story node")
+    isEnding: bool = Field(description="Indicates if this node is an ending")
+    isWinningEnding: bool = Field(description="Indicates if this ending node is a winning ending")
+    options: Optional[List[StoryStepOptionLLM]] = Field(default=None, description="List of options, empty for endings")
+
+class StoryOutlineLLM(BaseModel):
+    title: str = Field(description="The title of the story")
+    rootNode: StoryStepLLM = Field(description="The opening scene of the story")
@@ -0,0 +1,158 @@
+# Write-coalescing buffer for player progress.
+# Recording a choice only appends to memory, so a click costs no database
+# round trip. A background task writes everything pending in one transaction
+# every PROGRESS_FLUSH_INTERVAL_SECONDS, or as soon as PROGRESS_FLUSH_BATCH_SIZE
+# choices are waiting, and once more on shutdown:
+#   - all choice events in one multi-row INSERT
+#   - one upsert per (session, story), however many clicks it had
+#
+# Flow:
+# POST /stories/{story_id}/progress → progress_buffer.record()  (memory only)
+#      ↓ interval or batch size
+# flush(): INSERT choice_events + UPSERT story_progress
+#
+# Choices not yet flushed are lost if the process crashes; that window is
+# bounded by the flush interval. Reads (resume) merge pending choices with the
+# stored position, so a player always sees their own latest click.
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from core.config import settings
+from core.metrics import PROGRESS_EVENTS_TOTAL, PROGRESS_FLUSH_SECONDS, PROGRESS_PENDING
+from db.database import AsyncSessionLocal
+from models.progress import ChoiceEvent, StoryProgress
+
+logger = logging.getLogger(__name__)
+
+ProgressKey = Tuple[str, int]  # (session_id, story_id)
+
+UPSERT_CHUNK_SIZE = 1000
+
+
+class PendingPosition(NamedTuple):
+    node_id: int
+    choices: int  # Choices recorded since the last flush
+    updated_at: datetime
+
+
+class ProgressBuffer:
+
+    def __init__(self, batch_size: int, max_pending: int):
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._events: Deque[dict] = deque()
+        self._positions: Dict[ProgressKey, PendingPosition] = {}
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, session_id: str, story_id: int, node_id: int, from_node_id: Optional[int] = None):
+        now = datetime.now()
+        self._events.append({
+            "session_id": session_id,
+            "story_id": story_id,
+            "from_node_id": from_node_id,
+            "to_node_id": node_id,
+            "created_at": now,
+        })
+        previous = self._positions.get((session_id, story_id))
+        self._positions[(session_id, story_id)] = PendingPosition(
+            node_id, (previous.choices if previous else 0) + (from_node_id is not None), now,
+        )
+        PROGRESS_EVENTS_TOTAL.labels(result="recorded").inc()
+
+        if len(self._events) > self.max_pending:
+            self._events.popleft()
+            PROGRESS_EVENTS_TOTAL.labels(result="dropped").inc()
+        PROGRESS_PENDING.set(len(self._events))
+        if len(self._events) >= self.batch_size:
+            self._batch_ready.set()
+
+    def pending_position(self, session_id: str, story_id: int) -> Optional[PendingPosition]:
+        return self._positions.get((session_id, story_id))
+
+    # Writes everything recorded so far. Returns the number of choice events
+    # written. On failure the batch is put back to be retried by the next flush.
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._events and not self._positions:
+                return 0
+            events, self._events = list(self._events), deque()
+            positions, self._positions = self._positions, {}
+            self._batch_ready.clear()
+
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as db:
+                    if events:
+                        await db.execute(insert(ChoiceEvent), events)
+                    items = list(positions.items())
+                    for start in range(0, len(items), UPSERT_CHUNK_SIZE):  # Bounded bind parameters per statement
+                        await db.execute(_upsert_positions(db.bind.dialect.name, items[start:start + UPSERT_CHUNK_SIZE]))
+                    await db.commit()
+            except Exception:
+                # Newer records (made during the flush) win over the batch
+                self._events.extendleft(reversed(events))
+                while len(self._events) > self.max_pending:
+                    self._events.popleft()
+                    PROGRESS_EVENTS_TOTAL.labels(result="dropped").inc()
+                for key, position in positions.items():
+                    newer = self._positions.get(key)
+                    self._positions[key] = position if newer is None else newer._replace(choices=newer.choices + position.choices)
+                raise
+            finally:
+                PROGRESS_FLUSH_SECONDS.observe(time.perf_counter() - started)
+                PROGRESS_PENDING.set(len(self._events))
+
+            PROGRESS_EVENTS_TOTAL.labels(result="flushed").inc(len(events))
+            return len(events)
+
+    # Flushes every interval, or early when a batch is full, until stop is
+    # set; then flushes what is left
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            batch_ready = asyncio.create_task(self._batch_ready.wait())
+            stopped = asyncio.create_task(stop.wait())
+            await asyncio.wait({batch_ready, stopped}, timeout=settings.PROGRESS_FLUSH_INTERVAL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            batch_ready.cancel()
+            stopped.cancel()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Progress flush failed, retrying with the next batch")
+
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Progress flush on shutdown failed, %s choices lost", len(self._events))
+
+
+# INSERT ... ON CONFLICT (session_id, story_id) DO UPDATE, adding up choices
+def _upsert_positions(dialect_name: str, positions: List[Tuple[ProgressKey, PendingPosition]]):
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = dialect_insert(StoryProgress).values([
+        {
+            "session_id": session_id,
+            "story_id": story_id,
+            "node_id": position.node_id,
+            "choices": position.choices,
+            "updated_at": position.updated_at,
+        }
+        for (session_id, story_id), position in positions
+    ])
+    return statement.on_conflict_do_update(
+        index_elements=[StoryProgress.session_id, StoryProgress.story_id],
+        set_={
+            "node_id": statement.excluded.node_id,
+            "choices": StoryProgress.choices + statement.excluded.choices,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+progress_buffer = ProgressBuffer(batch_size=settings.PROGRESS_FLUSH_BATCH_SIZE, max_pending=settings.PROGRESS_MAX_PENDING)
@@ -0,0 +1,194 @@
+# Prompt building for StoryGenerator: compiled templates, compact output
+# schemas, prompt token counting and the story shape a token budget allows.
+#
+# Format instructions: PydanticOutputParser describes a schema as a full JSON
+# Schema document (titles, descriptions, $defs, required lists), and the
+# recursive scene is opaque there (StoryOptionLLM.nextNode is a Dict[str, Any]
+# so the parsed tree stays plain dicts). compact_format_instructions() writes
+# the same shape as one TypeScript-style line per type, with nextNode typed as
+# the scene it really is:
+#   type StoryNode = {"content": string, "isEnding": boolean, "isWinningEnding": boolean, "options": StoryOption[] | null}
+#   type StoryOption = {"text": string, "nextNode": StoryNode}
+# Parsing still goes through the Pydantic parser, only the prompt changes.
+# PROMPT_COMPACT_SCHEMA=false restores the JSON Schema instructions.
+#
+# Token budget: a request may pass token_budget (completion tokens it is
+# willing to spend). shape_for_budget() picks the largest story shape (levels,
+# options per scene) whose biggest possible tree fits, and the shape is
+# written into STORY_PROMPT.
+#
+# Token counts use tiktoken when it and its encoding file are available,
+# otherwise ~4 characters per token (see benchmark_prompts.py).
+import logging
+import textwrap
+from types import NoneType, UnionType
+from typing import NamedTuple, Optional, Tuple, Type, Union, get_args, get_origin
+
+from pydantic import BaseModel
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from core.config import settings
+from core.models import StoryNodeLLM, StoryOptionLLM
+
+logger = logging.getLogger(__name__)
+
+# Fields whose declared type is looser than what the model must produce
+RECURSIVE_FIELDS = {(StoryOptionLLM, "nextNode"): StoryNodeLLM}
+
+_PRIMITIVES = {str: "string", bool: "boolean", int: "integer", float: "number"}
+
+
+# StoryLLMResponse → Story, StoryNodeLLM → StoryNode
+def _type_name(model: Type[BaseModel]) -> str:
+    return model.__name__.replace("LLMResponse", "").removesuffix("LLM")
+
+
+# definitions: type name → TypeScript-style body, in order of first use
+def _render_type(annotation, definitions: dict) -> str:
+    if annotation in _PRIMITIVES:
+        return _PRIMITIVES[annotation]
+    origin = get_origin(annotation)
+    if origin in (Union, UnionType):
+        args = get_args(annotation)
+        parts = [_render_type(arg, definitions) for arg in args if arg is not NoneType]
+        return " | ".join(parts + (["null"] if NoneType in args else []))
+    if origin is list:
+        item = _render_type(get_args(annotation)[0], definitions)
+        return f"({item})[]" if " " in item else f"{item}[]"
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        _define(annotation, definitions)
+        return _type_name(annotation)
+    return "object"
+
+
+def _define(model: Type[BaseModel], definitions: dict):
+    name = _type_name(model)
+    if name in definitions:
+        return
+    definitions[name] = None  # Reserved first, so recursive references stop here
+    fields = [
+        f'"{field_name}": {_render_type(RECURSIVE_FIELDS.get((model, field_name), field.annotation), definitions)}'
+        for field_name, field in model.model_fields.items()
+    ]
+    definitions[name] = "{" + ", ".join(fields) + "}"
+
+
+def compact_format_instructions(schema: Type[BaseModel]) -> str:
+    definitions = {}
+    _define(schema, definitions)
+    lines = [f"type {name} = {body}" for name, body in definitions.items()]
+    return (
+        f"The output must be one JSON object of type {_type_name(schema)}, "
+        "using these TypeScript-style types (T[] is a list of T):\n" + "\n".join(lines)
+    )
+
+
+# Prompt templates and parsers are built once per process: constructing the
+# template and rendering the format instructions costs more than filling in
+# the variables of a request.
+class CompiledPrompt(NamedTuple):
+    template: ChatPromptTemplate
+    parser: PydanticOutputParser
+
+    async def render(self, **values):
+        return await self.template.ainvoke(values)
+
+
+def compile_prompt(system: str, human: str, schema: Type[BaseModel], **partials) -> CompiledPrompt:
+    parser = PydanticOutputParser(pydantic_object=schema)
+    if settings.PROMPT_COMPACT_SCHEMA:
+        format_instructions = compact_format_instructions(schema)
+    else:
+        format_instructions = parser.get_format_instructions()
+    template = ChatPromptTemplate.from_messages([
+        ("system", textwrap.dedent(system).strip()),  # The source indentation is tokens too
+        ("human", human),
+    ]).partial(format_instructions=format_instructions, **partials)
+    return CompiledPrompt(template, parser)
+
+
+# Tokenizer of LLM_MODEL, loaded on first use. None: not installed, or its
+# encoding file can't be fetched (offline).
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.info("tiktoken unavailable (%s), estimating tokens from length", e)
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+def prompt_tokens(prompt_value) -> int:
+    return sum(count_tokens(message.content) for message in prompt_value.to_messages())
+
+
+# Levels (root = 1) and options per scene, each as an inclusive range
+class StoryShape(NamedTuple):
+    levels: Tuple[int, int]
+    options: Tuple[int, int]
+
+    # Scenes of the biggest tree the shape allows
+    @property
+    def max_nodes(self) -> int:
+        return sum(self.options[1] ** level for level in range(self.levels[1]))
+
+    # Variables of STORY_PROMPT
+    def prompt_values(self) -> dict:
+        return {"levels": _range_text(self.levels), "options_per_node": _range_text(self.options)}
+
+    # Part of the story cache key: the theme cache only shares stories of one shape
+    @property
+    def cache_variant(self) -> str:
+        return "" if self == DEFAULT_STORY_SHAPE else f"{_range_text(self.levels)}x{_range_text(self.options)}"
+
+
+def _range_text(bounds: Tuple[int, int]) -> str:
+    return str(bounds[0]) if bounds[0] == bounds[1] else f"{bounds[0]}-{bounds[1]}"
+
+
+# What STORY_PROMPT asked for before budgets existed, and still does without one
+DEFAULT_STORY_SHAPE = StoryShape(levels=(3, 4), options=(2, 3))
+
+# Largest first
+STORY_SHAPES = sorted(
+    [
+        DEFAULT_STORY_SHAPE,
+        StoryShape(levels=(3, 4), options=(2, 2)),
+        StoryShape(levels=(3, 3), options=(2, 3)),
+        StoryShape(levels=(3, 3), options=(2, 2)),
+        StoryShape(levels=(2, 2), options=(2, 3)),
+        StoryShape(levels=(2, 2), options=(2, 2)),
+    ],
+    key=lambda shape: shape.max_nodes,
+    reverse=True,
+)
+
+# Completion tokens per scene, JSON syntax included
+TOKENS_PER_NODE = 90
+
+
+def shape_for_budget(token_budget: Optional[int]) -> StoryShape:
+    if token_budget is None:
+        return DEFAULT_STORY_SHAPE
+    for shape in STORY_SHAPES:
+        if shape.max_nodes * TOKENS_PER_NODE <= token_budget:
+            return shape
+    return STORY_SHAPES[-1]
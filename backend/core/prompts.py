@@ -1,48 +1,112 @@
+# Prompts are dedented when compiled (core/prompt_builder.py), and
+# {format_instructions} is filled with the compact schema of the response.
+#
+# {levels} and {options_per_node} come from the request's story shape
+# (prompt_builder.shape_for_budget): "3-4" and "2-3" without a token budget.
 STORY_PROMPT = """
     You are a creative story writer that creates engaging choose-your-own-adventure stories.
-    Generate a complete branching story with multiple apths and endings in the JSON format I'll specify.
+    Generate a complete branching story with multiple paths and endings in the JSON format I'll specify.
 
     The story should have:
     1. A compelling title
-    2. A starting situation (root node) with 2-3 options
-    3. Each option should lead to another node with its opwn options
+    2. A starting situation (root node) with {options_per_node} options
+    3. Each option should lead to another node with its own options
     4. Some paths should lead to positive endings, others to negative endings
-    5. At least one path should lead to a winnong ending
+    5. At least one path should lead to a winning ending
 
     Story structure requirements:
-    -  Each node should have 2-3 options except for ending nodes
-    - The story should be 3-4 levels deep (including root node)
+    - Each node should have {options_per_node} options except for ending nodes
+    - The story should be {levels} levels deep (including root node)
     - Add variety in the path lengths (some end earlier, some later)
     - Make sure there's at least one winning path
 
     Output your story in this exact JSON structure:
     {format_instructions}
 
-    Don't simplify or omit any part of thestory structure.
+    Don't simplify or omit any part of the story structure.
     Don't add any text outside of the JSON structure.
 """
 
-json_structure = """
-    {
-        "title": "Story Title",
-        "rootNode": {
-            "content": "The starting situation of the story.",
-            "isEnding": false,
-            "isWinningEnding": false,
-            "options": [
-                {
-                    "text": "Option 1 text",
-                    "nextNode": {
-                        "content": "The situation after choosing option 1.",
-                        "isEnding": false,
-                        "isWinningEnding": false,
-                        "options": [
-                            // Further nested options and nodes
-                        ]
-                    }
-                },
-                // More options at this level
-            ]
-        }
-    }
-"""
\ No newline at end of file
+# Incremental generation (GENERATION_MODE=incremental): the first call only
+# writes the opening scene and its choices; every further scene is written
+# when a player is about to reach it (see core/story_expander.py).
+OUTLINE_PROMPT = """
+    You are a creative story writer that creates engaging choose-your-own-adventure stories.
+    Write the title and the opening scene of a branching story in the JSON format I'll specify.
+
+    The opening scene should:
+    1. Set up a compelling situation for the player
+    2. End with 2-3 options for what the player does next
+    3. Not be an ending
+
+    Only write the options' text; the scenes they lead to are written later.
+
+    Output your story in this exact JSON structure:
+    {format_instructions}
+
+    Don't add any text outside of the JSON structure.
+"""
+
+EXPAND_PROMPT = """
+    You are a creative story writer continuing a choose-your-own-adventure story.
+    Write the next scene, following from the player's latest choice, in the JSON format I'll specify.
+
+    The scene should:
+    1. Continue naturally from the story so far and the choice the player made
+    2. Either end the story (positive or negative ending) or offer 2-3 new options
+    3. Be a winning ending only if the player achieved their goal
+
+    Only write the options' text; the scenes they lead to are written later.
+    {ending_guidance}
+
+    Output the scene in this exact JSON structure:
+    {format_instructions}
+
+    Don't add any text outside of the JSON structure.
+"""
+
+# Fan-out generation (GENERATION_MODE=fanout): after the opening scene is
+# written with OUTLINE_PROMPT, every choice's subtree is written by its own
+# concurrent call with this prompt.
+BRANCH_PROMPT = """
+    You are a creative story writer that creates engaging choose-your-own-adventure stories.
+    Continue a branching story from the choice the player made, in the JSON format I'll specify.
+
+    The branch should have:
+    1. A first node describing what happens after the player's choice
+    2. Each non-ending node should have 2-3 options leading to further nodes
+    3. Some paths should lead to positive endings, others to negative endings
+    4. At least one path should lead to a winning ending
+
+    Branch structure requirements:
+    - The branch should be 2-3 levels deep (including its first node)
+    - Add variety in the path lengths (some end earlier, some later)
+    - Every path must finish with an ending node
+
+    Output the branch in this exact JSON structure:
+    {format_instructions}
+
+    Don't simplify or omit any part of the branch structure.
+    Don't add any text outside of the JSON structure.
+"""
+
+# Story repair (core/story_repair.py): rewrites one subtree of a generated
+# story that came back malformed, given the scenes and choices leading to it.
+REPAIR_PROMPT = """
+    You are a creative story writer that creates engaging choose-your-own-adventure stories.
+    Part of a branching story is missing. Write the part that follows the player's last choice, in the JSON format I'll specify.
+
+    The part should have:
+    1. A first node describing what happens after the player's last choice
+    2. Each non-ending node should have 2-3 options leading to further nodes
+    3. Endings that fit the story so far, positive or negative
+
+    Structure requirements:
+    - {depth_guidance}
+    - Every path must finish with an ending node
+
+    Output it in this exact JSON structure:
+    {format_instructions}
+
+    Don't add any text outside of the JSON structure.
+"""
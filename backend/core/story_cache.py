@@ -0,0 +1,111 @@
+# Theme-keyed cache and single-flight coalescing in front of the LLM.
+# Many users submit the same theme ("space pirates", "haunted castle") within
+# seconds of each other; they should cost one OpenAI call, not one each.
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Tuple
+
+from core.config import settings
+from core.models import StoryLLMResponse
+
+# Request flow:
+# theme → normalize_theme() → cached & fresh?  → hit: reuse structure
+#                                  ↓ no
+#                           generation in flight? → coalesced: await it
+#                                  ↓ no
+#                           miss: call the LLM, publish result to waiters + cache
+class StoryCache:
+
+    def __init__(self, enabled: bool, max_entries: int, ttl_seconds: int):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, StoryLLMResponse]]" = OrderedDict()  # LRU order
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    # "  Space   Pirates!" and "space pirates" are the same request
+    @staticmethod
+    def normalize_theme(theme: str) -> str:
+        theme = re.sub(r"[^\w\s]", " ", theme.lower())
+        return " ".join(theme.split())
+
+    def _get_fresh(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, structure = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return structure
+
+    def _store(self, key: str, structure: StoryLLMResponse):
+        self._entries[key] = (time.monotonic(), structure)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    # The returned structure is shared read-only between callers; persisting
+    # it (StoryGenerator._persist_story) creates per-session rows.
+    # `variant` separates requests for the same theme that must not share a
+    # story (e.g. a smaller story shape, core/prompt_builder.py)
+    async def get_or_generate(self, theme: str, generate: Callable[[], Awaitable[StoryLLMResponse]], variant: str = "") -> StoryLLMResponse:
+        if not self.enabled:
+            return await generate()
+
+        key = self.normalize_theme(theme) + (f"|{variant}" if variant else "")
+        structure = self._get_fresh(key)
+        if structure is not None:
+            self.hits += 1
+            return structure
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            # shield: a cancelled waiter must not cancel the shared generation
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved even when nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        try:
+            structure = await generate()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._in_flight[key]
+
+        self._store(key, structure)
+        future.set_result(structure)
+        return structure
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "llm_calls_saved": self.hits + self.coalesced,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+story_cache = StoryCache(
+    enabled=settings.STORY_CACHE_ENABLED,
+    max_entries=settings.STORY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.STORY_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,84 @@
+# On-demand expansion of incrementally generated stories (GENERATION_MODE=incremental).
+# A story starts as its opening scene plus placeholder nodes for the choices;
+# a placeholder is written (StoryGenerator.expand_node) when a player reaches
+# it, and the choices of the scene a player is reading are expanded in the
+# background so the next click is usually already written.
+#
+# Request flow (GET /stories/{story_id}/nodes/{node_id}):
+# node is a placeholder? → expand(node) and wait for it
+#      ↓
+# speculate(unwritten children) → background expansions, response sent now
+import asyncio
+import logging
+from typing import Dict, Iterable, Set
+
+from core.config import settings
+from core.story_generator import StoryGenerator
+from db.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class StoryExpander:
+
+    def __init__(self, max_speculative: int):
+        self.max_speculative = max_speculative
+        self._in_flight: Dict[int, asyncio.Task] = {}  # node_id → expansion
+        self._speculative: Set[asyncio.Task] = set()
+        self.expansions = 0
+        self.coalesced = 0
+        self.speculative_started = 0
+        self.speculative_skipped = 0
+
+    def _start(self, node_id: int) -> asyncio.Task:
+        task = self._in_flight.get(node_id)
+        if task is None:
+            task = asyncio.create_task(self._expand(node_id))
+            self._in_flight[node_id] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(node_id, None))
+        return task
+
+    async def _expand(self, node_id: int):
+        async with AsyncSessionLocal() as db:
+            if await StoryGenerator.expand_node(db, node_id):
+                self.expansions += 1
+
+    # Waits until the node is written. A node already being written (for
+    # another player or speculatively) is waited for instead of written twice.
+    async def expand(self, node_id: int):
+        if node_id in self._in_flight:
+            self.coalesced += 1
+        # shield: a disconnected client must not cancel a shared expansion
+        await asyncio.shield(self._start(node_id))
+
+    # Starts background expansions without waiting for them. Best effort:
+    # skipped once max_speculative are running, so bursts of readers cannot
+    # queue up LLM calls nobody may need.
+    def speculate(self, node_ids: Iterable[int]):
+        for node_id in node_ids:
+            if node_id in self._in_flight:
+                continue
+            if len(self._speculative) >= self.max_speculative:
+                self.speculative_skipped += 1
+                continue
+
+            task = self._start(node_id)
+            self.speculative_started += 1
+            self._speculative.add(task)
+            task.add_done_callback(self._speculation_done)
+
+    def _speculation_done(self, task: asyncio.Task):
+        self._speculative.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.warning("Speculative expansion failed: %s", task.exception())
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._in_flight),
+            "expansions": self.expansions,
+            "coalesced": self.coalesced,
+            "speculative_started": self.speculative_started,
+            "speculative_skipped": self.speculative_skipped,
+        }
+
+story_expander = StoryExpander(max_speculative=settings.MAX_SPECULATIVE_EXPANSIONS)
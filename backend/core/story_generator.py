@@ -1,20 +1,56 @@
 # This file is the core AI component that generates interactive stories using LangChain and OpenAI. It converts user themes into complete branching narratives.
-from sqlalchemy.orm import Session
+import time
+import asyncio
+import logging
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import select, insert, update, delete, func, text, false, case, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
 
-from core.prompts import STORY_PROMPT
-from models.story import Story, StoryNode
-from core.models import StoryLLMResponse, StoryNodeLLM # AI response schemas
+from core.prompts import STORY_PROMPT, OUTLINE_PROMPT, EXPAND_PROMPT, BRANCH_PROMPT, REPAIR_PROMPT
+from core.config import settings
+from core.llm_provider import llm_provider
+from core.prompt_builder import StoryShape, DEFAULT_STORY_SHAPE, compile_prompt, shape_for_budget
+from core.metrics import STAGE_SECONDS, LLM_CALLS_TOTAL, LLM_IN_FLIGHT, STORY_REPAIRS_TOTAL, record_token_usage, record_story_repair
+from models.story import Story, StoryNode, StoryOption, StorySignature
+from core.models import StoryLLMResponse, StoryNodeLLM, StoryOptionLLM, StoryOutlineLLM, StoryStepLLM # AI response schemas
+from core.story_cache import story_cache
+from core.story_payload import make_story_payload
+from core.story_stats import make_story_stats, add_story_stats
+from core.story_graph import compute_node_metadata
+from core.story_repair import SalvagedStory, StoryHole, salvage_story, parse_subtree
+from core.story_streaming import StreamingStoryWriter
+from core.similarity_index import similarity_index, compute_signature, pack_signature
+from db.story_repository import select_path
 
 load_dotenv()  # Load environment variables from .env file
 
+logger = logging.getLogger(__name__)
+
+# Compiled once per process (see core/llm_provider.py)
+STORY_TEMPLATE = compile_prompt(STORY_PROMPT, "Create a story with the theme: {theme}", StoryLLMResponse)
+OUTLINE_TEMPLATE = compile_prompt(OUTLINE_PROMPT, "Create a story with the theme: {theme}", StoryOutlineLLM)
+STEP_TEMPLATE = compile_prompt(
+    EXPAND_PROMPT,
+    "Story title: {title}\n\nStory so far:\n{story_so_far}\n\nWrite the next scene.",
+    StoryStepLLM,
+)
+BRANCH_TEMPLATE = compile_prompt(
+    BRANCH_PROMPT,
+    "Story title: {title}\n\nOpening scene: {opening}\n\nThe player chose: {choice}\n\nWrite the branch that follows this choice.",
+    StoryNodeLLM,
+)
+REPAIR_TEMPLATE = compile_prompt(
+    REPAIR_PROMPT,
+    "Story title: {title}\n\nStory so far:\n{story_so_far}\n\nWrite the part of the story that follows the player's last choice.",
+    StoryNodeLLM,
+)
+
 # Call chain
-# User submits theme → routers/story.py → Background task → StoryGenerator.generate_story() → Database
+# User submits theme → routers/story.py → Background task → StoryGenerator.generate_story() → similarity_index / story_cache → Database
 
 # Data flow
 # Theme → AI Prompt → OpenAI Response → Structured Data → Database Records → API Response
@@ -32,40 +68,337 @@ load_dotenv()  # Load environment variables from .env file
 # └── Node 5 (ending): "You get captured!"
 class StoryGenerator:
 
+    # Long-lived model of the configured provider (LLM_PROVIDER), shared by all jobs
     @classmethod
     def _get_llm(cls):
-        return ChatOpenAI(
-            model_name="gpt-4o-mini",
-            temperature=0.7,
-        )
+        return llm_provider.get_llm()
     
     # Integration point:
     # Called from: story.py background task
     # Input: Database session, user session, story theme
     # Output: Complete Story object with all nodes saved to database
+    # Fully async: the OpenAI call and every DB round trip are awaited, so an
+    # in-flight generation costs a coroutine instead of a threadpool thread.
     @classmethod
-    def generate_story(cls, db: Session, session_id: str, theme: "fantasy") -> Story:
-        llm = cls._get_llm()
-        # AI Prompt Engineering
-        story_parser = PydanticOutputParser(pydantic_object=StoryLLMResponse)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", STORY_PROMPT),
-            ("human", f"Create a story with the theme: {theme}"),
-        ]).partial(format_instructions=story_parser.get_format_instructions())
+    async def generate_story(
+        cls,
+        db: AsyncSession,
+        session_id: str,
+        theme: "fantasy",
+        allow_similar: bool = True,
+        on_progress: Optional[Callable[[Story, int], None]] = None,
+        token_budget: Optional[int] = None,
+    ) -> Story:
+        # Levels and options per scene the whole-story prompt asks for
+        # (single and streaming modes, see core/prompt_builder.py)
+        shape = shape_for_budget(token_budget if token_budget is not None else settings.STORY_TOKEN_BUDGET)
+
+        # A sufficiently similar existing story is copied instead of calling
+        # OpenAI, unless a budget asks for a smaller one than stories usually are
+        if allow_similar and settings.SIMILARITY_ENABLED and shape == DEFAULT_STORY_SHAPE:
+            await similarity_index.sync(db)
+            match = similarity_index.query(theme)
+            if match:
+                story_structure = await cls._load_structure(db, match[0])
+                if story_structure:
+                    return await cls._persist_story(db, session_id, story_structure, on_progress=on_progress)
+
+        # Only the opening scene is written now; the rest is written as it is
+        # played, so there is no finished structure to cache or index.
+        if settings.GENERATION_MODE == "incremental":
+            outline = await cls._generate_outline(theme)
+            return await cls._persist_outline(db, session_id, outline, on_progress=on_progress)
+
+        # Identical themes share one LLM call (in flight or recently completed);
+        # every session still gets its own copy of the story rows.
+        if settings.GENERATION_MODE == "streaming":
+            # The request that actually calls the LLM persists nodes while they
+            # stream in; coalesced requests copy the finished structure.
+            streamed = {}
+
+            async def stream():
+                streamed["story"], structure = await cls._stream_story(db, session_id, theme, on_progress, shape)
+                return structure
+
+            story_structure = await story_cache.get_or_generate(theme, stream, variant=shape.cache_variant)
+            if "story" in streamed:
+                return streamed["story"]
+        elif settings.GENERATION_MODE == "fanout":
+            story_structure = await story_cache.get_or_generate(theme, lambda: cls._generate_fanout_structure(theme))
+        else:
+            story_structure = await story_cache.get_or_generate(theme, lambda: cls._generate_structure(theme, shape), variant=shape.cache_variant)
+        return await cls._persist_story(db, session_id, story_structure, theme=theme, shape=shape, on_progress=on_progress)
+
+    # AI Prompt Engineering
+    @classmethod
+    async def _build_prompt(cls, theme: str, shape: StoryShape = DEFAULT_STORY_SHAPE):
+        return await STORY_TEMPLATE.render(theme=theme, **shape.prompt_values()), STORY_TEMPLATE.parser
+
+    # AI Communication: Prompt → OpenAI API → Raw Response → Text Extraction → Structured Data
+    # With STORY_REPAIR_ENABLED the response is parsed tolerantly
+    # (core/story_repair.py): valid scenes are kept and only the subtrees that
+    # failed validation are requested again, instead of failing the job.
+    @classmethod
+    async def _generate_structure(cls, theme: str, shape: StoryShape = DEFAULT_STORY_SHAPE) -> StoryLLMResponse:
+        prompt_value, story_parser = await cls._build_prompt(theme, shape)
+        if not settings.STORY_REPAIR_ENABLED:
+            return await cls._invoke(prompt_value, story_parser)
 
-        # AI Communication: Prompt → OpenAI API → Raw Response → Text Extraction → Structured Data
-        raw_response = llm.invoke(prompt.invoke({}))
+        response_text, usage_metadata = await cls._complete(prompt_value)
+        with STAGE_SECONDS.labels(stage="parse").time():
+            salvaged = salvage_story(response_text)
+        if salvaged.holes:
+            await cls._repair_story(salvaged, usage_metadata, shape.levels[1])
+        return StoryLLMResponse.model_validate(salvaged.data)
+
+    # One LLM request, timed (llm stage) and counted per prompt kind.
+    # Returns the response text and its usage_metadata.
+    @classmethod
+    async def _complete(cls, prompt_value, kind: str = "story") -> Tuple[str, Optional[dict]]:
+        llm = cls._get_llm()
+        LLM_CALLS_TOTAL.labels(kind=kind).inc()
+        with STAGE_SECONDS.labels(stage="llm").time(), LLM_IN_FLIGHT.track_inprogress():
+            raw_response = await llm.ainvoke(prompt_value)
+        usage_metadata = getattr(raw_response, "usage_metadata", None)
+        record_token_usage(usage_metadata)
 
         response_text = raw_response
         if hasattr(raw_response, 'content'):
             response_text = raw_response.content
+        return response_text, usage_metadata
+
+    # One LLM request parsed into `parser`'s schema (parse stage timed)
+    @classmethod
+    async def _invoke(cls, prompt_value, parser, kind: str = "story"):
+        response_text, _ = await cls._complete(prompt_value, kind)
+        with STAGE_SECONDS.labels(stage="parse").time():
+            return parser.parse(response_text) # Convert JSON to Python objects
+
+    # Fills the holes of a salvaged story in place, each with its own request
+    # (at most FANOUT_PARALLELISM at once). Raises if a hole can't be filled
+    # in STORY_REPAIR_ATTEMPTS tries, so the job is retried as before.
+    # Tokens saved: what the original request cost (a full regeneration costs
+    # about the same again) minus what the repair requests cost.
+    @classmethod
+    async def _repair_story(cls, salvaged: SalvagedStory, usage_metadata: Optional[dict], max_levels: int):
+        if len(salvaged.holes) > settings.STORY_REPAIR_MAX_HOLES:
+            STORY_REPAIRS_TOTAL.labels(result="too_many_holes").inc()
+            raise ValueError(f"Story response has {len(salvaged.holes)} invalid subtrees, too many to repair")
+
+        logger.info("Repairing %d invalid subtrees of %r (%d valid scenes kept)",
+                    len(salvaged.holes), salvaged.data["title"], salvaged.valid_nodes)
+        parallelism = asyncio.Semaphore(settings.FANOUT_PARALLELISM)
+        attempts = 0
+        repair_tokens = 0
+
+        async def repair(hole: StoryHole) -> bool:
+            nonlocal attempts, repair_tokens
+            prompt_value = await REPAIR_TEMPLATE.render(
+                title=salvaged.data["title"],
+                story_so_far=cls._story_so_far(hole.path),
+                depth_guidance=cls._repair_depth_guidance(max_levels - len(hole.path)),
+            )
+            async with parallelism:
+                for attempt in range(1, settings.STORY_REPAIR_ATTEMPTS + 1):
+                    attempts += 1
+                    response_text, repair_usage = await cls._complete(prompt_value, kind="repair")
+                    repair_tokens += cls._total_tokens(repair_usage)
+                    try:
+                        hole.option["nextNode"] = parse_subtree(response_text)
+                        return True
+                    except ValueError as e:
+                        logger.warning("Repair of %r failed on attempt %s: %s", hole.path[-1][1], attempt, e)
+            return False
+
+        repaired = all(await asyncio.gather(*(repair(hole) for hole in salvaged.holes)))
+        tokens_saved = max(0, cls._total_tokens(usage_metadata) - repair_tokens) if repaired else 0
+        record_story_repair(attempts, tokens_saved)
+        STORY_REPAIRS_TOTAL.labels(result="repaired" if repaired else "failed").inc()
+        if not repaired:
+            raise ValueError("Story response could not be repaired")
+
+    @staticmethod
+    def _total_tokens(usage_metadata: Optional[dict]) -> int:
+        if not usage_metadata:
+            return 0
+        return usage_metadata.get("input_tokens", 0) + usage_metadata.get("output_tokens", 0)
+
+    # A hole may use the levels the story's shape has left below it
+    @staticmethod
+    def _repair_depth_guidance(levels: int) -> str:
+        if levels <= 1:
+            return "The first node must be an ending: set isEnding to true and give no options."
+        return f"The part should be at most {levels} levels deep (including its first node)."
+
+    # "Scene 1: ...\nThe player chose: ..." for every (scene, choice) of a path
+    @staticmethod
+    def _story_so_far(path: List[Tuple[str, str]]) -> str:
+        return "\n".join(
+            f"Scene {index + 1}: {content}\nThe player chose: {choice}"
+            for index, (content, choice) in enumerate(path)
+        )
+
+    # Incremental generation, first call: title + opening scene + choices
+    @classmethod
+    async def _generate_outline(cls, theme: str) -> StoryOutlineLLM:
+        outline = await cls._invoke(await OUTLINE_TEMPLATE.render(theme=theme), OUTLINE_TEMPLATE.parser, kind="outline")
+
+        outline.rootNode = cls._normalize_step(outline.rootNode)
+        if outline.rootNode.isEnding:
+            raise ValueError("The opening scene has no options")
+        return outline
+
+    # Fan-out generation: opening scene first, then every choice's subtree
+    # concurrently (at most FANOUT_PARALLELISM at once), stitched into the same
+    # StoryLLMResponse a single call returns. Wall-clock time is roughly the
+    # outline plus the slowest branch instead of the whole tree in sequence.
+    # A branch that keeps failing is dropped with its option; the story only
+    # fails if every branch does.
+    @classmethod
+    async def _generate_fanout_structure(cls, theme: str) -> StoryLLMResponse:
+        outline = await cls._generate_outline(theme)
+        root = outline.rootNode
+        parallelism = asyncio.Semaphore(settings.FANOUT_PARALLELISM)
+
+        async def generate(option_text: str) -> Optional[StoryNodeLLM]:
+            async with parallelism:
+                for attempt in range(1, settings.FANOUT_BRANCH_ATTEMPTS + 1):
+                    try:
+                        return await cls._generate_branch(outline.title, root.content, option_text)
+                    except Exception as e:
+                        logger.warning("Branch %r failed on attempt %s: %s", option_text, attempt, e)
+            return None
+
+        branches = await asyncio.gather(*(generate(option.text) for option in root.options))
+        options = [
+            StoryOptionLLM(text=option.text, nextNode=branch.model_dump())
+            for option, branch in zip(root.options, branches)
+            if branch is not None
+        ]
+        if not options:
+            raise ValueError("Every branch of the story failed to generate")
+
+        return StoryLLMResponse(
+            title=outline.title,
+            rootNode=StoryNodeLLM(content=root.content, isEnding=False, isWinningEnding=False, options=options),
+        )
+
+    @classmethod
+    async def _generate_branch(cls, title: str, opening: str, option_text: str) -> StoryNodeLLM:
+        prompt_value = await BRANCH_TEMPLATE.render(title=title, opening=opening, choice=option_text)
+        return await cls._invoke(prompt_value, BRANCH_TEMPLATE.parser, kind="branch")
+
+    # Incremental generation, every later call: the scene reached through the
+    # last choice of `path` ([(scene content, choice taken), ...], root first)
+    @classmethod
+    async def _generate_step(cls, title: str, path: List[Tuple[str, str]], depth: int) -> StoryStepLLM:
+        if depth >= settings.INCREMENTAL_MAX_DEPTH:
+            ending_guidance = "This scene must be an ending: set isEnding to true and give no options."
+        elif depth >= settings.INCREMENTAL_TARGET_DEPTH:
+            ending_guidance = "The story is getting long: prefer an ending unless the plot clearly needs another choice."
+        else:
+            ending_guidance = "The story has only just begun: endings this early should be rare."
 
-        story_structure = story_parser.parse(response_text) # Convert JSON to Python objects
+        prompt_value = await STEP_TEMPLATE.render(title=title, story_so_far=cls._story_so_far(path), ending_guidance=ending_guidance)
+        step = await cls._invoke(prompt_value, STEP_TEMPLATE.parser, kind="step")
 
-        # Database Story Creation
+        if depth >= settings.INCREMENTAL_MAX_DEPTH:
+            step.isEnding = True
+        return cls._normalize_step(step)
+
+    # A scene is either an ending without options or a choice with options
+    @classmethod
+    def _normalize_step(cls, step: StoryStepLLM) -> StoryStepLLM:
+        if step.isEnding or not step.options:
+            step.isEnding = True
+            step.options = None
+        else:
+            step.isWinningEnding = False
+        return step
+
+    # Streaming AI Communication: Prompt → OpenAI token stream → partial JSON → nodes persisted as they complete
+    # The story row is created with is_complete=False and flipped once the
+    # full response has been validated; a failed stream removes what it wrote.
+    @classmethod
+    async def _stream_story(cls, db: AsyncSession, session_id: str, theme: str, on_progress=None, shape: StoryShape = DEFAULT_STORY_SHAPE) -> Tuple[Story, StoryLLMResponse]:
+        llm = cls._get_llm()
+        prompt_value, story_parser = await cls._build_prompt(theme, shape)
+        writer = StreamingStoryWriter(db, session_id, on_progress)
+
+        LLM_CALLS_TOTAL.labels(kind="story").inc()
+        started = time.perf_counter()
+        try:
+            response_text = ""
+            async for chunk in llm.astream(prompt_value):
+                record_token_usage(getattr(chunk, "usage_metadata", None))  # Sent with the last chunk
+                chunk_text = chunk.content if hasattr(chunk, "content") else chunk
+                response_text += chunk_text
+                # Values only complete at a separator, skip re-parsing otherwise
+                if "," in chunk_text or "}" in chunk_text:
+                    try:
+                        partial = parse_json_markdown(response_text, parser=parse_partial_json)
+                    except ValueError:
+                        continue
+                    await writer.feed(partial)
+
+            # Persisting overlaps the stream, so the whole stream counts as llm
+            STAGE_SECONDS.labels(stage="llm").observe(time.perf_counter() - started)
+            with STAGE_SECONDS.labels(stage="parse").time():
+                story_structure = story_parser.parse(response_text) # Convert JSON to Python objects
+            await writer.feed(story_structure.model_dump(), final=True)
+        except Exception:
+            await db.rollback()
+            if writer.story is not None:
+                await cls._delete_story(db, writer.story.id)
+            raise
+
+        writer.story.is_complete = True
+        metadata = compute_node_metadata(writer.node_rows)
+        for node in writer.node_rows:
+            for column, value in metadata.get(node.id, {}).items():
+                setattr(node, column, value)
+        cls._add_story_artifacts(db, writer.story, writer.node_rows, theme, shape)
+        await db.commit()
+        return writer.story, story_structure
+
+    # Removes a partially streamed story
+    @classmethod
+    async def _delete_story(cls, db: AsyncSession, story_id: int):
+        await db.execute(delete(StoryOption).where(StoryOption.story_id == story_id))
+        await db.execute(delete(StoryNode).where(StoryNode.story_id == story_id))
+        await db.execute(delete(Story).where(Story.id == story_id))
+        await db.commit()
+
+    # Rows derived from a finished story: its near-duplicate signature (only
+    # when the theme is given), the precomputed complete-story payload and
+    # its analytics row. Stories of a smaller shape than the default (a token
+    # budget) get no signature: similarity reuse serves default-shape requests.
+    @classmethod
+    def _add_story_artifacts(cls, db: AsyncSession, story_db: Story, node_rows, theme: Optional[str] = None,
+                             shape: StoryShape = DEFAULT_STORY_SHAPE):
+        if theme and shape == DEFAULT_STORY_SHAPE:
+            db.add(StorySignature(
+                story_id=story_db.id,
+                theme=theme,
+                theme_signature=pack_signature(compute_signature(theme)),
+                title_signature=pack_signature(compute_signature(story_db.title)),
+            ))
+
+        # Serialize the complete-story response once, while all nodes are in memory
+        db.add(make_story_payload(story_db, node_rows))
+        db.add(make_story_stats(story_db.id, node_rows))
+
+    # Database Story Creation
+    # Only reads story_structure, so a cached structure can be persisted for
+    # any number of sessions. Passing the theme indexes the story for
+    # near-duplicate reuse; copies of an indexed story are not indexed again.
+    @classmethod
+    async def _persist_story(cls, db: AsyncSession, session_id: str, story_structure: StoryLLMResponse, theme: str = None,
+                             shape: StoryShape = DEFAULT_STORY_SHAPE, on_progress=None) -> Story:
+        started = time.perf_counter()
         story_db = Story(title=story_structure.title, session_id=session_id)
         db.add(story_db)
-        db.flush()  # To get the story ID
+        await db.flush()  # To get the story ID
 
         # Root Node Processing Setup
         root_node_data = story_structure.rootNode
@@ -73,41 +406,262 @@ class StoryGenerator:
         if isinstance(root_node_data, dict):
             root_node_data = StoryNodeLLM(**root_node_data)
 
-        cls._process_story_node(db, story_db.id, root_node_data, is_root=True)
+        # Bulk Node Insert: IDs are known before writing, so every node's
+        # options can reference its children and all rows go out in a single
+        # INSERT instead of an add + two flushes per node.
+        flat_nodes = cls._flatten_story_tree(root_node_data)
+        node_ids = await cls._allocate_node_ids(db, len(flat_nodes))
 
-        db.commit()
+        node_rows = [
+            {
+                "id": node_ids[index],
+                "story_id": story_db.id,
+                "content": node_data.content,
+                "is_root": index == 0,
+                "is_ending": node_data.isEnding,
+                "is_winning_ending": node_data.isWinningEnding,
+                "options": [
+                    {"text": text, "node_id": node_ids[child_index]}
+                    for text, child_index in options
+                ],
+            }
+            for index, (node_data, options) in enumerate(flat_nodes)
+        ]
+        # Graph metadata of every node in one pass over the new rows
+        metadata = compute_node_metadata(node_rows)
+        for node_row in node_rows:
+            node_row.update(metadata[node_row["id"]])
+        await db.execute(insert(StoryNode), node_rows)
+        edges = [
+            {
+                "story_id": story_db.id,
+                "from_node_id": node_ids[index],
+                "to_node_id": node_ids[child_index],
+                "position": position,
+                "text": text,
+            }
+            for index, (_, options) in enumerate(flat_nodes)
+            for position, (text, child_index) in enumerate(options)
+        ]
+        if edges:
+            await db.execute(insert(StoryOption), edges)
+
+        cls._add_story_artifacts(db, story_db, node_rows, theme, shape)
+        if on_progress:
+            on_progress(story_db, len(node_rows))
+
+        await db.commit()
+        STAGE_SECONDS.labels(stage="persist").observe(time.perf_counter() - started)
         return story_db
     
-    #  Node Processing Engine
-    # Converts AI-generated node data into database records
-    @classmethod
-    def _process_story_node(cls, db: Session, story_id: int, node_data: StoryNodeLLM, is_root: bool = False) -> StoryNode:
-        node = StoryNode(
-            story_id=story_id,
-            content=node_data.content if hasattr(node_data, "content") else node_data["content"],
-            is_root=is_root,
-            is_ending=node_data.isEnding if hasattr(node_data, "isEnding") else node_data["isEnding"],
-            is_winning_ending=node_data.isWinningEnding if hasattr(node_data, "isWinningEnding") else node_data["isWinningEnding"],
-            options=[]
+    # Incremental Story Creation: the opening scene plus one placeholder node
+    # per choice (is_expanded=False), written later by expand_node()
+    @classmethod
+    async def _persist_outline(cls, db: AsyncSession, session_id: str, outline: StoryOutlineLLM, on_progress=None) -> Story:
+        started = time.perf_counter()
+        story_db = Story(title=outline.title, session_id=session_id, is_complete=False)
+        db.add(story_db)
+        await db.flush()  # To get the story ID
+
+        root_id, *child_ids = await cls._allocate_node_ids(db, 1 + len(outline.rootNode.options))
+        options, placeholders, edges = cls._placeholder_rows(story_db.id, root_id, outline.rootNode, child_ids, depth=1)
+        root_row = {
+            "id": root_id,
+            "story_id": story_db.id,
+            "content": outline.rootNode.content,
+            "is_root": True,
+            "is_ending": False,
+            "is_winning_ending": False,
+            "options": options,
+            "is_expanded": True,
+            "depth": 0,
+            "subtree_size": 1 + len(placeholders),
+            "reachable_endings": 0,
+            "reachable_winning_endings": 0,
+            "winning_distance": None,
+        }
+        await db.execute(insert(StoryNode), [root_row, *placeholders])
+        await db.execute(insert(StoryOption), edges)
+
+        if on_progress:
+            on_progress(story_db, 1)
+        await db.commit()
+        STAGE_SECONDS.labels(stage="persist").observe(time.perf_counter() - started)
+        return story_db
+
+    # Writes the scene of placeholder `node_id` and adds placeholders for its
+    # choices. Returns False if the node does not exist or was already written
+    # (by a concurrent request or another process).
+    @classmethod
+    async def expand_node(cls, db: AsyncSession, node_id: int) -> bool:
+        path = (await db.execute(select_path(node_id))).all()
+        if not path or path[-1][0].is_expanded:
+            return False
+
+        node = path[-1][0]
+        story = await db.get(Story, node.story_id)
+        step = await cls._generate_step(story.title, [(row.content, choice) for row, choice in path[:-1]], depth=len(path) - 1)
+
+        # Claim the placeholder: of two concurrent expansions only one writes.
+        # On SQLite this also takes the write lock _allocate_node_ids relies on.
+        started = time.perf_counter()
+        claimed = await db.execute(
+            update(StoryNode)
+            .where(StoryNode.id == node_id, StoryNode.is_expanded == false())
+            .values(content=step.content, is_ending=step.isEnding, is_winning_ending=step.isWinningEnding, is_expanded=True)
+            .execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount != 1:
+            await db.rollback()
+            return False
+
+        await cls._propagate_expansion(db, path, step)
+        if step.options:
+            child_ids = await cls._allocate_node_ids(db, len(step.options))
+            options, placeholders, edges = cls._placeholder_rows(story.id, node_id, step, child_ids, depth=len(path))
+            await db.execute(insert(StoryNode), placeholders)
+            await db.execute(insert(StoryOption), edges)
+            await db.execute(
+                update(StoryNode).where(StoryNode.id == node_id).values(options=options)
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            # An ending may have been the last unwritten scene. The row lock
+            # serializes this check between concurrent expansions (Postgres).
+            await db.execute(select(Story.id).where(Story.id == story.id).with_for_update())
+            remaining = await db.scalar(
+                select(func.count()).select_from(StoryNode)
+                .where(StoryNode.story_id == story.id, StoryNode.is_expanded == false())
+            )
+            if remaining == 0:
+                await db.execute(
+                    update(Story).where(Story.id == story.id).values(is_complete=True)
+                    .execution_options(synchronize_session=False)
+                )
+                await add_story_stats(db, story.id)
+
+        await db.commit()
+        STAGE_SECONDS.labels(stage="persist").observe(time.perf_counter() - started)
+        return True
+
+    # Keeps the graph metadata of the expanded node and its ancestors current:
+    # new placeholders grow their subtrees, a new ending is reachable from
+    # all of them. One UPDATE over the path, however deep the node is.
+    @classmethod
+    async def _propagate_expansion(cls, db: AsyncSession, path, step: StoryStepLLM):
+        path_ids = [row.id for row, _ in path]
+        node_depth = len(path) - 1
+        if step.options:
+            values = {"subtree_size": StoryNode.subtree_size + len(step.options)}
+        else:
+            values = {
+                "reachable_endings": StoryNode.reachable_endings + 1,
+                "reachable_winning_endings": StoryNode.reachable_winning_endings + int(step.isWinningEnding),
+            }
+            if step.isWinningEnding:
+                distance = node_depth - StoryNode.depth
+                values["winning_distance"] = case(
+                    (or_(StoryNode.winning_distance.is_(None), StoryNode.winning_distance > distance), distance),
+                    else_=StoryNode.winning_distance,
+                )
+        await db.execute(
+            update(StoryNode).where(StoryNode.id.in_(path_ids)).values(**values)
+            .execution_options(synchronize_session=False)
         )
-        db.add(node)
-        db.flush()  # To get node ID
 
-        if not node.is_ending and (hasattr(node_data, "options") and node_data.options):
-            options_list = []
-            for option_data in node_data.options:
-                next_node = option_data.nextNode
-                if isinstance(next_node, dict):
-                    next_node = StoryNodeLLM(**next_node)
+    # One placeholder node per option of `step` plus the edges to them, at `depth`.
+    # Returns (options JSON of the scene, placeholder rows, edge rows).
+    @classmethod
+    def _placeholder_rows(cls, story_id: int, node_id: int, step: StoryStepLLM, child_ids: List[int], depth: int):
+        options = []
+        placeholders = []
+        edges = []
+        for position, (option_data, child_id) in enumerate(zip(step.options or [], child_ids)):
+            options.append({"text": option_data.text, "node_id": child_id})
+            placeholders.append({
+                "id": child_id,
+                "story_id": story_id,
+                "content": "",
+                "is_root": False,
+                "is_ending": False,
+                "is_winning_ending": False,
+                "options": [],
+                "is_expanded": False,
+                "depth": depth,
+                "subtree_size": 1,
+                "reachable_endings": 0,
+                "reachable_winning_endings": 0,
+                "winning_distance": None,
+            })
+            edges.append({
+                "story_id": story_id,
+                "from_node_id": node_id,
+                "to_node_id": child_id,
+                "position": position,
+                "text": option_data.text,
+            })
+        return options, placeholders, edges
+
+    #  Node Processing Engine
+    # Flattens the AI-generated tree in one breadth-first pass.
+    # Returns (node, [(option text, child index), ...]) with the root at index 0;
+    # indexes refer to positions in the returned list.
+    @classmethod
+    def _flatten_story_tree(cls, root: StoryNodeLLM) -> List[Tuple[StoryNodeLLM, List[Tuple[str, int]]]]:
+        nodes = [root]
+        flat_nodes = []
+        for node_data in nodes:  # nodes grows while iterating (BFS queue)
+            options = []
+            if not node_data.isEnding and node_data.options:
+                for option_data in node_data.options:
+                    next_node = option_data.nextNode
+                    if isinstance(next_node, dict):
+                        next_node = StoryNodeLLM(**next_node)
+
+                    options.append((option_data.text, len(nodes)))
+                    nodes.append(next_node)
+            flat_nodes.append((node_data, options))
+        return flat_nodes
 
-                child_node = cls._process_story_node(db, story_id, next_node, is_root=False)
+    # Reserves `count` story_nodes IDs in one round trip.
+    # Postgres: draw a block from the serial's sequence.
+    # Others (SQLite): MAX(id) is safe because the story row was already
+    # flushed in this transaction, so we hold the database write lock and no
+    # other writer can insert nodes until we commit.
+    @classmethod
+    async def _allocate_node_ids(cls, db: AsyncSession, count: int) -> List[int]:
+        if db.bind.dialect.name == "postgresql":
+            result = await db.execute(
+                text("SELECT nextval(pg_get_serial_sequence('story_nodes', 'id')) FROM generate_series(1, :count)"),
+                {"count": count},
+            )
+            return [row[0] for row in result]
 
-                options_list.append({
-                    "text": option_data.text,
-                    "node_id": child_node.id
-                })
+        max_id = await db.scalar(select(func.coalesce(func.max(StoryNode.id), 0)))
+        return list(range(max_id + 1, max_id + 1 + count))
+
+    # Rebuilds the LLM-shaped tree of a stored story so it can be persisted
+    # again for another session (near-duplicate reuse)
+    @classmethod
+    async def _load_structure(cls, db: AsyncSession, story_id: int):
+        story = await db.get(Story, story_id)
+        nodes = (await db.scalars(select(StoryNode).where(StoryNode.story_id == story_id))).all()
+        node_dict = {node.id: node for node in nodes}
+        root = next((node for node in nodes if node.is_root), None)
+        if not story or not root:
+            return None
 
-            node.options = options_list
+        def build(node: StoryNode) -> StoryNodeLLM:
+            options = [
+                StoryOptionLLM(text=option["text"], nextNode=build(node_dict[option["node_id"]]).model_dump())
+                for option in (node.options or [])
+                if option.get("node_id") in node_dict
+            ]
+            return StoryNodeLLM(
+                content=node.content,
+                isEnding=node.is_ending,
+                isWinningEnding=node.is_winning_ending,
+                options=options or None,
+            )
 
-        db.flush()  # To save options
-        return node
+        return StoryLLMResponse(title=story.title, rootNode=build(root))
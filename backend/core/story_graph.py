@@ -0,0 +1,73 @@
+# Per-node graph metadata, stored on story_nodes when a story is written so
+# questions like "how many endings can I still reach" or "how far is the
+# nearest winning ending" are a column read instead of a tree walk.
+#
+# depth                      edges from the root
+# subtree_size               nodes in the subtree, the node included
+# reachable_endings          endings in the subtree (the node itself if it is one)
+# reachable_winning_endings  winning endings in the subtree
+# winning_distance           choices to the nearest winning ending, None if none is reachable
+#
+# For an incrementally generated story the counts cover the scenes written so
+# far (a placeholder is a leaf without endings) and are updated as it grows.
+from collections import deque
+from typing import Dict, Iterable
+
+NODE_METADATA_COLUMNS = ("depth", "subtree_size", "reachable_endings", "reachable_winning_endings", "winning_distance")
+
+# Accepts StoryNode rows or plain dicts with the same keys
+def _node_values(node):
+    if isinstance(node, dict):
+        return node["id"], node["is_root"], node["is_ending"], node["is_winning_ending"], node["options"]
+    return node.id, node.is_root, node.is_ending, node.is_winning_ending, node.options
+
+# Metadata of every node reachable from the root, by node ID. Linear: one
+# breadth-first pass top-down for depths, then the same order reversed so
+# every child is summed before its parent.
+def compute_node_metadata(nodes: Iterable) -> Dict[int, dict]:
+    children = {}
+    flags = {}
+    root_id = None
+    for node_id, is_root, is_ending, is_winning_ending, options in map(_node_values, nodes):
+        children[node_id] = [option.get("node_id") for option in options or []]
+        flags[node_id] = (bool(is_ending), bool(is_winning_ending))
+        if is_root:
+            root_id = node_id
+    if root_id is None:
+        return {}
+
+    order = []
+    depths = {root_id: 0}
+    queue = deque([root_id])
+    while queue:
+        node_id = queue.popleft()
+        order.append(node_id)
+        for child_id in children[node_id]:
+            if child_id in children and child_id not in depths:
+                depths[child_id] = depths[node_id] + 1
+                queue.append(child_id)
+
+    metadata = {}
+    for node_id in reversed(order):
+        is_ending, is_winning_ending = flags[node_id]
+        subtree_size = 1
+        reachable_endings = int(is_ending)
+        reachable_winning_endings = int(is_winning_ending)
+        winning_distance = 0 if is_winning_ending else None
+        for child_id in children[node_id]:
+            child = metadata.get(child_id)
+            if child is None:
+                continue
+            subtree_size += child["subtree_size"]
+            reachable_endings += child["reachable_endings"]
+            reachable_winning_endings += child["reachable_winning_endings"]
+            if child["winning_distance"] is not None and (winning_distance is None or child["winning_distance"] + 1 < winning_distance):
+                winning_distance = child["winning_distance"] + 1
+        metadata[node_id] = {
+            "depth": depths[node_id],
+            "subtree_size": subtree_size,
+            "reachable_endings": reachable_endings,
+            "reachable_winning_endings": reachable_winning_endings,
+            "winning_distance": winning_distance,
+        }
+    return metadata
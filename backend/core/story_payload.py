@@ -0,0 +1,118 @@
+# Precomputed complete-story payloads.
+# Stories never change once generated, so the JSON served by
+# GET /stories/{story_id}/complete is serialized once, stored in
+# story_payloads and served as raw bytes with a strong ETag.
+#
+# Rows come from our own database (or from the generator, before they are
+# written), so they are trusted: nodes are turned into plain dicts in a single
+# pass and encoded with orjson, with no Pydantic model per node.
+import hashlib
+from typing import Iterable, Optional, Tuple
+
+import orjson
+
+from models.story import Story, StoryPayload
+
+# Safe because a payload is never rewritten for the same story ID
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Bit flags of a compact node
+ENDING = 1
+WINNING_ENDING = 2
+UNEXPANDED = 4
+
+# Accepts StoryNode rows or plain dicts with the same keys
+def _node_values(node) -> Tuple:
+    if isinstance(node, dict):
+        return (node["id"], node["content"], node["is_ending"], node["is_winning_ending"], node["is_root"],
+                node["options"], node.get("is_expanded", True))
+    return node.id, node.content, node.is_ending, node.is_winning_ending, node.is_root, node.options, node.is_expanded is not False
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+# Same shape as schemas.story.CompleteStoryResponse
+def serialize_complete_story(story: Story, nodes: Iterable) -> bytes:
+    all_nodes = {}
+    root_node = None
+    for node_id, content, is_ending, is_winning_ending, is_root, options, is_expanded in map(_node_values, nodes):
+        node_response = {
+            "content": content,
+            "is_ending": bool(is_ending),
+            "is_winning_ending": bool(is_winning_ending),
+            "is_root": bool(is_root),
+            "id": node_id,
+            "options": [{"text": option["text"], "node_id": option.get("node_id")} for option in options or []],
+            "is_expanded": is_expanded,
+        }
+        all_nodes[str(node_id)] = node_response
+        if is_root:
+            root_node = node_response
+
+    if root_node is None:
+        raise ValueError("Root node not found")
+
+    return orjson.dumps({
+        "title": story.title,
+        "session_id": story.session_id,
+        "id": story.id,
+        "created_at": story.created_at,
+        "root_node": root_node,
+        "all_nodes": all_nodes,
+    })
+
+# Same shape as schemas.story.CompactStoryResponse: nodes as an array, options
+# as [text, node index] pairs, root referenced by index instead of repeated.
+def serialize_compact_story(story: Story, nodes: Iterable) -> bytes:
+    values = [_node_values(node) for node in nodes]
+    index_by_id = {node_id: index for index, (node_id, *_) in enumerate(values)}
+
+    compact_nodes = []
+    root = None
+    for index, (node_id, content, is_ending, is_winning_ending, is_root, options, is_expanded) in enumerate(values):
+        flags = (ENDING if is_ending else 0) | (WINNING_ENDING if is_winning_ending else 0) | (0 if is_expanded else UNEXPANDED)
+        compact_nodes.append([
+            node_id,
+            content,
+            flags,
+            [[option["text"], index_by_id.get(option.get("node_id"))] for option in options or []],
+        ])
+        if is_root:
+            root = index
+
+    if root is None:
+        raise ValueError("Root node not found")
+
+    return orjson.dumps({
+        "id": story.id,
+        "title": story.title,
+        "session_id": story.session_id,
+        "created_at": story.created_at,
+        "root": root,
+        "nodes": compact_nodes,
+    })
+
+def make_story_payload(story: Story, nodes: Iterable) -> StoryPayload:
+    nodes = list(nodes)
+    body = serialize_complete_story(story, nodes)
+    compact_body = serialize_compact_story(story, nodes)
+    return StoryPayload(
+        story_id=story.id,
+        body=body,
+        etag=_etag(body),
+        compact_body=compact_body,
+        compact_etag=_etag(compact_body),
+    )
+
+# Payloads stored before the compact format existed get it on first request
+def ensure_compact(payload: StoryPayload, story: Story, nodes: Iterable) -> StoryPayload:
+    payload.compact_body = serialize_compact_story(story, nodes)
+    payload.compact_etag = _etag(payload.compact_body)
+    return payload
+
+# If-None-Match: "etag1", "etag2" | W/"etag" | *
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
@@ -0,0 +1,157 @@
+# Tolerant parsing of a whole-story response (GENERATION_MODE=single).
+# One bad subtree (a scene without isEnding, a nextNode that is not a scene, a
+# response cut off mid-JSON) used to fail the whole job, and the retry paid
+# for the entire story again. Instead:
+#   1. truncated JSON is closed (open strings, arrays and objects), and the
+#      scene or option the response was cut off in is dropped: its text may
+#      end mid-word ("Ask fo") and the choices after it are missing
+#   2. every valid scene is kept; an option whose scene is unusable becomes a
+#      hole: the option text stays, its nextNode is set to None
+#   3. StoryGenerator re-prompts only the holes (REPAIR_PROMPT), giving the
+#      story so far along the hole's path, and fills them in place
+#
+# Local repairs that need no LLM call:
+#   - missing isEnding on a scene with options → not an ending
+#   - missing isWinningEnding → False
+#   - options without text → dropped
+# A scene with neither isEnding nor options is unusable: it is usually where
+# the response was cut off, so it can't be told apart from a half-written one.
+# So is a scene that is not an ending but keeps fewer than 2 choices.
+#
+# The truncation path: when the JSON had to be closed, the cut is inside the
+# last value of every open object and array, so from the root it follows the
+# last key of each scene and option, and the last option of each list. The
+# deepest scene or option on it is the one that was cut.
+import json
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
+
+StoryPath = List[Tuple[str, str]]  # (scene content, choice taken), root first
+
+
+class StoryHole(NamedTuple):
+    path: StoryPath  # Up to and including the choice leading to the missing scene
+    option: dict     # The option in SalvagedStory.data whose nextNode gets filled
+
+
+class SalvagedStory(NamedTuple):
+    data: dict               # StoryLLMResponse-shaped, holes have nextNode None
+    holes: List[StoryHole]
+    valid_nodes: int
+
+
+# Minimum choices of a scene that is not an ending, as STORY_PROMPT asks
+MIN_OPTIONS = 2
+
+
+# JSON from an LLM response, markdown fences stripped and truncated JSON
+# closed, and whether it had to be closed
+def _load_json(text: str) -> Tuple[Any, bool]:
+    truncated = False
+
+    def parser(json_text: str):
+        nonlocal truncated
+        try:
+            value, truncated = json.loads(json_text, strict=False), False
+        except json.JSONDecodeError:
+            value, truncated = parse_partial_json(json_text), True
+        return value
+
+    try:
+        value = parse_json_markdown(text, parser=parser)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Response is not JSON: {e}") from e
+    if value is None:
+        raise ValueError("Response is not JSON")
+    return value, truncated
+
+
+def load_json(text: str) -> Any:
+    return _load_json(text)[0]
+
+
+def _text(value) -> Optional[str]:
+    return value if isinstance(value, str) and value.strip() else None
+
+
+def _last_key(raw: dict) -> Optional[str]:
+    return next(reversed(raw), None)
+
+
+# The scene as a clean dict, or None if it can't be used. Holes below it are
+# appended to `holes`; `counter` counts the scenes kept. `truncated`: the scene
+# is on the truncation path.
+def _salvage_node(raw, path: StoryPath, holes: List[StoryHole], counter: List[int], truncated: bool = False) -> Optional[dict]:
+    if not isinstance(raw, dict) or _text(raw.get("content")) is None:
+        return None
+    content = raw["content"]
+    raw_options = raw.get("options") if isinstance(raw.get("options"), list) else []
+
+    # The path goes on into the last option, whose scene is cut (or, with no
+    # scene of its own, the option is); otherwise this scene is the one cut
+    truncated_option = None
+    if truncated:
+        if _last_key(raw) != "options" or not raw_options:
+            return None
+        truncated_option = raw_options[-1]
+        if not isinstance(truncated_option, dict) or _last_key(truncated_option) != "nextNode" \
+                or not isinstance(truncated_option["nextNode"], dict):
+            raw_options = raw_options[:-1]
+            truncated_option = None
+    raw_options = [option for option in raw_options if isinstance(option, dict) and _text(option.get("text")) is not None]
+
+    is_ending = raw.get("isEnding")
+    if not isinstance(is_ending, bool):
+        if not raw_options:
+            return None
+        is_ending = False
+    is_winning_ending = raw.get("isWinningEnding")
+    if not isinstance(is_winning_ending, bool):
+        is_winning_ending = False
+
+    options = None
+    if not is_ending:
+        # A scene that is not an ending needs real choices; with one left it
+        # is regenerated whole rather than shown with its choices missing
+        if len(raw_options) < MIN_OPTIONS:
+            return None
+        options = []
+        for raw_option in raw_options:
+            option = {"text": raw_option["text"], "nextNode": None}
+            option_path = path + [(content, raw_option["text"])]
+            option["nextNode"] = _salvage_node(raw_option.get("nextNode"), option_path, holes, counter,
+                                               truncated=raw_option is truncated_option)
+            if option["nextNode"] is None:
+                holes.append(StoryHole(option_path, option))
+            options.append(option)
+
+    counter[0] += 1
+    return {"content": content, "isEnding": is_ending, "isWinningEnding": is_winning_ending, "options": options}
+
+
+# Raises ValueError if not even the title and the opening scene are usable
+def salvage_story(text: str) -> SalvagedStory:
+    raw, truncated = _load_json(text)
+    if not isinstance(raw, dict) or _text(raw.get("title")) is None:
+        raise ValueError("Response has no story title")
+    if truncated and _last_key(raw) == "title":
+        raise ValueError("Response was cut off in the story title")
+
+    holes: List[StoryHole] = []
+    counter = [0]
+    root = _salvage_node(raw.get("rootNode"), [], holes, counter, truncated=truncated and _last_key(raw) == "rootNode")
+    if root is None:
+        raise ValueError("Response has no usable opening scene")
+    return SalvagedStory({"title": raw["title"], "rootNode": root}, holes, counter[0])
+
+
+# A repair response (StoryNodeLLM) is only accepted whole: a subtree with
+# holes of its own raises ValueError and is asked for again
+def parse_subtree(text: str) -> dict:
+    holes: List[StoryHole] = []
+    raw, truncated = _load_json(text)
+    node = _salvage_node(raw, [], holes, [0], truncated=truncated)
+    if node is None or holes:
+        raise ValueError("Repaired subtree is incomplete")
+    return node
@@ -0,0 +1,41 @@
+# Materialized story analytics (story_stats table, see db/story_analytics.py).
+# A story's row is written in the same transaction that completes the story:
+# from the node rows already in memory when a whole story is persisted, or
+# with one aggregate query when the last scene of an incrementally generated
+# story is written. Stories never change once complete, so rows stay valid.
+from typing import Iterable
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.story_analytics import STATS_COLUMNS, select_story_stats
+from models.story import StoryStats
+
+# Accepts StoryNode rows or plain dicts with the same keys, carrying their
+# graph metadata (core/story_graph.py)
+def _node_values(node):
+    if isinstance(node, dict):
+        return node["is_ending"], node["is_winning_ending"], node["options"], node["depth"]
+    return node.is_ending, node.is_winning_ending, node.options, node.depth
+
+def make_story_stats(story_id: int, nodes: Iterable) -> StoryStats:
+    node_count = ending_count = winning_ending_count = edge_count = max_depth = 0
+    for is_ending, is_winning_ending, options, depth in map(_node_values, nodes):
+        node_count += 1
+        ending_count += bool(is_ending)
+        winning_ending_count += bool(is_winning_ending)
+        edge_count += len(options or [])
+        max_depth = max(max_depth, depth or 0)
+
+    return StoryStats(
+        story_id=story_id,
+        node_count=node_count,
+        ending_count=ending_count,
+        winning_ending_count=winning_ending_count,
+        edge_count=edge_count,
+        max_depth=max_depth,
+    )
+
+# For stories whose nodes are not all in memory (incremental generation)
+async def add_story_stats(db: AsyncSession, story_id: int):
+    await db.execute(insert(StoryStats).from_select(STATS_COLUMNS, select_story_stats([story_id])))
@@ -0,0 +1,126 @@
+# Incremental persistence of a story tree while the LLM is still writing it.
+# The token stream is re-parsed as partial JSON (see StoryGenerator._stream_story)
+# and every node is written as soon as its own fields are complete, root first,
+# so the start of the story is playable long before the last ending arrives.
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.story import Story, StoryNode, StoryOption
+
+# Node paths are tuples of option indexes from the root: () is the root,
+# (1, 0) is the first option of the root's second option.
+NodePath = Tuple[int, ...]
+
+# The generator emits keys in schema order (content, isEnding, isWinningEnding,
+# options). In a partial parse only the last key of an object can still be
+# cut off mid-string, so a value is final once another key follows it.
+def _is_complete(obj: dict, key: str, final: bool) -> bool:
+    if key not in obj:
+        return False
+    return final or not isinstance(obj[key], str) or next(reversed(obj)) != key
+
+def _node_ready(node, final: bool) -> bool:
+    return (
+        isinstance(node, dict)
+        and _is_complete(node, "content", final)
+        and isinstance(node.get("isEnding"), bool)
+        and isinstance(node.get("isWinningEnding"), bool)
+    )
+
+def _options(node: dict) -> list:
+    if node.get("isEnding") is True:
+        return []  # Ending nodes never offer choices (same rule as bulk persistence)
+    return [option for option in node.get("options") or [] if isinstance(option, dict)]
+
+
+class StreamingStoryWriter:
+
+    def __init__(self, db: AsyncSession, session_id: str, on_progress: Optional[Callable[[Story, int], None]] = None):
+        self.db = db
+        self.session_id = session_id
+        self.on_progress = on_progress
+        self.story: Optional[Story] = None
+        self.nodes: Dict[NodePath, StoryNode] = {}
+
+    @property
+    def node_rows(self) -> List[StoryNode]:
+        return list(self.nodes.values())
+
+    def _collect_ready(self, node, path: NodePath, final: bool, ready: List[Tuple[NodePath, dict]]):
+        if not isinstance(node, dict):
+            return
+        if path not in self.nodes and _node_ready(node, final):
+            ready.append((path, node))
+        for index, option in enumerate(_options(node)):
+            self._collect_ready(option.get("nextNode"), path + (index,), final, ready)
+
+    # Appends options, in order, whose text is final and whose target is stored.
+    # Returns the number of options linked.
+    def _link_options(self, node, path: NodePath, final: bool) -> int:
+        if not isinstance(node, dict):
+            return 0
+        linked_count = 0
+        node_row = self.nodes.get(path)
+        options = _options(node)
+        if node_row is not None:
+            linked = list(node_row.options or [])
+            for index in range(len(linked), len(options)):
+                child = self.nodes.get(path + (index,))
+                if child is None or not _is_complete(options[index], "text", final):
+                    break
+                linked.append({"text": options[index]["text"], "node_id": child.id})
+                self.db.add(StoryOption(
+                    story_id=self.story.id,
+                    from_node_id=node_row.id,
+                    to_node_id=child.id,
+                    position=index,
+                    text=options[index]["text"],
+                ))
+            if len(linked) != len(node_row.options or []):
+                linked_count += len(linked) - len(node_row.options or [])
+                node_row.options = linked  # Reassign so the JSON change is tracked
+
+        for index, option in enumerate(options):
+            linked_count += self._link_options(option.get("nextNode"), path + (index,), final)
+        return linked_count
+
+    # Persists whatever became complete since the last call.
+    # `partial` is the partially parsed LLM response; final=True means the
+    # response is complete (every value present is final).
+    async def feed(self, partial, final: bool = False):
+        if not isinstance(partial, dict):
+            return
+        changed = False
+        if self.story is None:
+            if not _is_complete(partial, "title", final):
+                return
+            self.story = Story(title=partial["title"], session_id=self.session_id, is_complete=False)
+            self.db.add(self.story)
+            await self.db.flush()
+            changed = True
+
+        root = partial.get("rootNode")
+        ready = []
+        self._collect_ready(root, (), final, ready)
+        for path, node in ready:
+            self.nodes[path] = StoryNode(
+                story_id=self.story.id,
+                content=node["content"],
+                is_root=path == (),
+                is_ending=node["isEnding"],
+                is_winning_ending=node["isWinningEnding"],
+                options=[],
+            )
+            self.db.add(self.nodes[path])
+        if ready:
+            await self.db.flush()  # To get node IDs
+            changed = True
+
+        if self._link_options(root, (), final):
+            changed = True
+
+        if changed:
+            if self.on_progress and self.nodes:
+                self.on_progress(self.story, len(self.nodes))
+            await self.db.commit()  # Expose the new nodes to readers
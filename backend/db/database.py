@@ -1,13 +1,67 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+# Sync drivers used by DATABASE_URL mapped to their asyncio counterparts
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+def get_async_database_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+# Pool options from settings. In-memory SQLite uses a single shared
+# connection (no queue pool), so it takes none. A SQLite file has no server
+# that could drop connections, so pre-ping would only add a query per checkout.
+def engine_options(url: str) -> dict:
+    if _is_sqlite(url) and (":memory:" in url or url.partition("://")[2] in ("", "/")):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING and not _is_sqlite(url),
+    }
+
+# Applied to every new SQLite connection. WAL is persistent in the database
+# file, the other two are per connection.
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL: only the last commits can be lost on power failure
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+def configure_engine(engine, url: str):
+    if _is_sqlite(url) and settings.SQLITE_PRAGMAS_ENABLED:
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+engine = configure_engine(create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL)), settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine used by the API routers and background story generation, so
+# that waiting on the database never pins a threadpool thread.
+# expire_on_commit=False keeps ORM objects readable after commit without an
+# implicit (and in async, illegal) lazy refresh.
+ASYNC_DATABASE_URL = get_async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+configure_engine(async_engine.sync_engine, ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Scripts and tools (test_metrics.py); the API uses get_async_db
 def get_db():
     db = SessionLocal()
     try:
@@ -15,5 +69,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from db.migrations import run_migrations
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        run_migrations(connection)
@@ -0,0 +1,147 @@
+# Lightweight, idempotent schema upgrades run at startup.
+# Base.metadata.create_all() only creates missing tables; it never alters an
+# existing one. This module fills that gap for additive changes so an existing
+# database.db keeps working after new columns and indexes are introduced, and runs one-off
+# data migrations exactly once (recorded in schema_migrations).
+from sqlalchemy import inspect, select, insert, update, bindparam, Table, Column, String, DateTime
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql import func
+
+from db.database import Base
+
+schema_migrations = Table(
+    "schema_migrations",
+    Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+BATCH_SIZE = 1000
+
+def add_missing_columns(connection: Connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # New columns must be nullable or carry a server_default
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+
+def add_missing_indexes(connection: Connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+
+# Data migration: story_nodes.options JSON → story_options rows
+def backfill_story_options(connection: Connection):
+    from models.story import StoryNode, StoryOption
+
+    last_id = 0
+    while True:
+        nodes = connection.execute(
+            select(StoryNode.id, StoryNode.story_id, StoryNode.options)
+            .where(StoryNode.id > last_id)
+            .order_by(StoryNode.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not nodes:
+            break
+
+        edges = [
+            {
+                "story_id": story_id,
+                "from_node_id": node_id,
+                "to_node_id": option["node_id"],
+                "position": position,
+                "text": option.get("text"),
+            }
+            for node_id, story_id, options in nodes
+            for position, option in enumerate(options or [])
+            if option.get("node_id") is not None
+        ]
+        if edges:
+            connection.execute(insert(StoryOption), edges)
+        last_id = nodes[-1].id
+
+# Data migration: story_stats rows for complete stories created before the table
+def backfill_story_stats(connection: Connection):
+    from models.story import Story, StoryStats
+    from db.story_analytics import STATS_COLUMNS, select_story_stats
+
+    last_id = 0
+    while True:
+        story_ids = list(connection.scalars(
+            select(Story.id)
+            .where(Story.id > last_id, Story.is_complete)
+            .order_by(Story.id)
+            .limit(BATCH_SIZE)
+        ))
+        if not story_ids:
+            break
+        connection.execute(insert(StoryStats).from_select(STATS_COLUMNS, select_story_stats(story_ids)))
+        last_id = story_ids[-1]
+
+# Data migration: graph metadata (core/story_graph.py) of existing nodes,
+# computed per story from the nodes' options
+def backfill_node_metadata(connection: Connection):
+    from models.story import Story, StoryNode
+    from core.story_graph import NODE_METADATA_COLUMNS, compute_node_metadata
+
+    set_metadata = (
+        update(StoryNode.__table__)
+        .where(StoryNode.__table__.c.id == bindparam("node_id"))
+        .values({column: bindparam(column) for column in NODE_METADATA_COLUMNS})
+    )
+    last_id = 0
+    while True:
+        story_ids = list(connection.scalars(
+            select(Story.id).where(Story.id > last_id).order_by(Story.id).limit(BATCH_SIZE)
+        ))
+        if not story_ids:
+            break
+
+        nodes_by_story = {}
+        for node in connection.execute(
+            select(StoryNode.id, StoryNode.story_id, StoryNode.is_root, StoryNode.is_ending, StoryNode.is_winning_ending, StoryNode.options)
+            .where(StoryNode.story_id.in_(story_ids))
+        ).mappings():
+            nodes_by_story.setdefault(node["story_id"], []).append(node)
+
+        rows = [
+            {"node_id": node_id, **metadata}
+            for nodes in nodes_by_story.values()
+            for node_id, metadata in compute_node_metadata(dict(node) for node in nodes).items()
+        ]
+        if rows:
+            connection.execute(set_metadata, rows)
+        last_id = story_ids[-1]
+
+# Applied in order, each exactly once
+DATA_MIGRATIONS = [
+    ("0001_backfill_story_options", backfill_story_options),
+    ("0002_backfill_story_stats", backfill_story_stats),
+    ("0003_backfill_node_metadata", backfill_node_metadata),
+]
+
+def run_migrations(connection: Connection):
+    add_missing_columns(connection)
+    add_missing_indexes(connection)
+
+    applied = set(connection.scalars(select(schema_migrations.c.name)))
+    for name, migrate in DATA_MIGRATIONS:
+        if name in applied:
+            continue
+        migrate(connection)
+        connection.execute(insert(schema_migrations).values(name=name))
@@ -0,0 +1,109 @@
+# Story analytics computed by the database.
+# Counts are aggregated with GROUP BY and depth with a recursive CTE over
+# story_options, so no node content is loaded and the number of queries does
+# not depend on the number of stories.
+#
+# select_story_stats() derives the stats of given stories from their nodes and
+# edges (used to fill story_stats); dashboards read the materialized
+# story_stats rows through select_stats_summary() / select_story_details().
+from typing import Iterable, Optional
+
+from sqlalchemy import select, func, case, cast, literal, Float
+
+from models.story import Story, StoryNode, StoryOption, StoryStats
+
+# Statement builders are session-agnostic, like db/story_repository.py
+
+# Columns of select_story_stats(), in order, for insert().from_select()
+STATS_COLUMNS = ["story_id", "node_count", "ending_count", "winning_ending_count", "edge_count", "max_depth"]
+
+def _restrict(statement, column, story_ids: Optional[Iterable[int]]):
+    return statement if story_ids is None else statement.where(column.in_(list(story_ids)))
+
+def select_story_stats(story_ids: Optional[Iterable[int]] = None):
+    if story_ids is not None:
+        story_ids = list(story_ids)
+
+    nodes = _restrict(
+        select(
+            StoryNode.story_id,
+            func.count().label("node_count"),
+            func.sum(case((StoryNode.is_ending, 1), else_=0)).label("ending_count"),
+            func.sum(case((StoryNode.is_winning_ending, 1), else_=0)).label("winning_ending_count"),
+        ),
+        StoryNode.story_id, story_ids,
+    ).group_by(StoryNode.story_id).subquery("nodes")
+
+    edges = _restrict(
+        select(StoryOption.story_id, func.count().label("edge_count")),
+        StoryOption.story_id, story_ids,
+    ).group_by(StoryOption.story_id).subquery("edges")
+
+    # depth(story_id, node_id, depth): every node reached from its story's
+    # root, one level of story_options per iteration
+    depth = _restrict(
+        select(StoryNode.story_id, StoryNode.id.label("node_id"), literal(0).label("depth"))
+        .where(StoryNode.is_root),
+        StoryNode.story_id, story_ids,
+    ).cte("depth", recursive=True)
+    depth = depth.union_all(
+        select(depth.c.story_id, StoryOption.to_node_id, depth.c.depth + 1)
+        .join(depth, StoryOption.from_node_id == depth.c.node_id)
+    )
+    depths = (
+        select(depth.c.story_id, func.max(depth.c.depth).label("max_depth"))
+        .group_by(depth.c.story_id)
+        .subquery("depths")
+    )
+
+    return (
+        select(
+            nodes.c.story_id,
+            nodes.c.node_count,
+            nodes.c.ending_count,
+            nodes.c.winning_ending_count,
+            func.coalesce(edges.c.edge_count, 0),
+            func.coalesce(depths.c.max_depth, 0),
+        )
+        .outerjoin(edges, edges.c.story_id == nodes.c.story_id)
+        .outerjoin(depths, depths.c.story_id == nodes.c.story_id)
+        .order_by(nodes.c.story_id)
+    )
+
+def _branching_factor(edge_count, node_count, ending_count):
+    # Average choices per scene a player can still choose from
+    return cast(edge_count, Float) / func.nullif(node_count - ending_count, 0)
+
+# One row over all stories with stats
+def select_stats_summary():
+    return select(
+        func.count().label("total_stories"),
+        func.coalesce(func.sum(StoryStats.node_count), 0).label("total_nodes"),
+        func.avg(StoryStats.node_count).label("avg_nodes_per_story"),
+        func.min(StoryStats.node_count).label("min_nodes_per_story"),
+        func.max(StoryStats.node_count).label("max_nodes_per_story"),
+        func.coalesce(func.sum(StoryStats.ending_count), 0).label("total_endings"),
+        func.coalesce(func.sum(StoryStats.winning_ending_count), 0).label("total_winning_endings"),
+        func.avg(StoryStats.max_depth).label("avg_max_depth"),
+        func.max(StoryStats.max_depth).label("max_depth"),
+        _branching_factor(
+            func.sum(StoryStats.edge_count), func.sum(StoryStats.node_count), func.sum(StoryStats.ending_count),
+        ).label("avg_branching_factor"),
+    )
+
+# Per-story rows for reports, newest first
+def select_story_details(limit: int = 50):
+    return (
+        select(
+            Story.id,
+            Story.title,
+            StoryStats.node_count,
+            StoryStats.ending_count,
+            StoryStats.winning_ending_count,
+            StoryStats.max_depth,
+            _branching_factor(StoryStats.edge_count, StoryStats.node_count, StoryStats.ending_count).label("branching_factor"),
+        )
+        .join(StoryStats, StoryStats.story_id == Story.id)
+        .order_by(Story.id.desc())
+        .limit(limit)
+    )
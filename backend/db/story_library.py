@@ -0,0 +1,48 @@
+# A session's stories, newest first, one page at a time.
+# Keyset pagination: a page starts right after the last story of the previous
+# one, so every page is an index range scan on (session_id, created_at, id)
+# that reads only the rows it returns, however many stories came before it.
+# (OFFSET would read and discard all earlier rows on every page.)
+import base64
+import binascii
+from typing import Optional
+
+from sqlalchemy import select, tuple_
+
+from models.story import Story, StoryStats
+
+# Cursors are opaque to clients: the ID of the last story of the page
+def encode_cursor(story_id: int) -> str:
+    return base64.urlsafe_b64encode(str(story_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+# `limit` rows after the story `after_id` (first page when None). The cursor
+# story's created_at is read by the database itself, so the comparison is
+# exact whatever precision or timezone handling the driver applies.
+def select_session_stories(session_id: str, limit: int, after_id: Optional[int] = None):
+    statement = (
+        select(
+            Story.id,
+            Story.title,
+            Story.created_at,
+            Story.is_complete,
+            StoryStats.node_count,
+            StoryStats.ending_count,
+            StoryStats.max_depth,
+        )
+        .outerjoin(StoryStats, StoryStats.story_id == Story.id)
+        .where(Story.session_id == session_id)
+        .order_by(Story.created_at.desc(), Story.id.desc())
+        .limit(limit)
+    )
+    if after_id is not None:
+        after_created_at = select(Story.created_at).where(Story.id == after_id).scalar_subquery()
+        # Row value comparison, so the database seeks straight to the cursor
+        # in the index instead of filtering rows from the start of the range
+        statement = statement.where(tuple_(Story.created_at, Story.id) < tuple_(after_created_at, after_id))
+    return statement
@@ -0,0 +1,73 @@
+# Story graph traversal over the story_options edge table.
+# Each query touches only the nodes it returns (index lookups on
+# from_node_id / to_node_id), independent of the total size of the story.
+from typing import List
+
+from sqlalchemy import select, literal, String
+from sqlalchemy.orm import Session
+
+from models.story import StoryNode, StoryOption
+
+# Statement builders are session-agnostic: execute them with a sync Session
+# (helpers below) or await them on an AsyncSession.
+
+def select_children(node_id: int):
+    return (
+        select(StoryNode)
+        .join(StoryOption, StoryOption.to_node_id == StoryNode.id)
+        .where(StoryOption.from_node_id == node_id)
+        .order_by(StoryOption.position)
+    )
+
+def select_parents(node_id: int):
+    return (
+        select(StoryNode)
+        .join(StoryOption, StoryOption.from_node_id == StoryNode.id)
+        .where(StoryOption.to_node_id == node_id)
+    )
+
+# The node itself plus all descendants up to `depth` edges below it.
+# Recursive CTE: subtree(node_id, depth) seeded with the start node,
+# expanded one level per iteration through story_options.
+def select_subtree(node_id: int, depth: int):
+    subtree = (
+        select(literal(node_id).label("node_id"), literal(0).label("depth"))
+        .cte("subtree", recursive=True)
+    )
+    subtree = subtree.union_all(
+        select(StoryOption.to_node_id, subtree.c.depth + 1)
+        .join(subtree, StoryOption.from_node_id == subtree.c.node_id)
+        .where(subtree.c.depth < depth)
+    )
+    return (
+        select(StoryNode)
+        .join(subtree, StoryNode.id == subtree.c.node_id)
+        .order_by(subtree.c.depth, StoryNode.id)
+    )
+
+# The chain of nodes from the root down to `node_id`, root first, each with
+# the text of the option taken from it toward the next node (None for
+# `node_id` itself). Walks story_options upwards; every node has one parent.
+def select_path(node_id: int):
+    path = (
+        select(literal(node_id).label("node_id"), literal(None, String).label("choice"), literal(0).label("height"))
+        .cte("path", recursive=True)
+    )
+    path = path.union_all(
+        select(StoryOption.from_node_id, StoryOption.text, path.c.height + 1)
+        .join(path, StoryOption.to_node_id == path.c.node_id)
+    )
+    return (
+        select(StoryNode, path.c.choice)
+        .join(path, StoryNode.id == path.c.node_id)
+        .order_by(path.c.height.desc())
+    )
+
+def get_children(db: Session, node_id: int) -> List[StoryNode]:
+    return list(db.scalars(select_children(node_id)))
+
+def get_parents(db: Session, node_id: int) -> List[StoryNode]:
+    return list(db.scalars(select_parents(node_id)))
+
+def get_subtree(db: Session, node_id: int, depth: int) -> List[StoryNode]:
+    return list(db.scalars(select_subtree(node_id, depth)).unique())
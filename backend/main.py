@@ -1,18 +1,56 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from core.config import settings
-from routers import story, job
-from db.database import create_tables
+from core import job_queue
+from core.job_events import relay_remote_jobs
+from core.job_retention import run_job_compactor
+from core.llm_provider import llm_provider
+from core.metrics import MetricsMiddleware, render_metrics
+from core.progress_buffer import progress_buffer
+from core.similarity_index import similarity_index
+from routers import story, job, progress
+from db.database import create_tables, AsyncSessionLocal
 
 create_tables()
 
+# In "inline" mode the API also acts as a one-slot worker: it picks up retries
+# whose backoff elapsed and jobs orphaned by a crashed process (expired lease).
+# In "worker" mode that is left entirely to worker.py.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the near-duplicate index so the first request doesn't pay for it
+    async with AsyncSessionLocal() as db:
+        await similarity_index.sync(db)
+
+    stop = asyncio.Event()
+    # Publishes status changes of jobs run by other processes to SSE/long-poll waiters
+    tasks = [asyncio.create_task(relay_remote_jobs(stop))]
+    # Batched player progress writes; the last batch is flushed once stop is set
+    tasks.append(asyncio.create_task(progress_buffer.run(stop)))
+    # Archives/deletes finished jobs past JOB_RETENTION_DAYS
+    tasks.append(asyncio.create_task(run_job_compactor(stop)))
+    if settings.JOB_EXECUTION_MODE == "inline":
+        tasks.append(asyncio.create_task(job_queue.run_worker(job_queue.make_worker_id("api-sweeper"), concurrency=1, stop=stop)))
+
+    yield
+
+    stop.set()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+    await llm_provider.aclose()
+
 app = FastAPI(
     title="Choose Your Own Adventure game API",
     description="An API for a Choose Your Own Adventure game",
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -23,8 +61,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so CORS handling is part of the measured time
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(story.router, prefix=settings.API_PREFIX)
 app.include_router(job.router, prefix=settings.API_PREFIX)
+app.include_router(progress.router, prefix=settings.API_PREFIX)
+
+
+# Prometheus scrape endpoint (per process)
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,25 @@
-from sqlalchemy import Column, Integer, String, DateTime
-from sqlalchemy.sql import func
+import enum
+
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Enum, Index, bindparam
+from sqlalchemy.sql import func, true
 
 from db.database import Base
 
+# Stored as the lowercase value in a short VARCHAR (not a native ENUM type),
+# so rows written before the enum existed stay valid and adding a state needs
+# no ALTER TYPE. A str subclass: members compare equal to their values.
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+ACTIVE_STATUSES = (JobStatus.PENDING, JobStatus.PROCESSING)
+FINISHED_STATUSES = (JobStatus.COMPLETED, JobStatus.FAILED)
+
+def _status_type():
+    return Enum(JobStatus, native_enum=False, length=16, values_callable=lambda statuses: [status.value for status in statuses])
+
 class StoryJob(Base):
     __tablename__ = "story_jobs"
 
@@ -10,8 +27,73 @@ class StoryJob(Base):
     job_id = Column(String, index=True, unique=True)
     session_id = Column(String, index=True)
     theme = Column(String)
-    status = Column(String)
+    status = Column(_status_type(), nullable=False)
     story_id = Column(Integer, index=True, nullable=True)
     error = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    completed_at = Column(DateTime(timezone=True), nullable=True)
\ No newline at end of file
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    nodes_generated = Column(Integer, nullable=False, default=0, server_default="0")  # Grows while a story streams in
+    # Tokens reported by the LLM provider, summed over all attempts
+    prompt_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    completion_tokens = Column(Integer, nullable=False, default=0, server_default="0")
+    # Malformed responses fixed by re-prompting only their invalid subtrees
+    # (core/story_repair.py): repair requests made, and tokens a full
+    # regeneration would have cost on top of them
+    repair_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    tokens_saved = Column(Integer, nullable=False, default=0, server_default="0")
+    allow_similar = Column(Boolean, nullable=False, default=True, server_default=true())  # May reuse a near-duplicate story
+    token_budget = Column(Integer, nullable=True)  # Completion tokens the story may use, sets its shape (core/prompt_builder.py)
+
+    # Queue bookkeeping (see core/job_queue.py)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False, default=3, server_default="3")
+    available_at = Column(DateTime(timezone=True), nullable=True)      # Not claimable before this (retry backoff)
+    locked_by = Column(String, nullable=True)                          # Worker currently holding the lease
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # Visibility timeout, extended by heartbeats
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Fetch created_at during the INSERT so a new job can be returned without
+    # a refresh (sessions don't expire objects on commit, see db/database.py)
+    __mapper_args__ = {"eager_defaults": True}
+
+    # Partial indexes: only the rows of their state are indexed. Active jobs
+    # are a handful however large the table grows, so claiming and stuck-job
+    # sweeps (core/job_queue.py) read a tiny index. Finished jobs are found by
+    # age for retention (core/job_retention.py).
+    # Queries must repeat the WHERE clause for the database to use them.
+    __table_args__ = (
+        Index(
+            'ix_story_jobs_active', 'id',
+            sqlite_where=status.in_([status.value for status in ACTIVE_STATUSES]),
+            postgresql_where=status.in_([status.value for status in ACTIVE_STATUSES]),
+        ),
+        Index(
+            'ix_story_jobs_finished_completed_at', 'completed_at',
+            sqlite_where=status.in_([status.value for status in FINISHED_STATUSES]),
+            postgresql_where=status.in_([status.value for status in FINISHED_STATUSES]),
+        ),
+    )
+
+# `status IN (...)` with the values inlined into the SQL. Planners match a
+# query to a partial index only when they can see it implies the index's
+# WHERE clause, which bound parameters hide.
+def status_in(*statuses: JobStatus):
+    return StoryJob.status.in_(bindparam(None, list(statuses), type_=StoryJob.status.type, expanding=True, literal_execute=True))
+
+# Finished jobs moved out of story_jobs by core/job_retention.py
+# (JOB_RETENTION_MODE=archive): what is worth keeping for reporting, without
+# the queue bookkeeping columns or indexes beyond the key
+class StoryJobArchive(Base):
+    __tablename__ = "story_jobs_archive"
+
+    job_id = Column(String, primary_key=True)
+    session_id = Column(String)
+    theme = Column(String)
+    status = Column(_status_type(), nullable=False)
+    story_id = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True))
+    attempts = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
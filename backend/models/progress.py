@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.sql import func
+
+from db.database import Base
+
+# Player progress (see core/progress_buffer.py). Rows are written in batches
+# by the progress buffer, so there are no foreign keys: a stale or bogus
+# story/node ID from one client must not make a whole batch fail.
+
+# One row per choice a player made
+class ChoiceEvent(Base):
+    __tablename__ = "choice_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, nullable=False)
+    story_id = Column(Integer, nullable=False)
+    from_node_id = Column(Integer, nullable=True)  # None when (re)starting at the root
+    to_node_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)  # When the choice was made, not when it was flushed
+
+    __table_args__ = (
+        Index('ix_choice_events_session_story', 'session_id', 'story_id', 'id'),  # A player's path through a story
+        Index('ix_choice_events_story_to_node', 'story_id', 'to_node_id'),        # How often each scene is reached
+    )
+
+# Where a session currently is in a story, for resuming
+class StoryProgress(Base):
+    __tablename__ = "story_progress"
+
+    session_id = Column(String, primary_key=True)
+    story_id = Column(Integer, primary_key=True)
+    node_id = Column(Integer, nullable=False)
+    choices = Column(Integer, nullable=False, default=0, server_default="0")  # Choices made so far
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON, LargeBinary, Index
+from sqlalchemy.sql import func, true
 from sqlalchemy.orm import relationship
 
 from db.database import Base
@@ -11,9 +11,20 @@ class Story(Base):
     title = Column(String, index=True)
     session_id = Column(String, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # False while nodes are still being added (streaming or incremental generation)
+    is_complete = Column(Boolean, nullable=False, default=True, server_default=true())
 
     nodes = relationship("StoryNode", back_populates="story")
 
+    __table_args__ = (
+        # Session library pages (db/story_library.py): newest first, keyset on (created_at, id)
+        Index('ix_stories_session_created_id', 'session_id', 'created_at', 'id'),
+    )
+
+    # Fetch created_at during the INSERT (RETURNING) so a freshly persisted
+    # story can be serialized without another round trip
+    __mapper_args__ = {"eager_defaults": True}
+
 class StoryNode(Base):
     __tablename__ = 'story_nodes'
 
@@ -23,6 +34,70 @@ class StoryNode(Base):
     is_root = Column(Boolean, default=False)
     is_ending = Column(Boolean, default=False)
     is_winning_ending = Column(Boolean, default=False)
-    options = Column(JSON, default=list)
+    options = Column(JSON, default=list)  # Denormalized copy of the node's outgoing story_options
+    # False for a placeholder whose scene is not written yet (incremental
+    # generation): only the option leading to it exists
+    is_expanded = Column(Boolean, nullable=False, default=True, server_default=true())
+    # Graph metadata, computed when the story is written (see core/story_graph.py)
+    depth = Column(Integer, nullable=True)
+    subtree_size = Column(Integer, nullable=True)
+    reachable_endings = Column(Integer, nullable=True)
+    reachable_winning_endings = Column(Integer, nullable=True)
+    winning_distance = Column(Integer, nullable=True)  # NULL: no winning ending below this node
+
+    story = relationship("Story", back_populates="nodes")
+
+    __table_args__ = (
+        Index('ix_story_nodes_story_id_is_root', 'story_id', 'is_root'),  # Root lookup for navigation
+    )
+
+# One row per choice: the edge from_node → to_node of the story graph.
+# Indexed in both directions so children, parents and bounded subtrees can be
+# fetched without loading and parsing every node's options JSON.
+class StoryOption(Base):
+    __tablename__ = 'story_options'
+
+    id = Column(Integer, primary_key=True, index=True)
+    story_id = Column(Integer, ForeignKey('stories.id'), index=True)
+    from_node_id = Column(Integer, ForeignKey('story_nodes.id'), nullable=False)
+    to_node_id = Column(Integer, ForeignKey('story_nodes.id'), nullable=False, index=True)
+    position = Column(Integer, nullable=False)  # Order of the choice within from_node
+    text = Column(String)
+
+    __table_args__ = (
+        Index('ix_story_options_from_node_position', 'from_node_id', 'position'),
+    )
+
+# MinHash signatures of a story's theme and title (see core/similarity_index.py).
+# Persisted so every process can rebuild its in-memory index without
+# recomputing them from the stories table.
+class StorySignature(Base):
+    __tablename__ = 'story_signatures'
+
+    story_id = Column(Integer, ForeignKey('stories.id'), primary_key=True)
+    theme = Column(String)
+    theme_signature = Column(LargeBinary)
+    title_signature = Column(LargeBinary)
+
+# Serialized GET /stories/{story_id}/complete response (see core/story_payload.py)
+class StoryPayload(Base):
+    __tablename__ = 'story_payloads'
+
+    story_id = Column(Integer, ForeignKey('stories.id'), primary_key=True)
+    body = Column(LargeBinary, nullable=False)
+    etag = Column(String, nullable=False)
+    compact_body = Column(LargeBinary, nullable=True)  # ?format=compact representation
+    compact_etag = Column(String, nullable=True)
+
+# Shape of a finished story (see core/story_stats.py), one row per complete
+# story so analytics aggregate these rows instead of scanning every node
+class StoryStats(Base):
+    __tablename__ = 'story_stats'
 
-    story = relationship("Story", back_populates="nodes")
\ No newline at end of file
+    story_id = Column(Integer, ForeignKey('stories.id'), primary_key=True)
+    node_count = Column(Integer, nullable=False)
+    ending_count = Column(Integer, nullable=False)
+    winning_ending_count = Column(Integer, nullable=False)
+    edge_count = Column(Integer, nullable=False)  # Choices; branching factor = edges / non-ending nodes
+    max_depth = Column(Integer, nullable=False)   # Edges from the root to the deepest node
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())  # Written once: complete stories never change
@@ -1,9 +1,15 @@
 import uuid
+from contextlib import aclosing
 from typing import Optional
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Cookie
-from sqlalchemy.orm import Session
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Cookie, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from core.config import settings
+from core.job_events import watch_job
+from db.database import get_async_db
 from models.job import StoryJob
 from schemas.job import StoryJobResponse
 
@@ -13,12 +19,72 @@ router = APIRouter(
 )
 
 @router.get("/{job_id}", response_model=StoryJobResponse)
-def get_job_status(job_id: str, db: Session = Depends(get_db)):
+async def get_job_status(job_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieves the status of a story generation job by its job ID.
     """
-    job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first()
+    job = await db.scalar(select(StoryJob).where(StoryJob.job_id == job_id))
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return job
\ No newline at end of file
+    return job
+
+
+def _sse_event(snapshot: dict) -> bytes:
+    return b"data: " + orjson.dumps(snapshot) + b"\n\n"
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Server-sent events: the job status now and on every change (claimed,
+    nodes stored, retried, completed, failed). The stream ends once the job is
+    completed or failed. Waiting is served from memory, not by querying the DB.
+    """
+    events = watch_job(job_id, idle_seconds=settings.JOB_EVENTS_KEEPALIVE_SECONDS)
+    first = await anext(events, None)
+    if first is None:
+        await events.aclose()
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        async with aclosing(events):
+            yield b"retry: 3000\n" + _sse_event(first)
+            async for snapshot in events:
+                if await request.is_disconnected():
+                    return
+                # Comment line: keeps proxies from closing an idle stream
+                yield _sse_event(snapshot) if snapshot is not None else b": keepalive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{job_id}/wait", response_model=StoryJobResponse)
+async def wait_for_job(
+    job_id: str,
+    status: Optional[str] = None,
+    nodes_generated: Optional[int] = None,
+    timeout: float = Query(default=settings.JOB_EVENTS_MAX_WAIT_SECONDS, gt=0, le=settings.JOB_EVENTS_MAX_WAIT_SECONDS),
+):
+    """
+    Long-poll fallback for clients without EventSource. Pass the status (and
+    nodes_generated) you already know: the response is sent as soon as the
+    job differs from it, or with the unchanged job after `timeout` seconds.
+    Without a known status it returns immediately.
+    """
+    latest = None
+    async with aclosing(watch_job(job_id, idle_seconds=timeout)) as events:
+        async for snapshot in events:
+            if snapshot is None:
+                break  # Timed out without a change
+            latest = snapshot
+            if status != snapshot["status"] or nodes_generated not in (None, snapshot["nodes_generated"]):
+                break
+
+    if latest is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return latest
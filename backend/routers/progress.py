@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.progress_buffer import progress_buffer
+from db.database import get_async_db
+from models.progress import StoryProgress
+from routers.story import get_session_id
+from schemas.progress import RecordChoiceRequest, StoryProgressResponse
+
+router = APIRouter(
+    prefix='/stories',
+    tags=['progress']
+)
+
+# Called on every click, so it only appends to the in-memory buffer; the
+# database write happens in the next batched flush (core/progress_buffer.py).
+# Async so it runs on the event loop, where the buffer lives, not in the threadpool.
+@router.post("/{story_id}/progress", status_code=204)
+async def record_choice(story_id: int, request: RecordChoiceRequest, response: Response, session_id: str = Depends(get_session_id)):
+    """
+    Records the player's move to a node of the story.
+    """
+    response.set_cookie(key="session_id", value=session_id, httponly=True)
+    progress_buffer.record(session_id, story_id, request.node_id, from_node_id=request.from_node_id)
+
+# Resume: the stored position, overridden by choices not flushed yet
+@router.get("/{story_id}/progress", response_model=StoryProgressResponse)
+async def get_progress(story_id: int, session_id: str = Depends(get_session_id), db: AsyncSession = Depends(get_async_db)):
+    """
+    Returns where the current session left off in the story.
+    """
+    stored = await db.get(StoryProgress, (session_id, story_id))
+    pending = progress_buffer.pending_position(session_id, story_id)
+    if stored is None and pending is None:
+        raise HTTPException(status_code=404, detail="No progress recorded for this story")
+
+    if pending is None:
+        return StoryProgressResponse(story_id=story_id, node_id=stored.node_id, choices=stored.choices, updated_at=stored.updated_at)
+    return StoryProgressResponse(
+        story_id=story_id,
+        node_id=pending.node_id,
+        choices=(stored.choices if stored else 0) + pending.choices,
+        updated_at=pending.updated_at,
+    )
@@ -1,21 +1,36 @@
 import uuid
-from typing import Optional
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Cookie, Response, Depends
-from sqlalchemy.orm import Session
-
-from db.database import get_db, SessionLocal
-from models.story import Story, StoryNode
-from models.job import StoryJob
-from schemas.story import CompleteStoryResponse, CompleteStoryNodeResponse, CreateStoryRequest
+from typing import Optional, Literal, Tuple
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Cookie, Response, Depends, Query, Header
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core import job_queue
+from core.admission import admission_controller
+from core.story_cache import story_cache
+from core.similarity_index import similarity_index
+from core.story_expander import story_expander
+from core.story_payload import CACHE_CONTROL, make_story_payload, ensure_compact, etag_matches
+from db.database import get_async_db
+from db.story_repository import select_subtree, select_children
+from db.story_library import select_session_stories, encode_cursor, decode_cursor
+from models.story import Story, StoryNode, StoryPayload
+from models.job import StoryJob, JobStatus
+from schemas.story import (
+    CompleteStoryResponse, CreateStoryRequest, StoryNodeResponse, StoryNodeNavigationResponse,
+    StoryHintResponse, StoryOptionHint, StoryLibraryResponse, StorySummaryResponse,
+)
 from schemas.job import StoryJobResponse
-from core.story_generator import StoryGenerator
 
 router = APIRouter(
     prefix='/stories',
     tags=['stories']
 )
 
+# Lease owner name for jobs this API process runs inline
+API_WORKER_ID = job_queue.make_worker_id("api")
+
 # Purpose:
 # Tracks users across multiple API requests
 # Persists in browser via cookies
@@ -27,11 +42,16 @@ def get_session_id(session_id: Optional[str] = Cookie(None)):
 
 # User sends theme → Job created → Background task queued → Immediate response
 @router.post("/create", response_model=StoryJobResponse)
-def create_story(request: CreateStoryRequest, background_tasks: BackgroundTasks, response: Response, session_id: str = Depends(get_session_id), db: Session = Depends(get_db)):
+async def create_story(request: CreateStoryRequest, background_tasks: BackgroundTasks, response: Response, session_id: str = Depends(get_session_id), db: AsyncSession = Depends(get_async_db)):
     """
     Initiates the story generation process based on the provided theme.
     This endpoint creates a new story job and processes it in the background.
+    Responds 429 with Retry-After when the session, or the service as a whole, is over its limits.
     """
+    rejection = await admission_controller.admit(db, session_id)
+    if rejection is not None:
+        raise HTTPException(status_code=429, detail=rejection.detail, headers={"Retry-After": str(rejection.retry_after)})
+
     response.set_cookie(key="session_id", value=session_id, httponly=True)
     job_id = str(uuid.uuid4())
 
@@ -39,87 +59,218 @@ def create_story(request: CreateStoryRequest, background_tasks: BackgroundTasks,
         job_id = job_id,            # Unique job identifier
         session_id = session_id,    # Link to user session
         theme = request.theme,      # User's story theme
-        status = "pending"          # Initial job state
+        allow_similar = request.allow_similar,
+        token_budget = request.token_budget,
+        status = JobStatus.PENDING, # Initial job state
+        max_attempts = settings.JOB_MAX_ATTEMPTS
     )
 
     db.add(job)
-    db.commit()
+    await db.commit()
 
-    background_tasks.add_task(generate_story_task, job_id, request.theme, session_id)
+    # In "worker" mode the committed row is the whole hand-off: worker.py
+    # processes claim it from story_jobs.
+    if settings.JOB_EXECUTION_MODE == "inline":
+        background_tasks.add_task(generate_story_task, job_id)
     return job
 
 # Background story Generation task, AI work
 # "pending" → "processing" → "completed" (success)
 #                       ↓
-#                    "failed" (on error)
-def generate_story_task(job_id: str, theme: str, session_id: str):
-    db = SessionLocal() # New DB session for background task
+#                    "failed" (on error, once retries are exhausted)
+# Declared async so BackgroundTasks runs it on the event loop rather than
+# handing it to the threadpool. The job is claimed through the durable queue,
+# so if this process dies mid-generation another process picks it up again.
+async def generate_story_task(job_id: str):
+    await job_queue.run_job(job_id, API_WORKER_ID)
 
+# Story Library Endpoint - the session's stories, newest first
+# Keyset pagination (db/story_library.py): the cost of a page depends on its
+# size, not on how many stories the session has or how far it has scrolled.
+@router.get("", response_model=StoryLibraryResponse)
+async def list_stories(
+    limit: int = Query(settings.LIBRARY_PAGE_SIZE, ge=1, le=settings.MAX_LIBRARY_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    session_id: str = Depends(get_session_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Lists the stories of the current session (session cookie) without their nodes.
+    """
     try:
-        job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first()
-        if not job:
-            return
-        
-        try:
-            job.status = "processing"
-            db.commit()
-            
-            # story generation logic
-            story = StoryGenerator.generate_story(db, session_id, theme)
-
-            job.story_id = story.id             # Link generated story to job   
-            job.status = "completed"            # Mark as successful
-            job.completed_at = datetime.now()   # Record completion time
-            db.commit()
-        
-        except Exception as e:
-            job.status = "failed"
-            job.completed_at = datetime.now()
-            job.error = str(e)
-            db.commit()
-
-    finally:
-        db.close()
+        after_id = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # One row more than requested tells whether another page exists
+    rows = (await db.execute(select_session_stories(session_id, limit + 1, after_id))).all()
+    stories = [StorySummaryResponse.model_validate(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(stories[-1].id) if len(rows) > limit else None
+    return StoryLibraryResponse(stories=stories, next_cursor=next_cursor)
+
+# Reuse counters for this process (hits + coalesced + similarity matches = LLM calls saved)
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    Returns hit/miss counters of the story theme cache and similarity index,
+    and on-demand expansion counters (incremental generation).
+    """
+    return {**story_cache.stats(), "similarity": similarity_index.stats(), "expansion": story_expander.stats()}
 
 # Story Retrieval Endpoint - Get Complete Story
 #  Purpose: Returns the full interactive story with all paths and choices
-@router.get("/{story_id}/complete", response_model=CompleteStoryResponse)
-def get_complete_story(story_id: int, db: Session = Depends(get_db)):
+#  Served from the payload precomputed at generation time: one primary-key
+#  lookup, no per-node work. The strong ETag lets browsers and CDNs revalidate
+#  with If-None-Match (304) or skip the request entirely (immutable).
+#  ?format=compact returns CompactStoryResponse instead.
+@router.get(
+    "/{story_id}/complete",
+    response_model=CompleteStoryResponse,
+    responses={200: {"description": "CompleteStoryResponse, or CompactStoryResponse with ?format=compact"}},
+)
+async def get_complete_story(
+    story_id: int,
+    format: Literal["full", "compact"] = Query("full"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Retrieves the complete story including all nodes and choices.
     """
-    story = db.query(Story).filter(Story.id == story_id).first()
+    payload = await db.get(StoryPayload, story_id)
+    immutable = True
+    if payload is None or (format == "compact" and payload.compact_body is None):
+        payload, immutable = await build_story_payload(db, story_id, payload)
+
+    body, etag = (payload.compact_body, payload.compact_etag) if format == "compact" else (payload.body, payload.etag)
+    # A story that is still streaming in changes between requests
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL if immutable else "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Stories generated before payloads (or the compact format) existed are
+# serialized on first read and stored, after which they are served like any other.
+# Incomplete (still streaming) stories are serialized per request and not stored.
+# Returns the payload and whether it is final.
+async def build_story_payload(db: AsyncSession, story_id: int, payload: Optional[StoryPayload] = None) -> Tuple[StoryPayload, bool]:
+    story = await db.get(Story, story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    
-    complete_story = build_complete_story_tree(db, story)
-    return complete_story
-
-def build_complete_story_tree(db: Session, story: Story) -> CompleteStoryResponse:
-    nodes = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
-    node_dict = {}
-    for node in nodes:
-        node_response = CompleteStoryNodeResponse(
-            id=node.id,
-            content=node.content,
-            is_ending=node.is_ending,
-            is_winning_ending=node.is_winning_ending,
-            is_root=node.is_root,
-            options=node.options
-        )
-        node_dict[node.id] = node_response
 
-    root_node = next((n for n in node_dict.values() if n.is_root), None)
-    if not root_node:
+    nodes = (await db.scalars(select(StoryNode).where(StoryNode.story_id == story.id))).all()
+    try:
+        if payload is None:
+            payload = make_story_payload(story, nodes)
+            if not story.is_complete:
+                return payload, False
+            db.add(payload)
+        else:
+            ensure_compact(payload, story, nodes)
+    except ValueError:
         raise HTTPException(status_code=500, detail="Root node not found")
-    
-    return CompleteStoryResponse(
-        id=story.id,
-        title=story.title,
-        session_id=story.session_id,
-        created_at=story.created_at,
-        root_node=node_dict[root_node.id],
-        all_nodes=node_dict
+
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()  # Another request stored it first; the bodies are identical
+    return payload, True
+
+# Node Navigation Endpoints - Lazy, one node at a time
+# Purpose: Serve only what the player is looking at (plus the next choices)
+# instead of the whole tree. Cost scales with `depth`, not story size.
+# Incrementally generated stories are written here: a placeholder node is
+# expanded before it is returned, and the unwritten choices of the returned
+# node are expanded in the background (core/story_expander.py).
+@router.get("/{story_id}/nodes/root", response_model=StoryNodeNavigationResponse)
+async def get_root_node(
+    story_id: int,
+    depth: int = Query(settings.NODE_PREFETCH_DEPTH, ge=0, le=settings.MAX_NODE_PREFETCH_DEPTH),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieves the starting node of a story with its children pre-fetched.
+    """
+    root_id = await db.scalar(select(StoryNode.id).where(StoryNode.story_id == story_id, StoryNode.is_root == True))
+    if root_id is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+
+    return await build_node_navigation(db, story_id, root_id, depth)
+
+@router.get("/{story_id}/nodes/{node_id}", response_model=StoryNodeNavigationResponse)
+async def get_story_node(
+    story_id: int,
+    node_id: int,
+    depth: int = Query(settings.NODE_PREFETCH_DEPTH, ge=0, le=settings.MAX_NODE_PREFETCH_DEPTH),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieves a single story node with its children pre-fetched.
+    """
+    return await build_node_navigation(db, story_id, node_id, depth)
+
+async def build_node_navigation(db: AsyncSession, story_id: int, node_id: int, depth: int) -> StoryNodeNavigationResponse:
+    # One recursive query: the node itself comes first (depth 0)
+    nodes = (await db.scalars(select_subtree(node_id, depth))).unique().all()
+    if not nodes or nodes[0].story_id != story_id:
+        raise HTTPException(status_code=404, detail="Node not found")
+
+    if not nodes[0].is_expanded:
+        try:
+            await story_expander.expand(node_id)
+        except Exception:
+            raise HTTPException(status_code=503, detail="Failed to write this part of the story, please retry")
+        nodes = (await db.scalars(
+            select_subtree(node_id, depth).execution_options(populate_existing=True)
+        )).unique().all()
+
+    node, *descendants = nodes
+    # The player's next click is one of these
+    child_ids = {option.get("node_id") for option in node.options or []}
+    story_expander.speculate(child.id for child in descendants if child.id in child_ids and not child.is_expanded)
+    return StoryNodeNavigationResponse(
+        story_id=story_id,
+        node=StoryNodeResponse.model_validate(node),
+        prefetched={child.id: StoryNodeResponse.model_validate(child) for child in descendants},
+    )
+
+# Hint Endpoint - precomputed graph metadata of a node and its choices
+# Two index lookups (the node, its children); nothing is traversed or written.
+@router.get("/{story_id}/nodes/{node_id}/hint", response_model=StoryHintResponse)
+async def get_node_hint(story_id: int, node_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Tells whether a winning ending is still reachable from a node and which choice gets there soonest.
+    """
+    node = await db.get(StoryNode, node_id)
+    if node is None or node.story_id != story_id:
+        raise HTTPException(status_code=404, detail="Node not found")
+    story_complete = await db.scalar(select(Story.is_complete).where(Story.id == story_id))
+
+    children = {child.id: child for child in (await db.scalars(select_children(node_id))).all()}
+    options = [
+        StoryOptionHint(
+            position=position,
+            text=option["text"],
+            node_id=child.id,
+            reachable_endings=child.reachable_endings,
+            reachable_winning_endings=child.reachable_winning_endings,
+            winning_distance=child.winning_distance,
+            is_expanded=child.is_expanded,
+        )
+        for position, option in enumerate(node.options or [])
+        if (child := children.get(option.get("node_id"))) is not None
+    ]
+    winning = [option for option in options if option.winning_distance is not None]
+    return StoryHintResponse(
+        story_id=story_id,
+        node_id=node_id,
+        reachable_endings=node.reachable_endings,
+        reachable_winning_endings=node.reachable_winning_endings,
+        winning_distance=node.winning_distance,
+        can_still_win=node.winning_distance is not None,
+        best_option=min(winning, key=lambda option: option.winning_distance).position if winning else None,
+        is_final=bool(story_complete),
+        options=options,
     )
 
 # {
@@ -3,6 +3,8 @@ from typing import Optional
 from datetime import datetime
 from pydantic import BaseModel
 
+from models.job import JobStatus
+
 # Workflow Overview:
 # User Request → Create Job → Background Processing → Job Completion
 #      ↓              ↓               ↓                    ↓
@@ -22,8 +24,15 @@ class StoryJobBase(BaseModel):
 
 # Purpose: Complete job status response for tracking story generation progress
 # job_id: int: Unique identifier for this specific job
-# status: str: Current job state (e.g., "pending", "processing", "completed", "failed")
-# story_id: Optional[int] = None: ID of generated story (only set when job completes successfully)
+# status: JobStatus: Current job state ("pending", "processing", "completed" or "failed")
+# story_id: Optional[int] = None: ID of generated story (set when the job completes, or as soon as
+#                                  the root node is stored when streaming generation is enabled)
+# nodes_generated: int = 0: Story nodes stored so far
+# prompt_tokens / completion_tokens: int = 0: LLM tokens spent on this job (all attempts;
+#                                            0 when the story came from the cache or a similar story)
+# repair_attempts: int = 0: Requests that re-generated invalid parts of a malformed response
+# tokens_saved: int = 0: Tokens a full regeneration would have cost beyond those requests
+# token_budget: Optional[int] = None: Completion token budget the story was requested with
 # error: Optional[str] = None: Error message if job failed
 # created_at: datetime: When the job was started
 # completed_at: Optional[datetime] = None: When the job finished (null if still running)
@@ -33,6 +42,7 @@ class StoryJobBase(BaseModel):
 #   "job_id": 12345,
 #   "status": "processing",
 #   "story_id": null,
+#   "nodes_generated": 0,
 #   "error": null,
 #   "created_at": "2025-09-29T10:30:00Z",
 #   "completed_at": null
@@ -42,14 +52,23 @@ class StoryJobBase(BaseModel):
 #   "job_id": 12345,
 #   "status": "completed",
 #   "story_id": 567,
+#   "nodes_generated": 18,
+#   "prompt_tokens": 412,
+#   "completion_tokens": 1876,
 #   "error": null,
 #   "created_at": "2025-09-29T10:30:00Z",
 #   "completed_at": "2025-09-29T10:32:15Z"
 # }
 class StoryJobResponse(BaseModel):
     job_id: str
-    status: str
+    status: JobStatus
     story_id: Optional[int] = None
+    nodes_generated: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    repair_attempts: int = 0
+    tokens_saved: int = 0
+    token_budget: Optional[int] = None
     error: Optional[str] = None
     created_at: datetime
     completed_at: Optional[datetime] = None
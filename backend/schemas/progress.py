@@ -0,0 +1,35 @@
+from typing import Optional
+from pydantic import BaseModel
+from datetime import datetime
+
+
+# Purpose: A choice the player made (POST /stories/{story_id}/progress)
+# node_id: int: Node the player moved to
+# from_node_id: Optional[int] = None: Node the choice was made at; omit when
+#                                     starting or restarting at the root
+# Example:
+# {
+#   "node_id": 5,
+#   "from_node_id": 2
+# }
+class RecordChoiceRequest(BaseModel):
+    node_id: int
+    from_node_id: Optional[int] = None
+
+
+# Purpose: Where the session is in a story, to resume it (GET /stories/{story_id}/progress)
+# node_id: int: Node to resume at
+# choices: int: Choices made in this story so far
+# updated_at: datetime: Time of the latest choice
+# Example:
+# {
+#   "story_id": 1,
+#   "node_id": 5,
+#   "choices": 3,
+#   "updated_at": "2025-09-29T10:30:00Z"
+# }
+class StoryProgressResponse(BaseModel):
+    story_id: int
+    node_id: int
+    choices: int
+    updated_at: datetime
@@ -1,7 +1,9 @@
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Any
 from pydantic import BaseModel, Field
 from datetime import datetime
 
+from core.config import settings
+
 # How they relate and work together:
 # 1. API Request: User sends CreateStoryRequest with a theme
 # 2. Story Generation: Backend creates story with multiple StoryNodes
@@ -43,6 +45,8 @@ class StoryNodeBase(BaseModel):
 # Purpose: Full story node response with ID and options (inherits from StoryNodeBase)
 # id: int: Unique identifier for the node
 # options: List[StoryOptionsSchema] = []: List of choices available from this node
+# is_expanded: bool = True: False for a scene not written yet (incremental generation);
+#                           fetch it through GET /stories/{story_id}/nodes/{node_id}
 # Config: from_attributes = True: Allows creation from SQLAlchemy model attributes
 # {
 #   "id": 1,
@@ -57,6 +61,7 @@ class StoryNodeBase(BaseModel):
 class CompleteStoryNodeResponse(StoryNodeBase):
     id: int
     options: List[StoryOptionsSchema] = []
+    is_expanded: bool = True
 
     class Config:
         from_attributes = True
@@ -76,12 +81,18 @@ class StoryBase(BaseModel):
 
 # Purpose: Request payload when user wants to create a new story
 # theme: str: The theme/genre for story generation (e.g., "medieval fantasy", "space adventure")
+# allow_similar: bool = True: Set to false to always get a freshly generated story
+#                             instead of a copy of a story with a near-identical theme
+# token_budget: Optional[int] = None: Completion tokens the story may use; smaller budgets
+#                                      get fewer levels and options per scene
 # Example usage:
 # {
 #   "theme": "underwater adventure with pirates"
 # }
 class CreateStoryRequest(BaseModel):
     theme: str
+    allow_similar: bool = True
+    token_budget: Optional[int] = Field(None, ge=settings.MIN_STORY_TOKEN_BUDGET, le=settings.MAX_STORY_TOKEN_BUDGET)
 
     
 # Purpose: Complete story response with all data (inherits from StoryBase)
@@ -114,3 +125,138 @@ class CompleteStoryResponse(StoryBase):
 
     class Config:
         from_attributes = True
+
+
+# Purpose: Story node of the navigation endpoints, with its graph metadata
+#          (precomputed when the story was written, see core/story_graph.py)
+# depth: Optional[int]: Choices from the start of the story
+# subtree_size: Optional[int]: Scenes reachable from here, this one included
+# reachable_endings / reachable_winning_endings: Optional[int]: Endings reachable from here
+# winning_distance: Optional[int]: Choices to the nearest winning ending, null if none is reachable
+# While a story is still being written (incremental generation) the counts
+# cover the scenes written so far. null everywhere for nodes without metadata.
+class StoryNodeResponse(CompleteStoryNodeResponse):
+    depth: Optional[int] = None
+    subtree_size: Optional[int] = None
+    reachable_endings: Optional[int] = None
+    reachable_winning_endings: Optional[int] = None
+    winning_distance: Optional[int] = None
+
+
+# Purpose: A single node plus the nodes reachable within a few choices of it,
+#          so the client can render the node and answer the next click without
+#          downloading the whole story
+# story_id: int: Story the node belongs to
+# node: StoryNodeResponse: The requested node
+# prefetched: Dict[int, StoryNodeResponse]: Descendants up to the requested depth, by ID
+# Example (depth=1):
+# {
+#   "story_id": 1,
+#   "node": {"id": 1, "content": "You approach a dark castle...", "options": [{"text": "Enter", "node_id": 2}, ...]},
+#   "prefetched": {
+#     "2": {...},
+#     "3": {...}
+#   }
+# }
+class StoryNodeNavigationResponse(BaseModel):
+    story_id: int
+    node: StoryNodeResponse
+    prefetched: Dict[int, StoryNodeResponse] = {}
+
+
+# Purpose: Where the choices of a node lead (GET /stories/{story_id}/nodes/{node_id}/hint)
+# position: int: Index of the option in the node's options
+# Other fields: graph metadata of the node the option leads to (see StoryNodeResponse)
+class StoryOptionHint(BaseModel):
+    position: int
+    text: str
+    node_id: int
+    reachable_endings: Optional[int] = None
+    reachable_winning_endings: Optional[int] = None
+    winning_distance: Optional[int] = None
+    is_expanded: bool = True
+
+
+# Purpose: Hint for a player at a node: can they still win, and which choice
+#          leads to a winning ending in the fewest steps
+# can_still_win: bool: A winning ending is reachable from this node
+# best_option: Optional[int]: Position of the option closest to a winning ending
+# is_final: bool: False while the story is still being written; the counts
+#                 then cover the scenes written so far
+# Example:
+# {
+#   "story_id": 1,
+#   "node_id": 4,
+#   "reachable_endings": 5,
+#   "reachable_winning_endings": 2,
+#   "winning_distance": 2,
+#   "can_still_win": true,
+#   "best_option": 1,
+#   "is_final": true,
+#   "options": [{"position": 0, "text": "Run", "node_id": 7, "reachable_endings": 2, ...}, ...]
+# }
+class StoryHintResponse(BaseModel):
+    story_id: int
+    node_id: int
+    reachable_endings: Optional[int] = None
+    reachable_winning_endings: Optional[int] = None
+    winning_distance: Optional[int] = None
+    can_still_win: bool
+    best_option: Optional[int] = None
+    is_final: bool
+    options: List[StoryOptionHint] = []
+
+
+# Purpose: One entry of a session's story library (titles and metadata, no nodes)
+# is_complete: bool: False while the story is still being written
+# node_count / ending_count / max_depth: Optional[int]: Shape of a complete story, null otherwise
+class StorySummaryResponse(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+    is_complete: bool = True
+    node_count: Optional[int] = None
+    ending_count: Optional[int] = None
+    max_depth: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+# Purpose: A page of the session's stories, newest first (GET /stories)
+# next_cursor: Optional[str]: Pass as ?cursor= to get the next page, null on the last page
+# Example:
+# {
+#   "stories": [{"id": 12, "title": "The Haunted Castle", "created_at": "2025-09-29T10:30:00Z", "is_complete": true, ...}],
+#   "next_cursor": "MTI"
+# }
+class StoryLibraryResponse(BaseModel):
+    stories: List[StorySummaryResponse]
+    next_cursor: Optional[str] = None
+
+
+# Purpose: Compact wire format of a complete story (GET /stories/{id}/complete?format=compact)
+#          Nodes are an array instead of an ID-keyed object, options point at
+#          array indexes, and the root is referenced by index instead of repeated.
+# root: int: Index of the root node in `nodes`
+# nodes: List of [id, content, flags, options]
+#   flags: int: bit 1 = is_ending, bit 2 = is_winning_ending, bit 4 = not expanded yet
+#   options: List of [text, index of the next node in `nodes`]
+# Example:
+# {
+#   "id": 1,
+#   "title": "The Haunted Castle",
+#   "session_id": "abc123",
+#   "created_at": "2025-09-29T10:30:00Z",
+#   "root": 0,
+#   "nodes": [
+#     [1, "You approach a dark castle...", 0, [["Enter the front door", 1], ["Sneak around back", 2]]],
+#     [2, "The door creaks open...", 3, []],
+#     ...
+#   ]
+# }
+class CompactStoryResponse(StoryBase):
+    id: int
+    created_at: datetime
+    root: int
+    nodes: List[Tuple[int, str, int, List[Tuple[str, Optional[int]]]]]
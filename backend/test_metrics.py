@@ -4,11 +4,13 @@ This generates quantifiable data for resume and documentation.
 """
 import time
 import json
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, func
 from sqlalchemy.orm import sessionmaker
 from core.story_generator import StoryGenerator
 from db.database import Base
+from db.story_analytics import select_stats_summary, select_story_details
 from models.story import Story, StoryNode
+from models.job import StoryJob
 
 # Connect to database
 engine = create_engine("sqlite:///./database.db")
@@ -16,65 +18,86 @@ SessionLocal = sessionmaker(bind=engine)
 
 def measure_story_complexity():
     """Measure average nodes, depth, and branching factor"""
+    # Two aggregate queries over story_stats (one row per complete story),
+    # no matter how many stories and nodes there are
     db = SessionLocal()
     try:
-        stories = db.query(Story).all()
-        if not stories:
+        summary = db.execute(select_stats_summary()).one()
+        if not summary.total_stories:
             print("⚠️  No stories in database yet. Generate a story first!")
             return None
-        
+
         metrics = {
-            "total_stories": len(stories),
-            "total_nodes": 0,
-            "max_nodes_per_story": 0,
-            "min_nodes_per_story": float('inf'),
-            "stories_with_data": []
+            "total_stories": summary.total_stories,
+            "total_nodes": summary.total_nodes,
+            "max_nodes_per_story": summary.max_nodes_per_story,
+            "min_nodes_per_story": summary.min_nodes_per_story,
+            "avg_nodes_per_story": float(summary.avg_nodes_per_story),
+            "total_endings": summary.total_endings,
+            "total_winning_endings": summary.total_winning_endings,
+            "avg_max_depth": float(summary.avg_max_depth),
+            "max_depth": summary.max_depth,
+            "avg_branching_factor": float(summary.avg_branching_factor or 0),
+            "stories_with_data": [
+                {
+                    "id": story.id,
+                    "title": story.title,
+                    "nodes": story.node_count,
+                    "endings": story.ending_count,
+                    "winning_endings": story.winning_ending_count,
+                    "max_depth": story.max_depth,
+                }
+                for story in db.execute(select_story_details(limit=20))
+            ]
         }
         
-        for story in stories:
-            node_count = len(story.nodes)
-            metrics["total_nodes"] += node_count
-            metrics["max_nodes_per_story"] = max(metrics["max_nodes_per_story"], node_count)
-            metrics["min_nodes_per_story"] = min(metrics["min_nodes_per_story"], node_count)
-            
-            # Count endings
-            endings = sum(1 for node in story.nodes if not node.options)
-            winning_endings = sum(1 for node in story.nodes if getattr(node, 'is_winning_ending', False))
-            
-            metrics["stories_with_data"].append({
-                "id": story.id,
-                "title": story.title,
-                "nodes": node_count,
-                "endings": endings,
-                "winning_endings": winning_endings
-            })
-        
-        metrics["avg_nodes_per_story"] = metrics["total_nodes"] / len(stories) if stories else 0
-        
         return metrics
     finally:
         db.close()
 
 def estimate_token_usage():
-    """Estimate average token usage per story generation"""
-    # Based on typical GPT-4 usage patterns
-    avg_prompt_tokens = 350  # System prompt + user theme + instructions
-    avg_completion_tokens_per_node = 150  # Story text + options
-    avg_nodes = 7  # Typical story has 5-10 nodes
-    
-    total_tokens = avg_prompt_tokens + (avg_completion_tokens_per_node * avg_nodes)
+    """Average token usage and cost per story generation"""
+    # Recorded per job from the LLM response metadata; jobs served from the
+    # story cache or a similar story spent no tokens and are left out
+    db = SessionLocal()
+    try:
+        jobs, avg_prompt_tokens, avg_completion_tokens = db.query(
+            func.count(StoryJob.id),
+            func.avg(StoryJob.prompt_tokens),
+            func.avg(StoryJob.completion_tokens),
+        ).filter(
+            StoryJob.status == "completed",
+            StoryJob.prompt_tokens + StoryJob.completion_tokens > 0,
+        ).one()
+    finally:
+        db.close()
+
+    if jobs:
+        source = f"measured over {jobs} jobs"
+        avg_prompt_tokens = round(avg_prompt_tokens)
+        avg_completion_tokens = round(avg_completion_tokens)
+    else:
+        # Nothing recorded yet: based on typical GPT-4 usage patterns
+        source = "estimate, no recorded jobs"
+        avg_prompt_tokens = 350  # System prompt + user theme + instructions
+        avg_completion_tokens_per_node = 150  # Story text + options
+        avg_nodes = 7  # Typical story has 5-10 nodes
+        avg_completion_tokens = avg_completion_tokens_per_node * avg_nodes
+
+    total_tokens = avg_prompt_tokens + avg_completion_tokens
     
     # GPT-4o-mini pricing (as of Oct 2025)
     input_cost_per_1k = 0.00015  # $0.15 per 1M tokens
     output_cost_per_1k = 0.0006   # $0.60 per 1M tokens
     
     cost_per_story = ((avg_prompt_tokens / 1000) * input_cost_per_1k + 
-                     (avg_completion_tokens_per_node * avg_nodes / 1000) * output_cost_per_1k)
+                     (avg_completion_tokens / 1000) * output_cost_per_1k)
     
     return {
+        "source": source,
         "avg_tokens_per_story": total_tokens,
         "avg_prompt_tokens": avg_prompt_tokens,
-        "avg_completion_tokens": avg_completion_tokens_per_node * avg_nodes,
+        "avg_completion_tokens": avg_completion_tokens,
         "estimated_cost_per_story": round(cost_per_story, 4),
         "stories_per_dollar": int(1 / cost_per_story) if cost_per_story > 0 else "N/A"
     }
@@ -112,15 +135,20 @@ if __name__ == "__main__":
         print(f"   Average Nodes per Story: {complexity['avg_nodes_per_story']:.1f}")
         print(f"   Max Nodes in Story: {complexity['max_nodes_per_story']}")
         print(f"   Total Nodes Created: {complexity['total_nodes']}")
+        print(f"   Average Max Depth: {complexity['avg_max_depth']:.1f} (deepest: {complexity['max_depth']})")
+        print(f"   Average Branching Factor: {complexity['avg_branching_factor']:.2f}")
+        print(f"   Endings: {complexity['total_endings']} ({complexity['total_winning_endings']} winning)")
         
         if complexity['stories_with_data']:
-            print("\n   📖 Story Details:")
+            print("\n   📖 Story Details (latest 20):")
             for story in complexity['stories_with_data']:
-                print(f"      • {story['title']}: {story['nodes']} nodes, {story['endings']} endings")
+                print(f"      • {story['title']}: {story['nodes']} nodes, {story['endings']} endings, depth {story['max_depth']}")
     
-    print("\n💰 Token Usage & Cost Estimates:")
+    print("\n💰 Token Usage & Cost:")
     tokens = estimate_token_usage()
-    print(f"   Avg Tokens per Story: ~{tokens['avg_tokens_per_story']} tokens")
+    print(f"   Source: {tokens['source']}")
+    print(f"   Avg Tokens per Story: ~{tokens['avg_tokens_per_story']} tokens "
+          f"({tokens['avg_prompt_tokens']} prompt + {tokens['avg_completion_tokens']} completion)")
     print(f"   Estimated Cost per Story: ${tokens['estimated_cost_per_story']}")
     print(f"   Stories per Dollar: ~{tokens['stories_per_dollar']}")
     
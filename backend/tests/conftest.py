@@ -0,0 +1,39 @@
+# Tests run against a throwaway SQLite file and the offline fake LLM.
+# Settings and engines are created when core.config and db.database are
+# imported, so the environment is set before any application module is.
+import os
+import asyncio
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="cyoa-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ.setdefault("ALLOWED_ORIGINS", "")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest
+
+from db.database import Base, engine, async_engine, create_tables
+import models.story, models.job, models.progress  # Registers the tables with Base
+
+
+# Fresh tables for every test
+@pytest.fixture(autouse=True)
+def database():
+    create_tables()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+# Runs a coroutine on a new event loop. aiosqlite connections belong to the
+# loop that opened them, so the pool is emptied before the loop closes.
+@pytest.fixture
+def run():
+    def run(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
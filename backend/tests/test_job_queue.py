@@ -0,0 +1,268 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from core import job_queue
+from core.config import settings
+from core.job_queue import claim_job, claim_next_job, fail_job, heartbeat_job, run_job, run_worker
+from db.database import AsyncSessionLocal
+from models.job import StoryJob, JobStatus
+
+
+async def add_job(**values) -> StoryJob:
+    async with AsyncSessionLocal() as db:
+        job = StoryJob(
+            job_id=str(uuid.uuid4()),
+            session_id="test-session",
+            theme="haunted lighthouse",
+            status=JobStatus.PENDING,
+            max_attempts=3,
+            **values,
+        )
+        db.add(job)
+        await db.commit()
+        return job
+
+
+async def get_job(job_pk: int) -> StoryJob:
+    async with AsyncSessionLocal() as db:
+        return await db.get(StoryJob, job_pk)
+
+
+async def set_job(job_pk: int, **values):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(StoryJob).where(StoryJob.id == job_pk).values(**values))
+        await db.commit()
+
+
+def test_claim_takes_lease(run):
+    async def scenario():
+        job = await add_job()
+        async with AsyncSessionLocal() as db:
+            claimed = await claim_job(db, job.job_id, "worker-a")
+        async with AsyncSessionLocal() as db:
+            again = await claim_job(db, job.job_id, "worker-b")
+        return claimed, again
+
+    claimed, again = run(scenario())
+    assert claimed.status == JobStatus.PROCESSING
+    assert claimed.locked_by == "worker-a"
+    assert claimed.attempts == 1
+    assert claimed.lease_expires_at > datetime.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS - 10)
+    assert again is None
+
+
+def test_racing_claimers_only_one_wins(run):
+    async def scenario():
+        job = await add_job()
+        async with AsyncSessionLocal() as db_a, AsyncSessionLocal() as db_b:
+            # Both saw the job as claimable; only one compare-and-set succeeds
+            results = await asyncio.gather(
+                job_queue._try_claim(db_a, job.id, "worker-a"),
+                job_queue._try_claim(db_b, job.id, "worker-b"),
+            )
+        return results, await get_job(job.id)
+
+    results, job = run(scenario())
+    winners = [claimed for claimed in results if claimed is not None]
+    assert len(winners) == 1
+    assert job.locked_by == winners[0].locked_by
+    assert job.attempts == 1
+
+
+def test_many_claimers_share_jobs_without_overlap(run):
+    async def scenario():
+        jobs = [await add_job() for _ in range(5)]
+
+        async def claimer(worker_id):
+            async with AsyncSessionLocal() as db:
+                return await claim_next_job(db, worker_id)
+
+        claimed = await asyncio.gather(*(claimer(f"worker-{i}") for i in range(8)))
+        return jobs, [job for job in claimed if job is not None]
+
+    jobs, claimed = run(scenario())
+    assert sorted(job.id for job in claimed) == sorted(job.id for job in jobs)
+
+
+def test_expired_lease_is_reclaimed(run):
+    async def scenario():
+        job = await add_job()
+        async with AsyncSessionLocal() as db:
+            await claim_job(db, job.job_id, "worker-a")
+            before_expiry = await claim_next_job(db, "worker-b")
+
+        # worker-a died: its lease runs out without heartbeats
+        await set_job(job.id, lease_expires_at=datetime.now() - timedelta(seconds=1))
+        async with AsyncSessionLocal() as db:
+            reclaimed = await claim_next_job(db, "worker-b")
+        return before_expiry, reclaimed, await heartbeat_job(job.id, "worker-a")
+
+    before_expiry, reclaimed, old_heartbeat = run(scenario())
+    assert before_expiry is None
+    assert reclaimed.locked_by == "worker-b"
+    assert reclaimed.attempts == 2
+    assert old_heartbeat is False
+
+
+def test_processing_job_without_lease_is_reclaimed(run):
+    async def scenario():
+        # Left "processing" before jobs had leases: no lease, no owner
+        job = await add_job()
+        await set_job(job.id, status=JobStatus.PROCESSING, lease_expires_at=None, locked_by=None)
+        async with AsyncSessionLocal() as db:
+            return await claim_next_job(db, "worker-b")
+
+    reclaimed = run(scenario())
+    assert reclaimed.status == JobStatus.PROCESSING
+    assert reclaimed.locked_by == "worker-b"
+    assert reclaimed.lease_expires_at is not None
+    assert reclaimed.attempts == 1
+
+
+def test_reclaim_past_max_attempts_fails_job(run):
+    async def scenario():
+        job = await add_job()
+        await set_job(job.id, status=JobStatus.PROCESSING, locked_by="worker-a", attempts=3,
+                      lease_expires_at=datetime.now() - timedelta(seconds=1))
+        async with AsyncSessionLocal() as db:
+            claimed = await claim_next_job(db, "worker-b")
+        return claimed, await get_job(job.id)
+
+    claimed, job = run(scenario())
+    assert claimed is None
+    assert job.status == JobStatus.FAILED
+    assert job.completed_at is not None
+
+
+def test_fail_job_retries_with_backoff(run):
+    async def scenario():
+        job = await add_job()
+        async with AsyncSessionLocal() as db:
+            claimed = await claim_job(db, job.job_id, "worker-a")
+            await fail_job(db, claimed, "first error")
+        first = await get_job(job.id)
+        async with AsyncSessionLocal() as db:
+            during_backoff = await claim_next_job(db, "worker-a")
+            await set_job(job.id, available_at=datetime.now() - timedelta(seconds=1))
+            claimed = await claim_next_job(db, "worker-a")
+            await fail_job(db, claimed, "second error")
+        second = await get_job(job.id)
+        return first, during_backoff, claimed, second
+
+    first, during_backoff, claimed, second = run(scenario())
+    assert first.status == JobStatus.PENDING
+    assert first.error == "first error"
+    assert first.locked_by is None and first.lease_expires_at is None
+    backoff = (first.available_at - datetime.now()).total_seconds()
+    assert 0 < backoff <= settings.JOB_RETRY_BACKOFF_SECONDS
+    assert during_backoff is None
+    assert claimed.attempts == 2
+    # Exponential: the second retry waits twice as long as the first
+    backoff = (second.available_at - datetime.now()).total_seconds()
+    assert settings.JOB_RETRY_BACKOFF_SECONDS < backoff <= 2 * settings.JOB_RETRY_BACKOFF_SECONDS
+
+
+def test_fail_job_fails_after_max_attempts(run):
+    async def scenario():
+        job = await add_job()
+        for attempt in range(3):
+            await set_job(job.id, available_at=None)
+            async with AsyncSessionLocal() as db:
+                claimed = await claim_next_job(db, "worker-a")
+                await fail_job(db, claimed, f"error {attempt + 1}")
+        async with AsyncSessionLocal() as db:
+            after = await claim_next_job(db, "worker-a")
+        return await get_job(job.id), after
+
+    job, after = run(scenario())
+    assert job.status == JobStatus.FAILED
+    assert job.attempts == 3
+    assert job.error == "error 3"
+    assert job.completed_at is not None
+    assert after is None
+
+
+def test_heartbeat_extends_lease(run):
+    async def scenario():
+        job = await add_job()
+        async with AsyncSessionLocal() as db:
+            await claim_job(db, job.job_id, "worker-a")
+        await set_job(job.id, lease_expires_at=datetime.now() + timedelta(seconds=5))
+        return await heartbeat_job(job.id, "worker-a"), await get_job(job.id)
+
+    beat, job = run(scenario())
+    assert beat is True
+    assert job.lease_expires_at > datetime.now() + timedelta(seconds=settings.JOB_LEASE_SECONDS - 10)
+
+
+def test_heartbeat_lost_when_locked_by_changes(run, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_HEARTBEAT_SECONDS", 0.01)
+
+    async def scenario():
+        job = await add_job()
+        async with AsyncSessionLocal() as db:
+            await claim_job(db, job.job_id, "worker-a")
+        lease = datetime.now() + timedelta(seconds=5)
+        await set_job(job.id, locked_by="worker-b", lease_expires_at=lease)
+        beat = await heartbeat_job(job.id, "worker-a")
+        # The heartbeat loop gives up instead of extending worker-b's lease
+        await asyncio.wait_for(job_queue._heartbeat_loop(job.id, "worker-a"), timeout=5)
+        return beat, lease, await get_job(job.id)
+
+    beat, lease, job = run(scenario())
+    assert beat is False
+    assert job.locked_by == "worker-b"
+    assert job.lease_expires_at == lease
+
+
+def test_run_job_completes_with_fake_llm(run):
+    async def scenario():
+        job = await add_job()
+        ran = await run_job(job.job_id, "api")
+        return ran, await get_job(job.id)
+
+    ran, job = run(scenario())
+    assert ran is True
+    assert job.status == JobStatus.COMPLETED
+    assert job.story_id is not None
+    assert job.locked_by is None
+
+
+def test_run_job_failure_is_retried(run, monkeypatch):
+    async def broken_generation(*args, **kwargs):
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(job_queue.StoryGenerator, "generate_story", broken_generation)
+
+    async def scenario():
+        job = await add_job()
+        await run_job(job.job_id, "api")
+        return await get_job(job.id)
+
+    job = run(scenario())
+    assert job.status == JobStatus.PENDING
+    assert job.attempts == 1
+    assert job.error == "LLM unavailable"
+    assert job.available_at > datetime.now()
+
+
+def test_worker_drains_queue(run, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_POLL_INTERVAL_SECONDS", 0.01)
+
+    async def scenario():
+        jobs = [await add_job() for _ in range(3)]
+        stop = asyncio.Event()
+        worker = asyncio.create_task(run_worker("worker", concurrency=2, stop=stop))
+        for _ in range(500):
+            statuses = [(await get_job(job.id)).status for job in jobs]
+            if all(status == JobStatus.COMPLETED for status in statuses):
+                break
+            await asyncio.sleep(0.01)
+        stop.set()
+        await worker
+        return statuses
+
+    assert run(scenario()) == [JobStatus.COMPLETED] * 3
@@ -0,0 +1,46 @@
+from core.similarity_index import SimilarityIndex, compute_signature, pack_signature
+from db.database import AsyncSessionLocal
+from models.story import Story, StorySignature
+
+
+async def add_story(story_id: int, theme: str):
+    async with AsyncSessionLocal() as db:
+        db.add(Story(id=story_id, title=theme.title(), session_id="test-session"))
+        db.add(StorySignature(story_id=story_id, theme=theme, theme_signature=pack_signature(compute_signature(theme))))
+        await db.commit()
+
+
+async def sync(index: SimilarityIndex):
+    async with AsyncSessionLocal() as db:
+        await index.sync(db)
+
+
+def test_sync_loads_new_signatures(run):
+    async def scenario():
+        index = SimilarityIndex(threshold=0.6)
+        await add_story(1, "pirates in space")
+        await sync(index)
+        await add_story(2, "a haunted lighthouse")
+        await sync(index)
+        return index
+
+    index = run(scenario())
+    assert len(index) == 2
+    assert index.query("space pirates")[0] == 1
+    assert index.query("haunted lighthouses")[0] == 2
+
+
+def test_sync_picks_up_story_committed_out_of_id_order(run):
+    async def scenario():
+        index = SimilarityIndex(threshold=0.6)
+        await add_story(5, "pirates in space")
+        await sync(index)
+        # Story 3 got its ID first but committed after story 5 was synced
+        await add_story(3, "a haunted lighthouse")
+        await sync(index)
+        await sync(index)  # Already indexed: not added again
+        return index
+
+    index = run(scenario())
+    assert len(index) == 2
+    assert index.query("haunted lighthouses")[0] == 3
@@ -0,0 +1,28 @@
+from sqlalchemy import select
+
+from core.config import settings
+from core.story_generator import StoryGenerator
+from db.database import AsyncSessionLocal
+from models.story import StorySignature
+
+
+async def generate(theme: str, token_budget=None):
+    async with AsyncSessionLocal() as db:
+        story = await StoryGenerator.generate_story(db, "test-session", theme, token_budget=token_budget)
+        signature = await db.scalar(select(StorySignature).where(StorySignature.story_id == story.id))
+        return story, signature
+
+
+def test_default_shape_story_is_indexed(run, monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_MODE", "single")
+    story, signature = run(generate("a haunted lighthouse"))
+    assert signature is not None
+
+
+def test_budgeted_story_is_not_indexed(run, monkeypatch):
+    # A smaller story must not be served to requests without a budget
+    for mode in ("single", "streaming"):
+        monkeypatch.setattr(settings, "GENERATION_MODE", mode)
+        story, signature = run(generate(f"a sunken {mode} city", token_budget=settings.MIN_STORY_TOKEN_BUDGET))
+        assert story.is_complete
+        assert signature is None
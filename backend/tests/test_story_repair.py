@@ -0,0 +1,170 @@
+import json
+
+import pytest
+
+from core.story_repair import salvage_story, parse_subtree
+
+
+def ending(content, winning=False):
+    return {"content": content, "isEnding": True, "isWinningEnding": winning, "options": None}
+
+
+def scene(content, *options):
+    return {
+        "content": content,
+        "isEnding": False,
+        "isWinningEnding": False,
+        "options": [{"text": text, "nextNode": next_node} for text, next_node in options],
+    }
+
+
+STORY = {
+    "title": "The Lighthouse",
+    "rootNode": scene(
+        "You reach the lighthouse at dusk.",
+        ("Climb the stairs", scene(
+            "The lamp room is dark.",
+            ("Light the lamp", ending("Ships find their way home.", winning=True)),
+            ("Wait in the dark", ending("Nobody comes.")),
+        )),
+        ("Ask for the keeper", scene(
+            "The keeper's door is locked.",
+            ("Knock", ending("The keeper lets you in.", winning=True)),
+            ("Break in", ending("The keeper is gone.")),
+        )),
+    ),
+}
+
+
+def hole_choices(salvaged):
+    return [hole.path[-1][1] for hole in salvaged.holes]
+
+
+def test_complete_story_has_no_holes():
+    salvaged = salvage_story(json.dumps(STORY))
+    assert salvaged.data == STORY
+    assert salvaged.holes == []
+    assert salvaged.valid_nodes == 7
+
+
+def test_markdown_fences_are_stripped():
+    salvaged = salvage_story(f"```json\n{json.dumps(STORY)}\n```")
+    assert salvaged.holes == []
+
+
+def test_truncated_option_text_is_not_a_choice():
+    text = json.dumps(STORY)
+    cut = text.index("Ask for the keeper") + len("Ask fo")
+
+    # Without "Ask fo" the opening scene has one choice left, too few
+    with pytest.raises(ValueError):
+        salvage_story(text[:cut])
+
+
+def test_truncated_option_becomes_hole_of_its_scene():
+    story = {
+        "title": "The Lighthouse",
+        "rootNode": scene(
+            "You reach the lighthouse at dusk.",
+            ("Climb the stairs", STORY["rootNode"]["options"][0]["nextNode"]),
+            ("Ask for the keeper", scene(
+                "The keeper's door is locked.",
+                ("Knock", ending("The keeper lets you in.", winning=True)),
+                ("Break in", ending("The keeper is gone.")),
+            )),
+            ("Walk the shore", ending("The tide takes you.")),
+        ),
+    }
+    text = json.dumps(story)
+    keeper_scene = json.dumps(story["rootNode"]["options"][1]["nextNode"])
+    cut = text.index(keeper_scene) + keeper_scene.index("Break in") + len("Bre")
+    salvaged = salvage_story(text[:cut])
+
+    # "Bre" is not kept as a choice; the keeper's scene has one choice left,
+    # so it is regenerated, and the choices after the cut are gone
+    root_choices = [option["text"] for option in salvaged.data["rootNode"]["options"]]
+    assert root_choices == ["Climb the stairs", "Ask for the keeper"]
+    assert hole_choices(salvaged) == ["Ask for the keeper"]
+    assert salvaged.data["rootNode"]["options"][1]["nextNode"] is None
+    assert salvaged.valid_nodes == 4
+
+
+def test_truncated_scene_becomes_hole():
+    text = json.dumps(STORY)
+    cut = text.index("The keeper's door") + len("The keeper's")
+    salvaged = salvage_story(text[:cut])
+
+    assert hole_choices(salvaged) == ["Ask for the keeper"]
+    assert [hole.path[0][0] for hole in salvaged.holes] == ["You reach the lighthouse at dusk."]
+    assert salvaged.valid_nodes == 4
+
+
+def test_truncated_ending_is_not_trusted():
+    text = json.dumps(STORY)
+    cut = text.index("The keeper is gone.") + len("The keeper is gone.")
+    salvaged = salvage_story(text[:cut])
+
+    # Its isWinningEnding (or the rest of its content) may be what was cut
+    assert hole_choices(salvaged) == ["Break in"]
+    assert salvaged.valid_nodes == 6
+
+
+def test_missing_is_ending_is_repaired_locally():
+    story = json.loads(json.dumps(STORY))
+    del story["rootNode"]["options"][0]["nextNode"]["isEnding"]
+    salvaged = salvage_story(json.dumps(story))
+
+    assert salvaged.holes == []
+    assert salvaged.data["rootNode"]["options"][0]["nextNode"]["isEnding"] is False
+
+
+def test_missing_is_ending_without_options_is_a_hole():
+    story = json.loads(json.dumps(STORY))
+    del story["rootNode"]["options"][1]["nextNode"]["options"][0]["nextNode"]["isEnding"]
+    salvaged = salvage_story(json.dumps(story))
+
+    assert hole_choices(salvaged) == ["Knock"]
+    assert salvaged.valid_nodes == 6
+
+
+def test_bad_next_node_is_a_hole():
+    story = json.loads(json.dumps(STORY))
+    story["rootNode"]["options"][0]["nextNode"] = "The lamp room is dark."
+    salvaged = salvage_story(json.dumps(story))
+
+    assert hole_choices(salvaged) == ["Climb the stairs"]
+    assert salvaged.holes[0].option is salvaged.data["rootNode"]["options"][0]
+    assert salvaged.valid_nodes == 4
+
+
+def test_scene_with_one_choice_is_a_hole():
+    story = json.loads(json.dumps(STORY))
+    del story["rootNode"]["options"][1]["nextNode"]["options"][1]
+    salvaged = salvage_story(json.dumps(story))
+
+    assert hole_choices(salvaged) == ["Ask for the keeper"]
+
+
+def test_story_without_usable_opening_fails():
+    with pytest.raises(ValueError):
+        salvage_story(json.dumps({"title": "The Lighthouse", "rootNode": {"content": "You reach"}}))
+    with pytest.raises(ValueError):
+        salvage_story('{"title": "The Light')
+    with pytest.raises(ValueError):
+        salvage_story("Sorry, I can't write that story.")
+
+
+def test_parse_subtree_accepts_complete_subtree():
+    subtree = STORY["rootNode"]["options"][1]["nextNode"]
+    assert parse_subtree(json.dumps(subtree)) == subtree
+
+
+@pytest.mark.parametrize("subtree", [
+    json.dumps(STORY["rootNode"]["options"][1]["nextNode"])[:-20],  # Truncated
+    json.dumps(scene("The door is locked.", ("Knock", {"content": "Nobody answers."}), ("Leave", ending("You go home.")))),
+    json.dumps(scene("The door is locked.", ("Knock", ["Nobody answers."]), ("Leave", ending("You go home.")))),
+    json.dumps(scene("The door is locked.", ("Knock", ending("Nobody answers.")))),
+])
+def test_parse_subtree_rejects_incomplete_subtree(subtree):
+    with pytest.raises(ValueError):
+        parse_subtree(subtree)
@@ -0,0 +1,63 @@
+"""
+Standalone story generation worker.
+Pulls jobs from the story_jobs table so generation can be scaled separately
+from the API (set JOB_EXECUTION_MODE=worker on the API side).
+
+Usage:
+    uv run python worker.py --processes 4
+
+Each process runs MAX_CONCURRENT_GENERATIONS concurrent jobs.
+"""
+import signal
+import asyncio
+import logging
+import argparse
+import multiprocessing
+
+from core.config import settings
+from core import job_queue
+from core.llm_provider import llm_provider
+from db.database import create_tables
+import models.job, models.story  # Register tables on Base.metadata
+
+def run_process():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # Finish in-flight jobs on shutdown, just stop claiming new ones
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        try:
+            await job_queue.run_worker(
+                job_queue.make_worker_id("worker"),
+                concurrency=settings.MAX_CONCURRENT_GENERATIONS,
+                stop=stop,
+            )
+        finally:
+            await llm_provider.aclose()
+
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run story generation workers")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to start")
+    args = parser.parse_args()
+
+    create_tables()
+
+    if args.processes == 1:
+        run_process()
+    else:
+        processes = [
+            multiprocessing.Process(target=run_process, name=f"worker-{i}")
+            for i in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        # Forward termination so every child drains its in-flight jobs
+        signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+        for process in processes:
+            process.join()
@@ -1,23 +1,82 @@
-import {useState, useEffect} from 'react';
+import {useState, useEffect, useMemo} from 'react';
+import axios from 'axios'
+import {API_BASE_URL} from "../util.js";
+
+// Scenes of incrementally generated stories are written as they are reached
+const isUnwritten = (node) => !node || node.is_expanded === false
 
 function StoryGame({story, onNewStory}) {
+    const [nodes, setNodes] = useState({})
     const [currentNodeId, setCurrentNodeId] = useState(null);
     const [currentNode, setCurrentNode] = useState(null)
     const [options, setOptions] = useState([])
     const [isEnding, setIsEnding] = useState(false)
     const [isWinningEnding, setIsWinningEnding] = useState(false)
+    const [writing, setWriting] = useState(false)
+    const [error, setError] = useState(null)
 
+    // Resume where this session left off, or start at the root
     useEffect(() => {
-        if (story && story.root_node) {
-            const rootNodeId = story.root_node.id
-            setCurrentNodeId(rootNodeId)
+        if (!story || !story.root_node) {
+            return
+        }
+        let cancelled = false
+        setNodes(story.all_nodes || {})
+        setCurrentNodeId(story.root_node.id)
+        axios.get(`${API_BASE_URL}/stories/${story.id}/progress`)
+            .then((response) => !cancelled && setCurrentNodeId(response.data.node_id))
+            .catch(() => {})  // 404: nothing recorded yet
+
+        return () => {
+            cancelled = true
         }
     }, [story])
 
+    // Fire and forget: the server buffers choices and writes them in batches
+    const recordProgress = (nodeId, fromNodeId = null) => {
+        axios.post(`${API_BASE_URL}/stories/${story.id}/progress`, {node_id: nodeId, from_node_id: fromNodeId})
+            .catch(() => {})
+    }
+
+    // Fetching a node writes it if needed and starts writing its choices.
+    // Derived here so the effect below depends on these values, not on nodes
+    const currentUnwritten = isUnwritten(nodes[currentNodeId])
+    const needsFetch = useMemo(() => {
+        const node = nodes[currentNodeId]
+        return Boolean(currentNodeId) && (isUnwritten(node) || Boolean(node.options?.some((option) => isUnwritten(nodes[option.node_id]))))
+    }, [currentNodeId, nodes])
+
     useEffect(() => {
-        if (currentNodeId && story && story.all_nodes) {
-            const node = story.all_nodes[currentNodeId]
+        if (!needsFetch) {
+            return
+        }
 
+        let cancelled = false
+        setWriting(currentUnwritten)
+        setError(null)
+        axios.get(`${API_BASE_URL}/stories/${story.id}/nodes/${currentNodeId}`)
+            .then((response) => {
+                if (!cancelled) {
+                    const {node: fetched, prefetched} = response.data
+                    setNodes((known) => ({...known, ...prefetched, [fetched.id]: fetched}))
+                    setWriting(false)  // Same render as the nodes, which may end this effect
+                }
+            })
+            .catch(() => {
+                if (!cancelled) {
+                    currentUnwritten && setError("Failed to continue the story, please try again")
+                    setWriting(false)
+                }
+            })
+
+        return () => {
+            cancelled = true
+        }
+    }, [currentNodeId, story, needsFetch, currentUnwritten])
+
+    useEffect(() => {
+        const node = nodes[currentNodeId]
+        if (node && !isUnwritten(node)) {
             setCurrentNode(node)
             setIsEnding(node.is_ending)
             setIsWinningEnding(node.is_winning_ending)
@@ -28,15 +87,17 @@ function StoryGame({story, onNewStory}) {
                 setOptions([])
             }
         }
-    }, [currentNodeId, story])
+    }, [currentNodeId, nodes])
 
 
     const chooseOption = (optionId) => {
+        recordProgress(optionId, currentNodeId)
         setCurrentNodeId(optionId)
     }
 
     const restartStory = () => {
         if (story && story.root_node) {
+            recordProgress(story.root_node.id)
             setCurrentNodeId(story.root_node.id)
         }
     }
@@ -47,7 +108,14 @@ function StoryGame({story, onNewStory}) {
         </header>
 
         <div className="story-content">
-            {currentNode && <div className="story-node">
+            {writing && <p className="story-writing">Writing what happens next...</p>}
+
+            {error && <div className="error-message">
+                <p>{error}</p>
+                <button onClick={() => setCurrentNodeId(currentNode?.id ?? story.root_node.id)}>Go Back</button>
+            </div>}
+
+            {currentNode && !writing && <div className="story-node">
                 <p>{currentNode.content}</p>
 
                 {isEnding ?
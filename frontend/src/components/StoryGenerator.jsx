@@ -13,21 +13,76 @@ function StoryGenerator() {
     const [error, setError] = useState(null)
     const [loading, setLoading] = useState(false)
 
+    // Status is pushed by the server (SSE); clients or proxies without
+    // EventSource support fall back to long-polling /jobs/{id}/wait
     useEffect(() => {
-        let pollInterval;
+        if (!jobId) {
+            return
+        }
+
+        let stopped = false
+        let eventSource = null
+
+        const handleStatus = (job) => {
+            setJobStatus(job.status)
+
+            if (job.status === "completed" && job.story_id) {
+                stopped = true
+                fetchStory(job.story_id)
+            } else if (job.status === "failed") {
+                stopped = true
+                setError(job.error || "Failed to generate story")
+                setLoading(false)
+            }
+        }
+
+        const longPoll = async () => {
+            let known = {}
+            while (!stopped) {
+                try {
+                    const response = await axios.get(`${API_BASE_URL}/jobs/${jobId}/wait`, {params: known})
+                    const {status, nodes_generated} = response.data
+                    known = {status, nodes_generated}
+                    handleStatus(response.data)
+                } catch (e) {
+                    if (e.response?.status !== 404) {
+                        setError(`Failed to check story status: ${e.message}`)
+                        setLoading(false)
+                    }
+                    return
+                }
+            }
+        }
 
-        if (jobId && jobStatus === "processing") {
-            pollInterval = setInterval(() => {
-                pollJobStatus(jobId)
-            }, 5000)
+        if (window.EventSource) {
+            let received = false
+            eventSource = new EventSource(`${API_BASE_URL}/jobs/${jobId}/events`)
+            eventSource.onmessage = (event) => {
+                received = true
+                handleStatus(JSON.parse(event.data))
+                if (stopped) {
+                    eventSource.close()
+                }
+            }
+            eventSource.onerror = () => {
+                // Reconnects by itself once the stream worked; if it never
+                // did (blocked by a proxy), switch to long-polling
+                if (!received || eventSource.readyState === EventSource.CLOSED) {
+                    eventSource.close()
+                    longPoll()
+                }
+            }
+        } else {
+            longPoll()
         }
 
         return () => {
-            if (pollInterval) {
-                clearInterval(pollInterval)
+            stopped = true
+            if (eventSource) {
+                eventSource.close()
             }
         }
-    }, [jobId, jobStatus])
+    }, [jobId])
 
     const generateStory = async (theme) => {
         setLoading(true)
@@ -39,30 +94,14 @@ function StoryGenerator() {
             const {job_id, status} = response.data
             setJobId(job_id)
             setJobStatus(status)
-
-            pollJobStatus(job_id)
         } catch (e) {
             setLoading(false)
-            setError(`Failed to generate story: ${e.message}`)
-        }
-    }
-
-    const pollJobStatus = async (id) => {
-        try {
-            const response = await axios.get(`${API_BASE_URL}/jobs/${id}`)
-            const {status, story_id, error: jobError} = response.data
-            setJobStatus(status)
-
-            if (status === "completed" && story_id) {
-                fetchStory(story_id)
-            } else if (status === "failed" || jobError) {
-                setError(jobError || "Failed to generate story")
-                setLoading(false)
-            }
-        } catch (e) {
-            if (e.response?.status !== 404) {
-                setError(`Failed to check story status: ${e.message}`)
-                setLoading(false)
+            if (e.response?.status === 429) {
+                // Rate limited or the service is busy (see core/admission.py)
+                const retryAfter = e.response.headers["retry-after"]
+                setError(`${e.response.data.detail}${retryAfter ? ` (retry in ${retryAfter}s)` : ""}`)
+            } else {
+                setError(`Failed to generate story: ${e.message}`)
             }
         }
     }